@@ -6,8 +6,9 @@ import cv2
 import torch
 from collections import defaultdict
 from ultralytics import YOLO
-from deep_sort_realtime.deepsort_tracker import DeepSort
+import capture_ops
 import detection_ops 
+import trackers
 
 # Configuration
 VIDEO_SOURCE = "test_video.mp4" 
@@ -18,7 +19,8 @@ SETTINGS = {
     'trespassing_zone': (200, 300, 300, 350), # x1, y1, x2, y2
     'trespassing_enabled': True,
     'loitering_enabled': True,
-    'crowd_enabled': True
+    'crowd_enabled': True,
+    'tracker': 'deepsort' # or 'iou' for the motion-only tracker
 }
 
 def main():
@@ -29,24 +31,14 @@ def main():
     print("Initializing Models...")
     yolo_model = YOLO("yolov8s.pt") 
     
-    deepsort_tracker = DeepSort(
-        max_age=30,
-        n_init=1, 
-        nms_max_overlap=1.0, 
-        embedder_gpu=use_cuda
-    )
+    tracker = trackers.create_tracker(SETTINGS['tracker'], use_cuda, SETTINGS['confidence_threshold'])
     print("Models Initialized.")
 
-    cap = cv2.VideoCapture(VIDEO_SOURCE)
-    if not cap.isOpened():
-        print(f"Error: Could not open source '{VIDEO_SOURCE}'.")
-        return
+    # Grabs on its own thread; reconnects live sources, plays files once
+    cap = capture_ops.ThreadedCapture(lambda: capture_ops.create_backend(VIDEO_SOURCE), loop=False).start()
 
     track_history = defaultdict(list)
     loitering_saved = defaultdict(lambda: False)
-    
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    if fps == 0: fps = 30
     frame_count = 0
 
     window_name = "Smart CCTV"
@@ -55,43 +47,34 @@ def main():
     print(f"Processing... Press 'q' to exit.")
 
     while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("End of stream.")
-            break
+        frame, current_time = cap.read(timeout=1.0)
+        if frame is None:
+            if cap.state == "ended":
+                print("End of stream.")
+                break
+            if cap.state == "failed":
+                print(f"Cannot open video source: {VIDEO_SOURCE}")
+                break
+            continue
 
         frame_count += 1
-        current_time = frame_count / fps
         process_frame = frame 
 
-        detections_list = []
-        
         # YOLO Detection
         results = yolo_model(
             process_frame, 
             stream=True, 
-            conf=SETTINGS['confidence_threshold'], 
+            conf=trackers.detector_confidence(SETTINGS['tracker'], SETTINGS['confidence_threshold']), 
             device=device,
             imgsz=640, 
             verbose=False
         )
+        detections_list = detection_ops.extract_person_detections(results)
         
-        for result in results:
-            boxes = result.boxes.cpu().numpy()
-            for box in boxes:
-                x1, y1, x2, y2 = box.xyxy[0]
-                conf = box.conf[0]
-                cls_id = int(box.cls[0])
-                
-                if cls_id == 0: # Person
-                    w = x2 - x1
-                    h = y2 - y1
-                    detections_list.append([[x1, y1, w, h], conf, 0])
-        
-        # Deepsort Tracker Update
-        outputs = deepsort_tracker.update_tracks(detections_list, frame=process_frame)
+        # Tracker Update
+        outputs = tracker.update_tracks(detections_list, frame=process_frame)
 
-        final_frame, alerts = detection_ops.process_frame_annotations(
+        final_frame, alerts, _ = detection_ops.process_frame_annotations(
             process_frame, 
             outputs, 
             current_time, 
@@ -113,7 +96,7 @@ def main():
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
-    cap.release()
+    cap.stop()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":
@@ -8,7 +8,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class AlertManager:
-    def __init__(self):
+    def __init__(self, label=None):
         self.bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
         self.chat_id = os.getenv("TELEGRAM_CHAT_ID")
         self.last_alert_time = {
@@ -18,7 +18,13 @@ class AlertManager:
         }
         self.cooldown = 15  # Seconds between alerts of the same type
         self.alert_count = 0 
-        self.recent_alerts = [] # List to store {type, message, time}
+        self.recent_alerts = [] # List to store {type, message, time, timestamp}
+        self.listeners = [] # Called with each new alert record, may add fields to it (e.g. clip)
+        self.label = label # Camera name prefixed to messages when several cameras report here
+
+    def add_listener(self, callback):
+        """callback(alert_record) runs in the caller's thread, so it must be quick."""
+        self.listeners.append(callback)
 
     def send_telegram_message(self, message):
         """Sends a message to the configured Telegram chat."""
@@ -70,6 +76,8 @@ class AlertManager:
 
     def trigger_alert(self, message, alert_type):
         """Updates cooldown and runs sender in a thread."""
+        if self.label:
+            message = f"[{self.label}] {message}"
         print(f"[DEBUG] Triggering alert: {alert_type} - {message}") # Debug print
         self.last_alert_time[alert_type] = time.time()
         self.alert_count += 1
@@ -78,8 +86,17 @@ class AlertManager:
         alert_record = {
             "type": alert_type,
             "message": message,
-            "time": time.strftime("%H:%M:%S")
+            "time": time.strftime("%H:%M:%S"),
+            # For ordering alerts across cameras, "time" is display only
+            "timestamp": time.time()
         }
+        if self.label:
+            alert_record["camera"] = self.label
+        for callback in self.listeners:
+            try:
+                callback(alert_record)
+            except Exception as e:
+                print(f"Alert listener failed: {e}")
         self.recent_alerts.insert(0, alert_record) # Add to beginning
         if len(self.recent_alerts) > 50:
             self.recent_alerts.pop() # Keep max 50
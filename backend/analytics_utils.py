@@ -0,0 +1,237 @@
+import os
+import time
+import threading
+import numpy as np
+
+ANALYTICS_DIR = "analytics"
+# Foot points are binned into a grid of this size, whatever the frame size
+HEATMAP_SHAPE = (48, 64)
+# Dwell histogram bin edges in seconds; the last bin is open ended
+DWELL_EDGES = np.array([0, 5, 10, 30, 60, 120, 300, 600, 1800], dtype=np.float64)
+# One slot per minute, the last 24 hours
+OCCUPANCY_MINUTES = 24 * 60
+SNAPSHOT_INTERVAL = 60.0
+ZONES = ("scene", "restricted")
+
+def track_boxes(tracks):
+    """(track ids, (N, 4) ltrb array) of the tracks counted as present (same rule as the annotations)."""
+    ids, boxes = [], []
+    for track in tracks:
+        if not track.is_confirmed() and track.time_since_update > 1:
+            continue
+        ids.append(track.track_id)
+        boxes.append(track.to_ltrb())
+    return ids, np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+class CameraAnalytics:
+    """
+    Fixed-size accumulators for one camera, updated once per frame:
+    - heatmap: foot points (bottom center of each box) counted on a HEATMAP_SHAPE grid
+    - dwell: per zone, a histogram of how long tracks stayed (counted when they leave)
+    - occupancy: per-minute sum / max / samples in a ring of OCCUPANCY_MINUTES slots
+
+    Each update is a handful of vectorized NumPy operations over the tracks in the frame, and
+    nothing grows with time; the only per-track state is the zone entry time of live tracks.
+    Snapshots are written to `path` with np.savez every SNAPSHOT_INTERVAL seconds and loaded
+    back on start.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.heatmap = np.zeros(HEATMAP_SHAPE, dtype=np.float64)
+        self.dwell = np.zeros((len(ZONES), len(DWELL_EDGES)), dtype=np.int64)
+        self.occupancy_sum = np.zeros(OCCUPANCY_MINUTES, dtype=np.float64)
+        self.occupancy_max = np.zeros(OCCUPANCY_MINUTES, dtype=np.int32)
+        self.occupancy_samples = np.zeros(OCCUPANCY_MINUTES, dtype=np.int32)
+        # Absolute minute (epoch // 60) each slot holds, -1 if empty
+        self.occupancy_minute = np.full(OCCUPANCY_MINUTES, -1, dtype=np.int64)
+        self.frames = 0
+
+        # track id -> per-zone entry time (NaN while outside)
+        self.entries = {}
+        self.last_time = None
+        self.last_snapshot = time.monotonic()
+        self.saving = False
+        if path:
+            self.load()
+
+    # --- Update ---
+    def update(self, track_ids, boxes, frame_shape, zone, current_time, wall_time=None):
+        """
+        track_ids / boxes: tracks present in this frame (see track_boxes), frame_shape: (height, width),
+        zone: restricted zone (x1, y1, x2, y2) or None, current_time: source time in seconds.
+        """
+        wall_time = time.time() if wall_time is None else wall_time
+        height, width = frame_shape[:2]
+        with self.lock:
+            if self.last_time is not None and current_time < self.last_time:
+                # Source restarted (loop, new file): stays in progress do not belong to it
+                self.entries.clear()
+            self.last_time = current_time
+            self.frames += 1
+
+            feet_x = (boxes[:, 0] + boxes[:, 2]) / 2
+            feet_y = boxes[:, 3]
+
+            # Heatmap
+            rows = np.clip((feet_y * HEATMAP_SHAPE[0] / height).astype(np.intp), 0, HEATMAP_SHAPE[0] - 1)
+            cols = np.clip((feet_x * HEATMAP_SHAPE[1] / width).astype(np.intp), 0, HEATMAP_SHAPE[1] - 1)
+            np.add.at(self.heatmap, (rows, cols), 1)
+
+            # Zone membership, (N, len(ZONES))
+            inside = np.ones((len(track_ids), len(ZONES)), dtype=bool)
+            if zone is not None:
+                x_min, x_max = min(zone[0], zone[2]), max(zone[0], zone[2])
+                y_min, y_max = min(zone[1], zone[3]), max(zone[1], zone[3])
+                inside[:, 1] = (feet_x >= x_min) & (feet_x <= x_max) & (feet_y >= y_min) & (feet_y <= y_max)
+            else:
+                inside[:, 1] = False
+            self._update_dwell(track_ids, inside, current_time)
+
+            # Occupancy
+            minute = int(wall_time // 60)
+            slot = minute % OCCUPANCY_MINUTES
+            if self.occupancy_minute[slot] != minute:
+                self.occupancy_minute[slot] = minute
+                self.occupancy_sum[slot] = 0
+                self.occupancy_max[slot] = 0
+                self.occupancy_samples[slot] = 0
+            count = len(track_ids)
+            self.occupancy_sum[slot] += count
+            self.occupancy_max[slot] = max(self.occupancy_max[slot], count)
+            self.occupancy_samples[slot] += 1
+
+        if self.path and time.monotonic() - self.last_snapshot >= SNAPSHOT_INTERVAL:
+            self.snapshot()
+
+    def _update_dwell(self, track_ids, inside, current_time):
+        previous = self.entries
+        self.entries = {}
+        starts = np.full((len(track_ids), len(ZONES)), np.nan)
+        for i, track_id in enumerate(track_ids):
+            entry = previous.pop(track_id, None)
+            if entry is not None:
+                starts[i] = entry
+
+        # Stays that ended: tracks that left a zone, and tracks that are gone
+        left = ~np.isnan(starts) & ~inside
+        durations = [current_time - starts[left]]
+        zone_index = [np.nonzero(left)[1]]
+        if previous:
+            gone = np.array(list(previous.values()))
+            ended = ~np.isnan(gone)
+            durations.append(current_time - gone[ended])
+            zone_index.append(np.nonzero(ended)[1])
+        durations = np.concatenate(durations)
+        if len(durations):
+            bins = np.searchsorted(DWELL_EDGES, durations, side='right') - 1
+            np.add.at(self.dwell, (np.concatenate(zone_index), np.clip(bins, 0, len(DWELL_EDGES) - 1)), 1)
+
+        starts[~inside] = np.nan
+        entered = inside & np.isnan(starts)
+        starts[entered] = current_time
+        for i, track_id in enumerate(track_ids):
+            self.entries[track_id] = starts[i]
+
+    def reset_tracks(self):
+        """Forgets stays in progress, for a new source whose track ids start over."""
+        with self.lock:
+            self.entries.clear()
+            self.last_time = None
+
+    # --- Queries ---
+    def heatmap_status(self):
+        with self.lock:
+            grid = self.heatmap.copy()
+            frames = self.frames
+        return {
+            "rows": HEATMAP_SHAPE[0],
+            "cols": HEATMAP_SHAPE[1],
+            "frames": frames,
+            "max": float(grid.max()),
+            # Person-frames per cell, normalized to 0..1
+            "grid": np.round(grid / grid.max(), 3).tolist() if grid.max() > 0 else grid.tolist()
+        }
+
+    def dwell_status(self):
+        with self.lock:
+            dwell = self.dwell.copy()
+            open_stays = len(self.entries)
+        labels = [f"{int(lo)}-{int(hi)}s" for lo, hi in zip(DWELL_EDGES[:-1], DWELL_EDGES[1:])]
+        labels.append(f"{int(DWELL_EDGES[-1])}s+")
+        return {
+            "edges": DWELL_EDGES.tolist(),
+            "zones": {zone: [{"time": label, "count": int(n)} for label, n in zip(labels, dwell[i])]
+                      for i, zone in enumerate(ZONES)},
+            "open_stays": open_stays
+        }
+
+    def occupancy_series(self, minutes=60, now=None):
+        """Average and peak occupancy for each of the last `minutes` minutes, oldest first."""
+        minutes = max(1, min(minutes, OCCUPANCY_MINUTES))
+        last = int((time.time() if now is None else now) // 60)
+        wanted = np.arange(last - minutes + 1, last + 1)
+        with self.lock:
+            slots = wanted % OCCUPANCY_MINUTES
+            valid = (self.occupancy_minute[slots] == wanted) & (self.occupancy_samples[slots] > 0)
+            average = np.where(valid, self.occupancy_sum[slots] / np.maximum(self.occupancy_samples[slots], 1), 0)
+            peak = np.where(valid, self.occupancy_max[slots], 0)
+        return [
+            {"time": time.strftime("%H:%M", time.localtime(m * 60)), "count": round(float(a), 2), "max": int(p)}
+            for m, a, p in zip(wanted, average, peak)
+        ]
+
+    # --- Snapshots ---
+    def snapshot(self):
+        """Writes the accumulators to disk on a background thread (skipped if one is still writing)."""
+        with self.lock:
+            if self.saving:
+                return
+            self.saving = True
+            self.last_snapshot = time.monotonic()
+            arrays = {
+                "heatmap": self.heatmap.copy(),
+                "dwell": self.dwell.copy(),
+                "occupancy_sum": self.occupancy_sum.copy(),
+                "occupancy_max": self.occupancy_max.copy(),
+                "occupancy_samples": self.occupancy_samples.copy(),
+                "occupancy_minute": self.occupancy_minute.copy(),
+                "frames": np.array(self.frames)
+            }
+        threading.Thread(target=self._write, args=(arrays,), daemon=True).start()
+
+    def _write(self, arrays):
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp.npz"
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[ERROR] Failed to save analytics snapshot {self.path}: {e}")
+        finally:
+            with self.lock:
+                self.saving = False
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                # Snapshots from a different layout (e.g. changed bins) are ignored
+                if data["heatmap"].shape != self.heatmap.shape or data["dwell"].shape != self.dwell.shape \
+                        or data["occupancy_sum"].shape != self.occupancy_sum.shape:
+                    print(f"[DEBUG] Ignoring analytics snapshot {self.path} with a different layout")
+                    return
+                self.heatmap[:] = data["heatmap"]
+                self.dwell[:] = data["dwell"]
+                self.occupancy_sum[:] = data["occupancy_sum"]
+                self.occupancy_max[:] = data["occupancy_max"]
+                self.occupancy_samples[:] = data["occupancy_samples"]
+                self.occupancy_minute[:] = data["occupancy_minute"]
+                self.frames = int(data["frames"])
+            print(f"[DEBUG] Loaded analytics snapshot {self.path} ({self.frames} frames)")
+        except Exception as e:
+            print(f"[ERROR] Failed to load analytics snapshot {self.path}: {e}")
+
+def snapshot_path(camera_id):
+    return os.path.join(ANALYTICS_DIR, f"{camera_id}.npz")
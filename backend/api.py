@@ -1,9 +1,20 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from typing import List, Optional
 import io
+import asyncio
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import torch
 from facenet_pytorch import MTCNN, InceptionResnetV1
+from fastapi.concurrency import run_in_threadpool
 from backend import database
+from backend import import_utils
+from backend import face_store
+from backend import thumb_utils
+import detection_ops
+import shutil
 import os
 
 router = APIRouter()
@@ -15,51 +26,183 @@ device = 'cuda' if torch.cuda.is_available() else 'cpu'
 mtcnn = MTCNN(keep_all=False, device=device)
 resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
 
+# --- Inference Queue ---
+# Model work never runs on the event loop. A single worker owns the models above, and
+# requests beyond MAX_PENDING get a 429 instead of piling up behind it. Bulk imports go
+# through the same worker one batch at a time (see InferenceQueue.call).
+INFERENCE_WORKERS = 1
+MAX_PENDING = 4
+
+class InferenceQueue:
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="face-inference")
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Condition()
+
+    def status(self):
+        return {"pending": self.pending, "capacity": self.max_pending}
+
+    async def run(self, fn, *args):
+        """Runs fn in the inference executor. Returns (result, queue_position)."""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=429,
+                    detail={"message": "Face inference queue is full, retry shortly", "queue_position": self.pending + 1},
+                    headers={"Retry-After": "2"}
+                )
+            self.pending += 1
+            position = self.pending
+
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self._release()
+        return result, position
+
+    def call(self, fn, *args):
+        """Blocking variant for background jobs (bulk import): waits for a free slot instead of failing."""
+        with self.lock:
+            while self.pending >= self.max_pending:
+                self.lock.wait()
+            self.pending += 1
+        try:
+            return self.executor.submit(fn, *args).result()
+        finally:
+            self._release()
+
+    def _release(self):
+        with self.lock:
+            self.pending -= 1
+            self.lock.notify()
+
+inference_queue = InferenceQueue(INFERENCE_WORKERS, MAX_PENDING)
+
+def embed_enrollment_images(images):
+    """
+    images: list of (filename, bytes)
+    Detects one face per image and embeds all faces in a single batch.
+    Returns (averaged embedding or None, first usable PIL image, rejected filenames).
+    """
+    faces = []
+    first_image = None
+    rejected = []
+    for filename, data in images:
+        try:
+            image = Image.open(io.BytesIO(data)).convert('RGB')
+        except Exception:
+            rejected.append(filename)
+            continue
+
+        face = detection_ops.detect_largest_face(mtcnn, image)
+        if face is None:
+            rejected.append(filename)
+            continue
+        faces.append(detection_ops.preprocess_face(face))
+        if first_image is None:
+            first_image = image
+
+    if not faces:
+        return None, None, rejected
+
+    embeddings = detection_ops.embed_faces(resnet, faces, device)
+    return detection_ops.average_embedding(embeddings).tolist(), first_image, rejected
+
+def enroll_face(name, images):
+    embedding, image, rejected = embed_enrollment_images(images)
+    if embedding is None:
+        raise HTTPException(status_code=400, detail="No face detected in the image")
+
+    # Save image for display
+    filename = f"{uuid.uuid4().hex}.jpg"
+    save_path = os.path.join("trusted_faces", filename)
+    image.save(save_path)
+    thumb_utils.submit(save_path)
+
+    face_id = database.add_trusted_face(name, embedding, save_path)
+    return {"id": face_id, "image_path": save_path, "images_used": len(images) - len(rejected), "rejected": rejected}
+
 @router.get("/")
 def read_root():
     return {"message": "SmartCCTV API is running"}
 
 @router.post("/trusted")
-async def create_trusted_face(name: str = Form(...), file: UploadFile = File(...)):
+async def create_trusted_face(name: str = Form(...), file: Optional[UploadFile] = File(None),
+                              files: Optional[List[UploadFile]] = File(None)):
+    """Enrolls a person from one image (`file`) or several (`files`), averaged into one template."""
+    uploads = ([file] if file else []) + (files or [])
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No image uploaded")
+
+    images = [(upload.filename, await upload.read()) for upload in uploads]
+
     try:
-        image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data)).convert('RGB')
-        
-        # Save image for display
-        import uuid
-        filename = f"{uuid.uuid4().hex}.jpg"
-        save_path = os.path.join("trusted_faces", filename)
-        image.save(save_path)
-        
-        # Detect face
-        # MTCNN returns cropped face tensor if return_prob=False (default)
-        # But we want the cropped face directly to feed into resnet
-        # mtcnn(img) returns a tensor of shape (3, h, w) if a face is found, else None
-        
-        face_tensor = mtcnn(image)
-        
-        if face_tensor is None:
-            raise HTTPException(status_code=400, detail="No face detected in the image")
-        
-        # Calculate embedding
-        if face_tensor.dim() == 3:
-            face_tensor = face_tensor.unsqueeze(0) # Add batch dimension -> (1, 3, h, w)
-            
-        with torch.no_grad():
-            embedding = resnet(face_tensor.to(device)).detach().cpu().numpy()[0].tolist()
-            
-        # Save to DB
-        face_id = database.add_trusted_face(name, embedding, save_path)
-        
-        return {"id": face_id, "name": name, "message": "Trusted face added successfully", "image_path": save_path}
-        
+        result, position = await inference_queue.run(enroll_face, name, images)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing image: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    return {"name": name, "message": "Trusted face added successfully", "queue_position": position, **result}
+
+# --- Bulk Import ---
+import_manager = import_utils.ImportManager()
+
+@router.post("/trusted/import")
+async def import_trusted_faces(path: Optional[str] = Form(None), file: Optional[UploadFile] = File(None)):
+    """Starts a bulk import from a server-side directory/zip (`path`) or an uploaded zip (`file`)."""
+    remove_source = bool(file)
+    if file:
+        source = os.path.abspath(os.path.join("uploads", f"import_{uuid.uuid4().hex}.zip"))
+
+        def save():
+            with open(source, "wb") as f:
+                shutil.copyfileobj(file.file, f, 1024 * 1024)
+
+        await run_in_threadpool(save)
+    elif path:
+        source = os.path.abspath(path)
+        if not os.path.exists(source):
+            raise HTTPException(status_code=400, detail=f"Path not found: {path}")
+    else:
+        raise HTTPException(status_code=400, detail="Provide a directory/zip path or upload a zip file")
+
+    job = import_manager.start(source, inference_queue, mtcnn, resnet, device, remove_source=remove_source)
+    if job is None:
+        if remove_source:
+            os.remove(source)
+        raise HTTPException(status_code=409, detail="An import is already running")
+    return job.to_dict()
+
+@router.get("/trusted/import/{job_id}")
+def get_import_job(job_id: str):
+    job = import_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown import job")
+    return job.to_dict()
+
+@router.get("/trusted/queue")
+def trusted_queue_status():
+    return inference_queue.status()
+
+# Listings are keyset paginated and return thumbnail URLs, so a page costs the same however
+# many faces are stored. Pass the returned next_cursor as `before` for the next page.
+PAGE_SIZE = 30
+MAX_PAGE_SIZE = 200
+
+def page_limit(limit):
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
 @router.get("/trusted")
-def list_trusted_faces():
-    return database.get_trusted_faces()
+def list_trusted_faces(limit: int = PAGE_SIZE, before: Optional[int] = None):
+    faces, next_cursor = database.get_trusted_faces_page(page_limit(limit), before)
+    for face in faces:
+        face.update(thumb_utils.image_urls("/trusted_faces", import_utils.TRUSTED_FACES_DIR,
+                                           os.path.basename(face['image_path'] or "")))
+    return {"items": faces, "next_cursor": next_cursor}
 
 @router.delete("/trusted/{face_id}")
 def delete_trusted_face_endpoint(face_id: int):
@@ -67,12 +210,19 @@ def delete_trusted_face_endpoint(face_id: int):
     return {"message": "Deleted successfully"}
 
 @router.get("/untrusted")
-def list_untrusted_faces():
-    faces = database.get_untrusted_faces()
-    # Add full URL for image path if needed, or let frontend handle relative path
-    # Assuming frontend is on same host or can access /captured_faces
-    # Fix: remove directory prefix since frontend appends it
+def list_untrusted_faces(limit: int = PAGE_SIZE, before: Optional[str] = None):
+    cursor = None
+    if before:
+        # Cursor is "<last_seen>|<id>" of the previous page's last item
+        last_seen, _, face_id = before.rpartition("|")
+        if not last_seen or not face_id.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        cursor = (last_seen, int(face_id))
+
+    faces, next_cursor = database.get_untrusted_faces_page(page_limit(limit), cursor)
+    # Remove directory prefix, images are served from /captured_faces
     for face in faces:
-         face['image_path'] = os.path.basename(face['image_path'])
-    return faces
+        face['image_path'] = os.path.basename(face['image_path'])
+        face.update(thumb_utils.image_urls("/captured_faces", face_store.CAPTURED_FACES_DIR, face['image_path']))
+    return {"items": faces, "next_cursor": f"{next_cursor[0]}|{next_cursor[1]}" if next_cursor else None}
 
@@ -0,0 +1,210 @@
+import os
+import time
+import queue
+import struct
+import threading
+from collections import deque
+
+CLIPS_DIR = "clips"
+
+# --- MJPEG AVI Writer ---
+# AVI is a RIFF container: the JPEG frames are stored as-is in '00dc' chunks, so writing a
+# clip is only file I/O, no decoding or re-encoding.
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+
+def _chunk(fourcc, data):
+    pad = b"\x00" if len(data) % 2 else b""
+    return fourcc + struct.pack("<I", len(data)) + data + pad
+
+def _list(list_type, data):
+    return b"LIST" + struct.pack("<I", len(data) + 4) + list_type + data
+
+def write_mjpeg_avi(path, frames, fps, width, height):
+    """frames: list of JPEG byte strings. Writes to a temp file and renames, so readers never see a partial clip."""
+    fps = max(fps, 1.0)
+    max_frame = max(len(f) for f in frames)
+
+    avih = struct.pack(
+        "<IIIIIIIIII16x",
+        int(1_000_000 / fps), int(max_frame * fps), 0, AVIF_HASINDEX,
+        len(frames), 0, 1, max_frame, width, height
+    )
+    strh = struct.pack(
+        "<4s4sIHHIIIIIIIIhhhh",
+        b"vids", b"MJPG", 0, 0, 0, 0,
+        1000, int(round(fps * 1000)), 0, len(frames), max_frame, 0xFFFFFFFF, 0,
+        0, 0, width, height
+    )
+    strf = struct.pack("<IiiHH4sIiiII", 40, width, height, 1, 24, b"MJPG", width * height * 3, 0, 0, 0, 0)
+    hdrl = _list(b"hdrl", _chunk(b"avih", avih) + _list(b"strl", _chunk(b"strh", strh) + _chunk(b"strf", strf)))
+
+    # Index offsets are relative to the 'movi' fourcc
+    index = []
+    offset = 4
+    for data in frames:
+        index.append(struct.pack("<4sIII", b"00dc", AVIIF_KEYFRAME, offset, len(data)))
+        offset += 8 + len(data) + len(data) % 2
+    movi_size = offset
+    idx1 = b"".join(index)
+
+    riff_size = 4 + len(hdrl) + 8 + movi_size + 8 + len(idx1)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", riff_size) + b"AVI ")
+        f.write(hdrl)
+        f.write(b"LIST" + struct.pack("<I", movi_size) + b"movi")
+        for data in frames:
+            f.write(_chunk(b"00dc", data))
+        f.write(_chunk(b"idx1", idx1))
+    os.replace(tmp_path, path)
+
+# --- Ring Buffer ---
+class FrameRingBuffer:
+    """Recent (timestamp, jpeg) pairs, bounded by total bytes and by age."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.frames = deque()
+        self.size = 0
+
+    def append(self, timestamp, data, max_age):
+        self.frames.append((timestamp, data))
+        self.size += len(data)
+        while self.frames and (self.size > self.max_bytes or timestamp - self.frames[0][0] > max_age):
+            _, old = self.frames.popleft()
+            self.size -= len(old)
+
+    def since(self, timestamp):
+        return [item for item in self.frames if item[0] >= timestamp]
+
+    def clear(self):
+        self.frames.clear()
+        self.size = 0
+
+class PendingClip:
+    def __init__(self, name, alert_types, frames, end_time):
+        self.name = name
+        self.alert_types = alert_types
+        self.frames = frames
+        self.size = sum(len(data) for _, data in frames)
+        self.end_time = end_time
+
+# --- Clip Recorder ---
+class ClipRecorder:
+    """
+    Keeps the last few seconds of encoded frames and turns alerts into pre/post-roll clips.
+
+    add_frame() and start_clip() are called from the processing loop and only append to lists;
+    finished clips are written by a background thread. Memory stays bounded: the ring buffer
+    holds at most max_bytes, each clip at most max_bytes, and when the writer falls behind new
+    clips are dropped instead of queued.
+    """
+    def __init__(self, settings, max_bytes=64 * 1024 * 1024, directory=CLIPS_DIR, max_pending=2, prefix=""):
+        self.settings = settings
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.ring = FrameRingBuffer(max_bytes)
+        self.pending = None
+        self.frame_size = None
+        self.last_time = None
+        self.lock = threading.Lock()
+
+        self.clips_written = 0
+        self.clips_dropped = 0
+        self.closed = False
+        self.write_queue = queue.Queue(maxsize=max_pending)
+        threading.Thread(target=self._writer, daemon=True).start()
+
+    def enabled(self):
+        return not self.closed and self.settings.get('clips_enabled', True)
+
+    def close(self):
+        """Writes out the clip being recorded (cut short) and stops the writer thread."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._finish_pending()
+            self.ring.clear()
+        self.write_queue.put(None)
+
+    def add_frame(self, data, timestamp, frame_shape):
+        """data: JPEG bytes of the annotated frame, timestamp: source time in seconds."""
+        if not self.enabled():
+            return
+        height, width = frame_shape[:2]
+        with self.lock:
+            if self.frame_size != (width, height) or (self.last_time is not None and timestamp < self.last_time):
+                # New source: older frames do not belong to the same clip
+                self._finish_pending()
+                self.ring.clear()
+                self.frame_size = (width, height)
+            self.last_time = timestamp
+            self.ring.append(timestamp, data, self.settings.get('clip_pre_seconds', 5))
+
+            clip = self.pending
+            if clip is not None:
+                clip.frames.append((timestamp, data))
+                clip.size += len(data)
+                if timestamp >= clip.end_time or clip.size > self.max_bytes:
+                    self._finish_pending()
+
+    def start_clip(self, alert_type):
+        """
+        Starts a clip around the current frame and returns its file name (the file appears once the
+        post-roll is recorded), or None if there is nothing buffered. Alerts during another clip's
+        post-roll extend that clip.
+        """
+        if not self.enabled():
+            return None
+        with self.lock:
+            if self.last_time is None:
+                return None
+            end_time = self.last_time + self.settings.get('clip_post_seconds', 5)
+            if self.pending is not None:
+                self.pending.end_time = max(self.pending.end_time, end_time)
+                if alert_type not in self.pending.alert_types:
+                    self.pending.alert_types.append(alert_type)
+                return self.pending.name
+
+            name = f"{self.prefix}{alert_type}_{time.strftime('%Y%m%d_%H%M%S')}_{int(self.last_time * 1000) % 1000:03d}.avi"
+            pre_start = self.last_time - self.settings.get('clip_pre_seconds', 5)
+            self.pending = PendingClip(name, [alert_type], self.ring.since(pre_start), end_time)
+            return name
+
+    def _finish_pending(self):
+        clip, self.pending = self.pending, None
+        if clip is None or not clip.frames:
+            return
+        try:
+            self.write_queue.put_nowait((clip, self.frame_size))
+        except queue.Full:
+            self.clips_dropped += 1
+            print(f"[ERROR] Clip writer is behind, dropping clip {clip.name}")
+
+    def _writer(self):
+        while True:
+            item = self.write_queue.get()
+            if item is None:
+                return
+            clip, (width, height) = item
+            frames = [data for _, data in clip.frames]
+            duration = clip.frames[-1][0] - clip.frames[0][0]
+            fps = (len(frames) - 1) / duration if duration > 0 else 30.0
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                write_mjpeg_avi(os.path.join(self.directory, clip.name), frames, fps, width, height)
+                self.clips_written += 1
+                print(f"[DEBUG] Alert clip saved: {clip.name} ({len(frames)} frames, {duration:.1f}s)")
+            except Exception as e:
+                print(f"[ERROR] Failed to write clip {clip.name}: {e}")
+
+    def status(self):
+        return {
+            "buffered_frames": len(self.ring.frames),
+            "buffered_bytes": self.ring.size,
+            "recording": self.pending.name if self.pending else None,
+            "clips_written": self.clips_written,
+            "clips_dropped": self.clips_dropped
+        }
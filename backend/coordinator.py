@@ -0,0 +1,321 @@
+"""
+Coordinator side of the distributed deployment.
+
+Camera workers (backend/worker.py) register here, send a heartbeat with their load every few
+seconds and get their camera assignments back in the reply. For each assigned camera they push
+annotated JPEG frames with the frame's tracks and alert flags. The coordinator keeps the latest
+frame per camera for /video_feed?camera=..., runs the alerts and alert clips, and owns the face
+database: workers pull trusted faces from it and push unknown faces to it.
+
+Protocol (HTTP, JSON unless noted):
+    POST /workers/register                      {name, capacity} -> {worker_id, heartbeat_interval}
+    POST /workers/{worker_id}/heartbeat         {cameras: {camera_id: stats}, overloaded}
+                                                -> {cameras: {camera_id: {source, settings}}, faces_version}
+    PUT  /workers/{worker_id}/frames/{camera}   raw JPEG body, X-Frame-Meta header (JSON)
+    GET  /workers/faces                         -> {version, faces}
+    POST /workers/faces/untrusted               multipart: file (JPEG), embedding (JSON), quality
+    POST /cameras, GET /cameras, DELETE /cameras/{camera_id}
+"""
+import io
+import re
+import json
+import time
+import uuid
+import threading
+import numpy as np
+from typing import Optional
+from fastapi import APIRouter, Form, File, UploadFile, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+from backend import database
+from backend import face_store
+from backend import clip_utils
+from backend import analytics_utils
+from backend.alert_utils import AlertManager
+
+router = APIRouter()
+
+HEARTBEAT_INTERVAL = 2.0
+# A worker that misses heartbeats for this long is considered dead and its cameras are reassigned
+WORKER_TIMEOUT = 10.0
+# A camera moved off an overloaded worker stays put at least this long
+REBALANCE_COOLDOWN = 60.0
+CLIP_BUFFER_BYTES = 32 * 1024 * 1024
+# Camera ids end up in file names (clips, analytics snapshots)
+CAMERA_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+class Worker:
+    def __init__(self, name, capacity):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.last_seen = time.monotonic()
+        self.camera_stats = {}
+        self.overloaded = False
+
+    def alive(self, now):
+        return now - self.last_seen < WORKER_TIMEOUT
+
+    def to_dict(self, cameras):
+        return {
+            "worker_id": self.worker_id,
+            "name": self.name,
+            "capacity": self.capacity,
+            "cameras": cameras,
+            "overloaded": self.overloaded,
+            "last_seen_s": round(time.monotonic() - self.last_seen, 1),
+            "camera_stats": self.camera_stats
+        }
+
+class Camera:
+    """A camera as seen by the coordinator: its assignment and the latest results from its worker."""
+    def __init__(self, camera_id, source, settings):
+        self.camera_id = camera_id
+        self.source = source
+        self.settings = settings
+        self.worker_id = None
+        self.assigned_at = 0.0
+
+        self.latest_frame = None
+        self.last_frame_time = None
+        self.tracks = []
+        self.occupancy = 0
+        self.peak_occupancy = 0
+        self.frames_received = 0
+
+        self.alert_manager = AlertManager(label=camera_id)
+        # Clip settings are the camera's own; clips are cut from the frames the worker sends
+        self.clip_recorder = clip_utils.ClipRecorder(self.settings, max_bytes=CLIP_BUFFER_BYTES, prefix=f"{camera_id}_")
+        self.alert_manager.add_listener(self.attach_clip)
+        self.analytics = analytics_utils.CameraAnalytics(analytics_utils.snapshot_path(f"camera_{camera_id}"))
+
+    def attach_clip(self, alert_record):
+        clip = self.clip_recorder.start_clip(alert_record['type'])
+        if clip:
+            alert_record['clip'] = f"/clips/{clip}"
+
+    def close(self):
+        self.clip_recorder.close()
+        self.analytics.snapshot()
+
+    def to_dict(self):
+        return {
+            "camera_id": self.camera_id,
+            "source": self.source,
+            "worker_id": self.worker_id,
+            "occupancy": self.occupancy,
+            "peak_occupancy": self.peak_occupancy,
+            "frames_received": self.frames_received,
+            "total_alerts": self.alert_manager.alert_count,
+            "last_frame_s": round(time.monotonic() - self.last_frame_time, 1) if self.last_frame_time else None
+        }
+
+class Coordinator:
+    def __init__(self):
+        self.workers = {}
+        self.cameras = {}
+        self.lock = threading.Lock()
+
+    # --- Cameras ---
+    def add_camera(self, camera_id, source, settings=None):
+        with self.lock:
+            camera = self.cameras.get(camera_id)
+            if camera is None:
+                self.cameras[camera_id] = Camera(camera_id, source, dict(settings or {}))
+            else:
+                camera.source = source
+                camera.settings.update(settings or {})
+            return self.cameras[camera_id]
+
+    def remove_camera(self, camera_id):
+        with self.lock:
+            camera = self.cameras.pop(camera_id, None)
+        if camera is not None:
+            camera.close()
+        return camera
+
+    def camera_list(self):
+        """Snapshot of the cameras, safe to iterate while cameras are added or removed."""
+        with self.lock:
+            return list(self.cameras.values())
+
+    def get_camera(self, camera_id):
+        with self.lock:
+            return self.cameras.get(camera_id)
+
+    # --- Workers ---
+    def register(self, name, capacity):
+        worker = Worker(name, capacity)
+        with self.lock:
+            self.workers[worker.worker_id] = worker
+        print(f"[DEBUG] Worker {worker.name} registered as {worker.worker_id} (capacity {worker.capacity})")
+        return worker
+
+    def heartbeat(self, worker_id, camera_stats, overloaded):
+        with self.lock:
+            worker = self.workers.get(worker_id)
+            if worker is None:
+                return None
+            worker.last_seen = time.monotonic()
+            worker.camera_stats = camera_stats
+            worker.overloaded = overloaded
+            self._assign()
+            return {
+                camera.camera_id: {"source": camera.source, "settings": camera.settings}
+                for camera in self.cameras.values() if camera.worker_id == worker_id
+            }
+
+    def _load(self, worker):
+        return sum(1 for c in self.cameras.values() if c.worker_id == worker.worker_id) / worker.capacity
+
+    def _assign(self):
+        """Drops dead workers, gives unassigned cameras to the least loaded worker with room and
+        moves at most one camera off an overloaded worker per pass. Caller holds the lock."""
+        now = time.monotonic()
+        for worker_id in [w for w, worker in self.workers.items() if not worker.alive(now)]:
+            print(f"[DEBUG] Worker {self.workers[worker_id].name} timed out")
+            del self.workers[worker_id]
+        alive = list(self.workers.values())
+
+        for camera in self.cameras.values():
+            if camera.worker_id not in self.workers:
+                camera.worker_id = None
+
+        for camera in self.cameras.values():
+            if camera.worker_id is not None:
+                continue
+            candidates = [w for w in alive if self._load(w) < 1.0]
+            if not candidates:
+                break
+            worker = min(candidates, key=self._load)
+            camera.worker_id = worker.worker_id
+            camera.assigned_at = now
+            print(f"[DEBUG] Camera {camera.camera_id} assigned to worker {worker.name}")
+
+        for worker in alive:
+            if not worker.overloaded:
+                continue
+            movable = [c for c in self.cameras.values()
+                       if c.worker_id == worker.worker_id and now - c.assigned_at > REBALANCE_COOLDOWN]
+            targets = [w for w in alive if w is not worker and not w.overloaded
+                       and self._load(w) + 1.0 / w.capacity < self._load(worker)]
+            if movable and targets:
+                target = min(targets, key=self._load)
+                camera = movable[0]
+                camera.worker_id = target.worker_id
+                camera.assigned_at = now
+                print(f"[DEBUG] Camera {camera.camera_id} moved from overloaded {worker.name} to {target.name}")
+                break
+
+    def receive_frame(self, worker_id, camera_id, jpeg, meta):
+        camera = self.get_camera(camera_id)
+        if camera is None or camera.worker_id != worker_id:
+            return False
+
+        camera.latest_frame = jpeg
+        camera.last_frame_time = time.monotonic()
+        camera.frames_received += 1
+        camera.tracks = meta.get("tracks", [])
+        camera.occupancy = meta.get("occupancy", 0)
+        camera.peak_occupancy = max(camera.peak_occupancy, camera.occupancy)
+
+        # The crowd alert message reports the count, which travels as "occupancy"
+        alerts = dict(meta.get("alerts") or {}, count=camera.occupancy)
+        camera.alert_manager.process_alerts(alerts)
+        if meta.get("width") and meta.get("height"):
+            frame_shape = (meta["height"], meta["width"])
+            camera.clip_recorder.add_frame(jpeg, meta.get("ts", 0.0), frame_shape)
+            boxes = np.array([track[1:5] for track in camera.tracks], dtype=np.float64).reshape(-1, 4)
+            camera.analytics.update([track[0] for track in camera.tracks], boxes, frame_shape,
+                                    meta.get("zone"), meta.get("ts", 0.0))
+        return True
+
+    # --- Stats ---
+    def stats(self):
+        with self.lock:
+            camera_list = list(self.cameras.values())
+            workers = list(self.workers.values())
+        cameras = {camera.camera_id: camera.to_dict() for camera in camera_list}
+        alerts = []
+        for camera in camera_list:
+            alerts.extend(camera.alert_manager.recent_alerts)
+        return {
+            "occupancy": sum(c["occupancy"] for c in cameras.values()),
+            "peak_occupancy": max((c["peak_occupancy"] for c in cameras.values()), default=0),
+            "total_alerts": sum(c["total_alerts"] for c in cameras.values()),
+            "alerts": alerts,
+            "cameras": cameras,
+            "workers": [w.to_dict([c for c in cameras.values() if c["worker_id"] == w.worker_id])
+                        for w in workers]
+        }
+
+coordinator = Coordinator()
+
+# --- Endpoints ---
+@router.post("/cameras")
+def add_camera(camera_id: str = Form(...), source: str = Form(...), settings: Optional[str] = Form(None)):
+    """source: "0" for the worker's webcam, an rtsp:// url or a file path visible to the workers."""
+    if not CAMERA_ID_PATTERN.match(camera_id):
+        raise HTTPException(status_code=400, detail="camera_id may only contain letters, digits, '_' and '-'")
+    try:
+        camera_settings = json.loads(settings) if settings else {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="settings must be a JSON object")
+    camera = coordinator.add_camera(camera_id, source, camera_settings)
+    return camera.to_dict()
+
+@router.get("/cameras")
+def list_cameras():
+    return [camera.to_dict() for camera in coordinator.camera_list()]
+
+@router.delete("/cameras/{camera_id}")
+def remove_camera(camera_id: str):
+    if coordinator.remove_camera(camera_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown camera")
+    return {"status": "removed"}
+
+@router.post("/workers/register")
+def register_worker(body: dict):
+    worker = coordinator.register(body.get("name") or "worker", int(body.get("capacity") or 1))
+    return {"worker_id": worker.worker_id, "heartbeat_interval": HEARTBEAT_INTERVAL}
+
+@router.post("/workers/{worker_id}/heartbeat")
+def worker_heartbeat(worker_id: str, body: dict):
+    cameras = coordinator.heartbeat(worker_id, body.get("cameras") or {}, bool(body.get("overloaded")))
+    if cameras is None:
+        # Unknown (e.g. coordinator restarted): the worker registers again
+        raise HTTPException(status_code=404, detail="Unknown worker")
+    return {"cameras": cameras, "faces_version": database.get_trusted_faces_version()}
+
+@router.put("/workers/{worker_id}/frames/{camera_id}")
+async def worker_frame(worker_id: str, camera_id: str, request: Request):
+    try:
+        meta = json.loads(request.headers.get("X-Frame-Meta") or "{}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid X-Frame-Meta")
+    jpeg = await request.body()
+    # Alerts, clips and analytics run in the threadpool, off the event loop
+    if not await run_in_threadpool(coordinator.receive_frame, worker_id, camera_id, jpeg, meta):
+        # Camera was reassigned or removed: the worker stops it
+        raise HTTPException(status_code=409, detail="Camera not assigned to this worker")
+    return {"status": "ok"}
+
+@router.get("/workers/faces")
+def worker_faces():
+    return {"version": database.get_trusted_faces_version(), "faces": database.get_trusted_faces()}
+
+@router.post("/workers/faces/untrusted")
+def worker_untrusted_face(file: UploadFile = File(...), embedding: str = Form(...), quality: float = Form(0.0)):
+    try:
+        # UnidentifiedImageError and truncated images are OSErrors
+        image = Image.open(io.BytesIO(file.file.read())).convert('RGB')
+    except OSError:
+        raise HTTPException(status_code=400, detail="Invalid face image")
+    try:
+        vector = np.asarray(json.loads(embedding), dtype=np.float32)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="embedding must be a JSON list of numbers")
+    if vector.shape != (face_store.EMBEDDING_SIZE,) or not np.all(np.isfinite(vector)):
+        raise HTTPException(status_code=400, detail=f"embedding must have {face_store.EMBEDDING_SIZE} finite values")
+    face_id, created = face_store.get_store().add(vector, image, quality)
+    return {"id": face_id, "created": created}
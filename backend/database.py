@@ -25,6 +25,17 @@ def init_db():
                     image_path TEXT NOT NULL,
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )''')
+
+    # Untrusted faces are clusters of sightings (see face_store): migrate older databases
+    columns = {row[1] for row in c.execute("PRAGMA table_info(untrusted_faces)")}
+    for column, definition in (("embedding", "TEXT"), ("sightings", "INTEGER DEFAULT 1"),
+                               ("last_seen", "TIMESTAMP"), ("quality", "REAL DEFAULT 0")):
+        if column not in columns:
+            c.execute(f"ALTER TABLE untrusted_faces ADD COLUMN {column} {definition}")
+    c.execute("UPDATE untrusted_faces SET last_seen = timestamp WHERE last_seen IS NULL")
+
+    # Keyset pagination indexes (newest first)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_untrusted_last_seen ON untrusted_faces (last_seen, id)")
     
     conn.commit()
     conn.close()
@@ -42,6 +53,22 @@ def add_trusted_face(name, embedding, image_path=None):
     conn.close()
     return face_id
 
+def add_trusted_faces(rows):
+    """
+    rows: list of (name, embedding, image_path), inserted in a single transaction
+    Returns the number of rows written.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO trusted_faces (name, embedding, image_path) VALUES (?, ?, ?)",
+                [(name, json.dumps(embedding), image_path) for name, embedding, image_path in rows]
+            )
+    finally:
+        conn.close()
+    return len(rows)
+
 def get_trusted_faces():
     """
     Returns a list of dicts: {'id': int, 'name': str, 'embedding': list, 'image_path': str}
@@ -62,6 +89,34 @@ def get_trusted_faces():
         })
     return faces
 
+def get_trusted_faces_page(limit, before_id=None):
+    """
+    One page of trusted faces without embeddings, newest first.
+    Returns (faces, next cursor or None); the cursor is the last id of the page.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    if before_id is None:
+        c.execute("SELECT id, name, image_path FROM trusted_faces ORDER BY id DESC LIMIT ?", (limit + 1,))
+    else:
+        c.execute("SELECT id, name, image_path FROM trusted_faces WHERE id < ? ORDER BY id DESC LIMIT ?",
+                  (before_id, limit + 1))
+    rows = c.fetchall()
+    conn.close()
+
+    faces = [{"id": r[0], "name": r[1], "image_path": r[2]} for r in rows[:limit]]
+    next_cursor = faces[-1]["id"] if len(rows) > limit else None
+    return faces, next_cursor
+
+def get_trusted_faces_version():
+    """Changes whenever a trusted face is added or removed, so workers know when to reload."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM trusted_faces")
+    count, max_id = c.fetchone()
+    conn.close()
+    return f"{count}-{max_id}"
+
 def delete_trusted_face(face_id):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
@@ -69,25 +124,71 @@ def delete_trusted_face(face_id):
     conn.commit()
     conn.close()
 
-def log_untrusted_face(image_path):
+def log_untrusted_face(image_path, embedding=None, quality=0.0):
+    """Creates a new untrusted face cluster. Returns its id."""
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    embedding_json = json.dumps(embedding) if embedding is not None else None
+    c.execute(
+        "INSERT INTO untrusted_faces (image_path, embedding, sightings, last_seen, quality) VALUES (?, ?, 1, CURRENT_TIMESTAMP, ?)",
+        (image_path, embedding_json, quality)
+    )
+    conn.commit()
+    face_id = c.lastrowid
+    conn.close()
+    return face_id
+
+def update_untrusted_face(face_id, embedding, sightings, quality, image_path):
+    """Records another sighting of an existing cluster."""
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("INSERT INTO untrusted_faces (image_path) VALUES (?)", (image_path,))
+    c.execute(
+        "UPDATE untrusted_faces SET embedding = ?, sightings = ?, quality = ?, image_path = ?, last_seen = CURRENT_TIMESTAMP WHERE id = ?",
+        (json.dumps(embedding), sightings, quality, image_path, face_id)
+    )
     conn.commit()
     conn.close()
 
-def get_untrusted_faces():
+def get_untrusted_clusters(limit):
+    """Most recently seen clusters that have an embedding, for the in-memory match index."""
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute("SELECT id, image_path, timestamp FROM untrusted_faces ORDER BY timestamp DESC")
+    c.execute(
+        "SELECT id, embedding, sightings, quality, image_path FROM untrusted_faces WHERE embedding IS NOT NULL "
+        "ORDER BY COALESCE(last_seen, timestamp) DESC LIMIT ?", (limit,)
+    )
     rows = c.fetchall()
     conn.close()
-    
-    faces = []
-    for r in rows:
-        faces.append({
-            "id": r[0],
-            "image_path": r[1],
-            "timestamp": r[2]
-        })
-    return faces
+    return [{
+        "id": r[0],
+        "embedding": json.loads(r[1]),
+        "sightings": r[2] or 1,
+        "quality": r[3] or 0.0,
+        "image_path": r[4]
+    } for r in rows]
+
+def get_untrusted_faces_page(limit, before=None):
+    """
+    One page of untrusted face clusters, most recently seen first.
+    before: (last_seen, id) of the previous page's last item. Returns (faces, next cursor or None).
+    """
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    query = "SELECT id, image_path, timestamp, sightings, last_seen FROM untrusted_faces"
+    params = []
+    if before is not None:
+        query += " WHERE last_seen < ? OR (last_seen = ? AND id < ?)"
+        params = [before[0], before[0], before[1]]
+    c.execute(query + " ORDER BY last_seen DESC, id DESC LIMIT ?", params + [limit + 1])
+    rows = c.fetchall()
+    conn.close()
+
+    faces = [{
+        "id": r[0],
+        "image_path": r[1],
+        "timestamp": r[2],
+        "sightings": r[3] or 1,
+        "last_seen": r[4]
+    } for r in rows[:limit]]
+    next_cursor = (faces[-1]["last_seen"], faces[-1]["id"]) if len(rows) > limit else None
+    return faces, next_cursor
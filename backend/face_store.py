@@ -0,0 +1,122 @@
+import os
+import uuid
+import threading
+import cv2
+import numpy as np
+from backend import database
+from backend import thumb_utils
+
+CAPTURED_FACES_DIR = "backend/captured_faces"
+# FaceNet (InceptionResnetV1) embedding length
+EMBEDDING_SIZE = 512
+
+# L2 distance between FaceNet embeddings below which two captures are the same person.
+# Tighter than the 0.8 used for trusted faces so two strangers are not merged.
+MATCH_THRESHOLD = 0.7
+# Clusters kept in memory for matching (most recently seen first)
+MAX_CLUSTERS = 512
+# The centroid follows at most this many sightings, so it can drift with lighting/pose
+MAX_CENTROID_WEIGHT = 20
+
+def face_quality(face_img, prob=1.0):
+    """Higher is better: detector confidence times the smaller side of the face crop."""
+    w, h = face_img.size
+    return float(min(w, h) * (prob if prob is not None else 1.0))
+
+class UntrustedFaceStore:
+    """
+    Online cluster index of unknown faces. A capture that matches a recent cluster only bumps its
+    sighting count (and replaces the picture when it is sharper/larger), so the same stranger is
+    stored once no matter how many track IDs or source reloads they go through.
+    """
+    def __init__(self, threshold=MATCH_THRESHOLD, max_clusters=MAX_CLUSTERS):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.lock = threading.Lock()
+        self.centroids = np.zeros((0, EMBEDDING_SIZE), dtype=np.float32)
+        self.clusters = [] # dicts: id, sightings, quality, image_path (parallel to centroids)
+        self.loaded = False
+
+    def load(self):
+        rows = database.get_untrusted_clusters(self.max_clusters)
+        self.clusters = [{k: row[k] for k in ("id", "sightings", "quality", "image_path")} for row in rows]
+        self.centroids = np.array([row["embedding"] for row in rows], dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+        self.loaded = True
+
+    def match(self, embedding):
+        """Returns (index, distance) of the closest cluster, or (None, None)."""
+        if not len(self.centroids):
+            return None, None
+        dists = np.linalg.norm(self.centroids - embedding, axis=1)
+        idx = int(np.argmin(dists))
+        if dists[idx] >= self.threshold:
+            return None, float(dists[idx])
+        return idx, float(dists[idx])
+
+    def _save_image(self, face_img):
+        filename = f"capture_{uuid.uuid4().hex}.jpg"
+        path = os.path.join(CAPTURED_FACES_DIR, filename)
+        cv2.imwrite(path, cv2.cvtColor(np.array(face_img), cv2.COLOR_RGB2BGR))
+        thumb_utils.submit(path)
+        return filename
+
+    def add(self, embedding, face_img, quality):
+        """
+        embedding: normalized FaceNet embedding, face_img: PIL crop.
+        Returns (cluster id, True if a new cluster was created).
+        """
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self.lock:
+            if not self.loaded:
+                self.load()
+
+            idx, _ = self.match(embedding)
+            if idx is None:
+                filename = self._save_image(face_img)
+                face_id = database.log_untrusted_face(filename, embedding.tolist(), quality)
+                self.clusters.insert(0, {"id": face_id, "sightings": 1, "quality": quality, "image_path": filename})
+                self.centroids = np.vstack([embedding[None, :], self.centroids])[:self.max_clusters]
+                del self.clusters[self.max_clusters:]
+                return face_id, True
+
+            cluster = self.clusters[idx]
+            weight = min(cluster["sightings"], MAX_CENTROID_WEIGHT)
+            centroid = (self.centroids[idx] * weight + embedding) / (weight + 1)
+            centroid /= np.linalg.norm(centroid) or 1.0
+            self.centroids[idx] = centroid
+            cluster["sightings"] += 1
+
+            if quality > cluster["quality"]:
+                # New file name, so cached copies of the old picture are never served for the new one
+                old_path = os.path.join(CAPTURED_FACES_DIR, cluster["image_path"])
+                cluster["image_path"] = self._save_image(face_img)
+                cluster["quality"] = quality
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+                thumb_utils.remove_thumbnails(old_path)
+
+            database.update_untrusted_face(
+                cluster["id"], centroid.tolist(), cluster["sightings"], cluster["quality"], cluster["image_path"]
+            )
+
+            # Most recently seen first, so eviction drops the stalest clusters
+            if idx:
+                self.clusters.insert(0, self.clusters.pop(idx))
+                self.centroids = np.concatenate([self.centroids[idx:idx + 1], self.centroids[:idx], self.centroids[idx + 1:]])
+            return cluster["id"], False
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = UntrustedFaceStore()
+        return _store
+
+def set_store(store):
+    """Replaces the sink for unknown faces, e.g. with one that forwards them to a coordinator."""
+    global _store
+    with _store_lock:
+        _store = store
@@ -0,0 +1,203 @@
+import os
+import re
+import io
+import uuid
+import time
+import zipfile
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+import detection_ops
+from backend import database
+from backend import thumb_utils
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+TRUSTED_FACES_DIR = "trusted_faces"
+
+def common_root(relative_paths):
+    """The top-level folder every image is in (a zip of `faces/`), or None."""
+    roots = {path.replace("\\", "/").split("/")[0] if "/" in path.replace("\\", "/") else None
+             for path in relative_paths}
+    return roots.pop() if len(roots) == 1 else None
+
+def person_name(relative_path, root=None):
+    """
+    People are named after their folder (`alice/1.jpg`), or for flat layouts after the
+    file name without a trailing counter (`alice_2.jpg`). A `root` folder shared by all
+    images (see common_root) is skipped, unless the files in it are only numbered, in which
+    case it is the one person (`alice.zip` of `alice/1.jpg`, `alice/2.jpg`).
+    """
+    parts = relative_path.replace("\\", "/").split("/")
+    if root is not None and len(parts) > 1 and parts[0] == root:
+        parts = parts[1:]
+    if len(parts) > 1:
+        return parts[-2]
+    stem = os.path.splitext(parts[-1])[0]
+    return re.sub(r"[_\-\s]*\d+$", "", stem) or root or stem
+
+def list_images(source):
+    """Returns (relative_path, read_bytes) pairs for every image in a directory or zip archive."""
+    if zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        lock = threading.Lock()
+
+        def reader(member):
+            def read():
+                # ZipFile reads share one file handle
+                with lock:
+                    return archive.read(member)
+            return read
+
+        return [(m, reader(m)) for m in archive.namelist()
+                if m.lower().endswith(IMAGE_EXTENSIONS) and not m.startswith("__MACOSX/")]
+
+    if not os.path.isdir(source):
+        raise ValueError(f"Not a directory or zip archive: {source}")
+
+    images = []
+    for root, _, files in os.walk(source):
+        for filename in sorted(files):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(root, filename)
+
+                def read(path=path):
+                    with open(path, "rb") as f:
+                        return f.read()
+                images.append((os.path.relpath(path, source), read))
+    return images
+
+class ImportJob:
+    def __init__(self, source, remove_source=False):
+        self.job_id = uuid.uuid4().hex
+        self.source = source
+        # Uploaded archives are deleted once the job is done
+        self.remove_source = remove_source
+        self.status = "queued"
+        self.total = 0
+        self.processed = 0
+        self.people = 0
+        self.faces = 0
+        self.rejects = []
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "people": self.people,
+            "faces": self.faces,
+            "rejected": len(self.rejects),
+            "rejects": self.rejects[-100:],
+            "error": self.error,
+            "elapsed_s": round(elapsed, 1)
+        }
+
+def _decode(relative_path, read):
+    """Runs in the decode threads. Returns (relative_path, RGB image) or raises ValueError."""
+    try:
+        return relative_path, Image.open(io.BytesIO(read())).convert('RGB')
+    except Exception as e:
+        raise ValueError(f"unreadable image: {e}")
+
+def _detect_and_embed(mtcnn, resnet, device, images):
+    """Model work for one batch, run by the shared inference queue. Returns ([(path, face, embedding)], rejects)."""
+    found, rejects = [], []
+    for relative_path, image in images:
+        face = detection_ops.detect_largest_face(mtcnn, image)
+        if face is None:
+            rejects.append({"file": relative_path, "reason": "no face detected"})
+        else:
+            found.append((relative_path, face, detection_ops.preprocess_face(face)))
+    vectors = detection_ops.embed_faces(resnet, [tensor for _, _, tensor in found], device) if found else []
+    return [(path, face, vector) for (path, face, _), vector in zip(found, vectors)], rejects
+
+def run_import(job, inference, mtcnn, resnet, device, workers=4, batch_size=16):
+    """
+    Decodes images in parallel threads, one batch at a time, and runs face detection and
+    embedding for each batch through the shared inference queue (so imports take turns with
+    enrollments instead of competing for the models). Each person's embeddings are averaged
+    into one template and all people are written in one transaction. Only one batch of
+    images is held in memory at a time.
+    """
+    job.status = "running"
+    job.started = time.time()
+    try:
+        images = list_images(job.source)
+        job.total = len(images)
+        root = common_root(path for path, _ in images)
+
+        embeddings = defaultdict(list)
+        display_faces = {}
+
+        def decode(item):
+            try:
+                return _decode(*item), None
+            except ValueError as e:
+                return None, {"file": item[0], "reason": str(e)}
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="face-import") as executor:
+            for start in range(0, len(images), batch_size):
+                decoded = []
+                for image, reject in executor.map(decode, images[start:start + batch_size]):
+                    if reject:
+                        job.rejects.append(reject)
+                    else:
+                        decoded.append(image)
+
+                faces, rejects = inference.call(_detect_and_embed, mtcnn, resnet, device, decoded) if decoded else ([], [])
+                job.rejects.extend(rejects)
+                for relative_path, face, vector in faces:
+                    name = person_name(relative_path, root)
+                    display_faces.setdefault(name, face)
+                    embeddings[name].append(vector)
+                job.faces += len(faces)
+                job.processed = min(start + batch_size, job.total)
+
+        rows = []
+        for name, vectors in embeddings.items():
+            save_path = os.path.join(TRUSTED_FACES_DIR, f"{uuid.uuid4().hex}.jpg")
+            display_faces[name].save(save_path)
+            thumb_utils.submit(save_path)
+            rows.append((name, detection_ops.average_embedding(vectors).tolist(), save_path))
+        job.people = database.add_trusted_faces(rows)
+        job.status = "completed"
+    except Exception as e:
+        print(f"[ERROR] Face import {job.job_id} failed: {e}")
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished = time.time()
+        if job.remove_source:
+            try:
+                os.remove(job.source)
+            except OSError as e:
+                print(f"[ERROR] Failed to remove import archive {job.source}: {e}")
+
+class ImportManager:
+    """Runs one import job at a time in a background thread and keeps their progress."""
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def running(self):
+        return any(job.status in ("queued", "running") for job in self.jobs.values())
+
+    def start(self, source, inference, mtcnn, resnet, device, remove_source=False, workers=4, batch_size=16):
+        with self.lock:
+            if self.running():
+                return None
+            job = ImportJob(source, remove_source)
+            self.jobs[job.job_id] = job
+        threading.Thread(
+            target=run_import, args=(job, inference, mtcnn, resnet, device, workers, batch_size), daemon=True
+        ).start()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
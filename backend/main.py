@@ -1,24 +1,26 @@
 import cv2
-import torch
-import numpy as np
 import shutil
 import os
 import time
 import threading
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from collections import defaultdict
-from ultralytics import YOLO
-from deep_sort_realtime.deepsort_tracker import DeepSort
 import sys
 
 # Ensure we can import detection_ops from the parent directory
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import detection_ops
-from backend.alert_utils import AlertManager
+import capture_ops
+import trackers
+from backend.pipeline import VideoState
+from backend import clip_utils
+from backend import face_store
+from backend import thumb_utils
+from backend import upload_utils
 from backend import api
+from backend import coordinator
 from pydantic import BaseModel
 
 class LoginRequest(BaseModel):
@@ -37,208 +39,66 @@ app.add_middleware(
 )
 
 # Startups ensure directories exist
-if not os.path.exists("captured_faces"):
-    os.makedirs("captured_faces")
+if not os.path.exists(face_store.CAPTURED_FACES_DIR):
+    os.makedirs(face_store.CAPTURED_FACES_DIR)
 if not os.path.exists("trusted_faces"):
     os.makedirs("trusted_faces")
 if not os.path.exists("uploads"):
     os.makedirs("uploads")
+if not os.path.exists("recordings"):
+    os.makedirs("recordings")
+if not os.path.exists(clip_utils.CLIPS_DIR):
+    os.makedirs(clip_utils.CLIPS_DIR)
 
-app.mount("/captured_faces", StaticFiles(directory="captured_faces"), name="captured_faces")
-app.mount("/trusted_faces", StaticFiles(directory="trusted_faces"), name="trusted_faces")
+# Face images and their thumbnails: versioned URLs (?v=, see thumb_utils.image_urls) are cached
+# for good, anything else is revalidated against the ETag
+class CachedStaticFiles(StaticFiles):
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            query = scope.get("query_string", b"").decode("latin-1")
+            versioned = any(part.startswith("v=") for part in query.split("&"))
+            response.headers["Cache-Control"] = thumb_utils.IMMUTABLE if versioned else "no-cache"
+        return response
+
+# Same directory face_store writes captures to and api.py builds their URLs from
+app.mount("/captured_faces", CachedStaticFiles(directory=face_store.CAPTURED_FACES_DIR), name="captured_faces")
+app.mount("/trusted_faces", CachedStaticFiles(directory="trusted_faces"), name="trusted_faces")
+app.mount("/clips", StaticFiles(directory=clip_utils.CLIPS_DIR), name="clips")
 
 app.include_router(api.router)
+# Camera workers on other processes/nodes (see backend/worker.py)
+app.include_router(coordinator.router)
 
 # Optimization for Windows Stability
 cv2.setNumThreads(0)
 
-# Global State
-class VideoState:
-    def __init__(self):
-        self.video_source = "test_video.mp4" # Default
-        self.using_webcam = True
-        self.cap = None
-        self.reload_cap = True
-        self.latest_frame = None
-        self.lock = threading.Lock()
-        self.running = True
-        
-        # Models
-        self.use_cuda = torch.cuda.is_available()
-        self.device = 'cuda' if self.use_cuda else 'cpu'
-        print(f"Loading YOLO on {self.device}...")
-        self.yolo_model = YOLO("yolov8s.pt")
-        print("Loading DeepSort...")
-        self.deepsort_tracker = DeepSort(
-            max_age=30, n_init=1, nms_max_overlap=1.0, embedder_gpu=self.use_cuda
-        )
-        
-        # Face Recognition
-        try:
-            from facenet_pytorch import MTCNN, InceptionResnetV1
-            from backend import database
-            print("Loading Face Recognition Models...")
-            self.mtcnn = MTCNN(keep_all=True, device=self.device)
-            self.resnet = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
-            
-            database.init_db()
-            self.known_faces = database.get_trusted_faces()
-            print(f"Loaded {len(self.known_faces)} trusted faces.")
-        except Exception as e:
-            print(f"Face Recognition Init Error: {e}")
-            self.mtcnn = None
-            self.resnet = None
-            self.known_faces = []
-
-        # State trackers
-        self.track_history = defaultdict(list)
-        self.loitering_saved = defaultdict(lambda: False)
-        self.saved_untrusted_session = set()
-        self.frame_count = 0
-        
-        # Statistics
-        self.current_occupancy = 0
-        self.peak_occupancy = 0
-        self.total_alerts = 0
-        
-        # Settings
-        self.settings = {
-            'loitering_threshold': 10,
-            'crowd_threshold': 60,     
-            'confidence_threshold': 0.15, 
-            'trespassing_zone': [200, 300, 300, 350],
-            'trespassing_enabled': True,
-            'loitering_enabled': True,
-            'crowd_enabled': True
-        }
-        
-        # Alert Manager
-        self.alert_manager = AlertManager()
-
-    def get_capture(self):
-        if self.reload_cap or self.cap is None or not self.cap.isOpened():
-            if self.cap:
-                try:
-                    self.cap.release()
-                except:
-                    pass
-                
-            source = 0 if self.using_webcam else self.video_source
-            print(f"[DEBUG] Opening video source: {source}")
-            
-            if self.using_webcam:
-                # Use DSHOW on Windows for better stability with webcams
-                self.cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-            else:
-                self.cap = cv2.VideoCapture(source)
-                
-            if not self.cap.isOpened():
-                print(f"[ERROR] Failed to open source: {source}")
-                self.reload_cap = True
-                return None
-            
-            print(f"[DEBUG] Source opened successfully: {source}")
-            self.reload_cap = False
-            self.frame_count = 0
-            self.track_history.clear()
-            self.loitering_saved.clear()
-            self.saved_untrusted_session.clear()
-            self.deepsort_tracker.delete_all_tracks()
-            
-            if self.mtcnn:
-                from backend import database
-                self.known_faces = database.get_trusted_faces()
-            
-        return self.cap
-
-    def process_video(self):
-        print("[DEBUG] Background video processing loop started.")
-        while self.running:
-            cap = self.get_capture()
-            if not cap:
-                time.sleep(1)
-                continue
-                
-            ret, frame = cap.read()
-            if not ret:
-                if not self.using_webcam:
-                    self.frame_count = 0
-                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    continue
-                else:
-                    print("[DEBUG] Capture read failed, retrying in 1s...")
-                    self.reload_cap = True
-                    time.sleep(1)
-                    continue
-                    
-            self.frame_count += 1
-            fps = cap.get(cv2.CAP_PROP_FPS) or 30
-            current_time = self.frame_count / fps
-            
-            # Run Detection
-            detections_list = []
-            results = self.yolo_model(
-                frame, stream=True, conf=self.settings['confidence_threshold'], 
-                device=self.device if self.device == 'cpu' else 0, imgsz=640, verbose=False
-            )
-            
-            for result in results:
-                boxes = result.boxes.cpu().numpy()
-                for box in boxes:
-                    x1, y1, x2, y2 = box.xyxy[0]
-                    conf = box.conf[0]
-                    cls_id = int(box.cls[0])
-                    if cls_id == 0: # Person
-                        w = x2 - x1
-                        h = y2 - y1
-                        detections_list.append([[x1, y1, w, h], conf, 0])
-            
-            # Tracker
-            tracks = self.deepsort_tracker.update_tracks(detections_list, frame=frame)
-            
-            # Annotate
-            curr_settings = self.settings.copy()
-            curr_settings['trespassing_zone'] = tuple(self.settings['trespassing_zone'])
-            
-            final_frame, alerts, self.saved_untrusted_session = detection_ops.process_frame_annotations(
-                frame, tracks, current_time, 
-                self.track_history, self.loitering_saved, curr_settings,
-                mtcnn=self.mtcnn,
-                resnet=self.resnet,
-                known_faces=self.known_faces,
-                device=self.device,
-                saved_untrusted_session=self.saved_untrusted_session
-            )
-            
-            # Process Alerts
-            self.alert_manager.process_alerts(alerts)
-            
-            # Update Stats
-            self.current_occupancy = alerts['count']
-            if self.current_occupancy > self.peak_occupancy:
-                self.peak_occupancy = self.current_occupancy
-            
-            # Encoding
-            ret, buffer = cv2.imencode('.jpg', final_frame)
-            if ret:
-                with self.lock:
-                    self.latest_frame = buffer.tobytes()
-            
-            # Small sleep to yield
-            time.sleep(0.01)
-
-state = VideoState()
+# HAWKEYE_LOCAL_PIPELINE=0 runs this API as a pure coordinator: cameras are only processed by workers
+LOCAL_PIPELINE = os.getenv("HAWKEYE_LOCAL_PIPELINE", "1") != "0"
+
+# Building the pipeline loads YOLO and the face models, a pure coordinator does without
+state = VideoState() if LOCAL_PIPELINE else None
+
+def local_state():
+    if state is None:
+        raise HTTPException(status_code=404, detail="Local pipeline is disabled (HAWKEYE_LOCAL_PIPELINE=0)")
+    return state
 
 @app.on_event("startup")
 async def startup_event():
-    threading.Thread(target=state.process_video, daemon=True).start()
+    if state is not None:
+        threading.Thread(target=state.process_video, daemon=True).start()
 
-def generate_frames():
+def generate_frames(camera_id=None):
     while True:
-        if state.latest_frame is not None:
+        if camera_id is not None:
+            camera = coordinator.coordinator.get_camera(camera_id)
+            frame_bytes = camera.latest_frame if camera else None
+        else:
             with state.lock:
                 frame_bytes = state.latest_frame
-            
+
+        if frame_bytes is not None:
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
         
@@ -246,47 +106,197 @@ def generate_frames():
         time.sleep(0.03) # ~30 FPS output
 
 @app.get("/video_feed")
-def video_feed():
-    return StreamingResponse(generate_frames(), media_type="multipart/x-mixed-replace; boundary=frame")
+def video_feed(camera: str = None):
+    """The local pipeline's stream, or a worker camera's with ?camera=<camera_id>."""
+    if camera is not None and coordinator.coordinator.get_camera(camera) is None:
+        raise HTTPException(status_code=404, detail="Unknown camera")
+    if camera is None:
+        local_state()
+    return StreamingResponse(generate_frames(camera), media_type="multipart/x-mixed-replace; boundary=frame")
 
 @app.get("/settings")
 def get_settings():
-    return state.settings
+    return local_state().settings
 
 @app.post("/settings")
 def update_settings(new_settings: dict):
+    state = local_state()
+    tracker = new_settings.get('tracker', state.settings['tracker'])
+    if tracker not in trackers.TRACKER_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown tracker: {tracker}")
+    backend = new_settings.get('capture_backend', state.settings['capture_backend'])
+    if backend not in capture_ops.BACKENDS:
+        raise HTTPException(status_code=400, detail=f"Unknown capture backend: {backend}")
+    reload_keys = ('tracker', 'capture_backend', 'capture_max_fps', 'capture_max_width')
+    if any(key in new_settings and new_settings[key] != state.settings[key] for key in reload_keys):
+        state.reload_cap = True
     state.settings.update(new_settings)
     return {"status": "updated", "settings": state.settings}
 
 @app.get("/stats")
 def get_stats():
-    alerts = state.alert_manager.recent_alerts if hasattr(state.alert_manager, 'recent_alerts') else []
-    return {
-        "occupancy": state.current_occupancy,
-        "peak_occupancy": state.peak_occupancy,
-        "total_alerts": state.alert_manager.alert_count,
-        "alerts": alerts
+    # Totals cover the local pipeline and every worker camera
+    remote = coordinator.coordinator.stats()
+    stats = {
+        "occupancy": remote["occupancy"],
+        "peak_occupancy": remote["peak_occupancy"],
+        "total_alerts": remote["total_alerts"],
+        "alerts": remote["alerts"],
+        "capture": None,
+        "clips": None,
+        "qos": None,
+        "cameras": remote["cameras"],
+        "workers": remote["workers"]
     }
+    if state is not None:
+        stats["occupancy"] += state.current_occupancy
+        stats["peak_occupancy"] = max(stats["peak_occupancy"], state.peak_occupancy)
+        stats["total_alerts"] += state.alert_manager.alert_count
+        stats["alerts"] = state.alert_manager.recent_alerts + stats["alerts"]
+        stats["capture"] = state.capture.status() if state.capture else None
+        stats["clips"] = state.clip_recorder.status()
+        stats["qos"] = state.qos.status(state.settings)
+    stats["alerts"] = sorted(stats["alerts"], key=lambda a: a["timestamp"], reverse=True)[:50]
+    return stats
+
+# --- Analytics ---
+def get_analytics(camera):
+    """The local pipeline's accumulators, or a worker camera's with ?camera=<camera_id>."""
+    if camera is None:
+        return local_state().analytics
+    remote = coordinator.coordinator.get_camera(camera)
+    if remote is None:
+        raise HTTPException(status_code=404, detail="Unknown camera")
+    return remote.analytics
+
+@app.get("/analytics/heatmap")
+def analytics_heatmap(camera: str = None):
+    return get_analytics(camera).heatmap_status()
+
+@app.get("/analytics/dwell")
+def analytics_dwell(camera: str = None):
+    return get_analytics(camera).dwell_status()
+
+@app.get("/analytics/occupancy")
+def analytics_occupancy(camera: str = None, minutes: int = 60):
+    return get_analytics(camera).occupancy_series(minutes)
 
 @app.post("/set_source")
-def set_source(source_type: str = Form(...)):
+def set_source(source_type: str = Form(...), url: str = Form(None)):
+    state = local_state()
     if source_type == 'webcam':
         state.using_webcam = True
+    elif source_type == 'rtsp':
+        if not url:
+            raise HTTPException(status_code=400, detail="An rtsp:// or http:// url is required")
+        state.using_webcam = False
+        state.stream_url = url
+        state.video_index = None
     else:
         state.using_webcam = False
+        state.stream_url = None
     state.reload_cap = True
     return {"status": "source_changed", "type": source_type}
 
+def set_video_file(path):
+    state = local_state()
+    state.video_source = path
+    state.video_index = upload_utils.load_index(path)
+    state.start_frame = 0
+    state.using_webcam = False
+    state.stream_url = None
+    state.reload_cap = True
+
 @app.post("/upload_video")
 async def upload_video(file: UploadFile = File(...)):
-    file_location = os.path.abspath(f"uploads/{file.filename}")
-    with open(file_location, "wb+") as file_object:
-        shutil.copyfileobj(file.file, file_object)
-    
-    state.video_source = file_location
-    state.using_webcam = False
+    filename = upload_utils.safe_filename(file.filename)
+    file_location = os.path.abspath(os.path.join("uploads", filename))
+
+    def save():
+        with open(file_location, "wb+") as file_object:
+            shutil.copyfileobj(file.file, file_object, 1024 * 1024)
+
+    await run_in_threadpool(save)
+    if state is not None:
+        set_video_file(file_location)
+    return {"status": "file_uploaded", "filename": filename}
+
+# Resumable chunked upload:
+#   POST /uploads -> upload_id, PUT /uploads/{id}?offset=N (raw body) until done,
+#   GET /uploads/{id} to find the offset to resume from, POST /uploads/{id}/complete.
+uploads = upload_utils.UploadManager()
+
+def upload_error(e):
+    return HTTPException(status_code=e.status_code, detail=e.detail)
+
+def on_upload_indexed(session, index):
+    if state is not None and state.video_source == session.path:
+        state.video_index = index
+
+@app.post("/uploads")
+def create_upload(filename: str = Form(...), size: int = Form(None)):
+    session = uploads.create(filename, size)
+    return session.to_dict()
+
+@app.get("/uploads/{upload_id}")
+def get_upload(upload_id: str):
+    try:
+        return uploads.get(upload_id).to_dict()
+    except upload_utils.UploadError as e:
+        raise upload_error(e)
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    try:
+        session = await uploads.write_stream(upload_id, offset, request.stream())
+    except upload_utils.UploadError as e:
+        raise upload_error(e)
+    return session.to_dict()
+
+@app.post("/uploads/{upload_id}/complete")
+def complete_upload(upload_id: str, activate: bool = Form(True)):
+    try:
+        session = uploads.complete(upload_id, on_indexed=on_upload_indexed)
+    except upload_utils.UploadError as e:
+        raise upload_error(e)
+    if activate and state is not None:
+        # Playback starts right away, seeking becomes available once the index is built
+        set_video_file(session.path)
+    return session.to_dict()
+
+@app.get("/uploads/{upload_id}/index")
+def get_upload_index(upload_id: str, parts: int = 1):
+    try:
+        session = uploads.get(upload_id)
+    except upload_utils.UploadError as e:
+        raise upload_error(e)
+    index = upload_utils.load_index(session.path)
+    if index is None:
+        raise HTTPException(status_code=404, detail=f"Index not available ({session.index_status})")
+    index["segments"] = upload_utils.split_segments(index, max(parts, 1))
+    return index
+
+@app.post("/seek")
+def seek(seconds: float = Form(...)):
+    state = local_state()
+    if state.using_webcam or state.video_index is None:
+        raise HTTPException(status_code=400, detail="Seeking needs an indexed video file")
+    frame_idx, keyframe_time = upload_utils.nearest_keyframe(state.video_index, seconds)
+    state.start_frame = frame_idx
     state.reload_cap = True
-    return {"status": "file_uploaded", "filename": file.filename}
+    return {"status": "seeking", "frame": frame_idx, "time": keyframe_time}
+
+@app.post("/record/start")
+def start_recording(save_frames: bool = Form(False)):
+    path = local_state().start_recording(save_frames=save_frames)
+    return {"status": "recording", "path": path, "save_frames": save_frames}
+
+@app.post("/record/stop")
+def stop_recording():
+    recorder = local_state().stop_recording()
+    if recorder is None:
+        raise HTTPException(status_code=400, detail="Not recording")
+    return {"status": "stopped", "path": recorder.path, "frames": recorder.frames_written}
 
 @app.post("/login")
 def login(creds: LoginRequest):
@@ -0,0 +1,338 @@
+"""
+The per-camera processing pipeline, shared by the all-in-one API (backend/main.py) and the
+distributed camera workers (backend/worker.py).
+"""
+import os
+import sys
+import time
+import threading
+from collections import defaultdict
+import cv2
+import torch
+from ultralytics import YOLO
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import capture_ops
+import detection_ops
+import replay_ops
+import trackers
+from backend.alert_utils import AlertManager
+from backend import clip_utils
+from backend import database
+from backend import qos_utils
+from backend import analytics_utils
+
+# Byte budget of the alert clip ring buffer (and of each clip)
+CLIP_BUFFER_BYTES = 64 * 1024 * 1024
+
+class Models:
+    """
+    YOLO and the face models, loaded once per process and shared by all its cameras.
+    The ultralytics predictor keeps per-call state, so YOLO calls go through yolo_lock;
+    the face models are plain torch modules and can run from several threads.
+    """
+    def __init__(self):
+        self.use_cuda = torch.cuda.is_available()
+        self.device = 'cuda' if self.use_cuda else 'cpu'
+        print(f"Loading YOLO on {self.device}...")
+        self.yolo_model = YOLO("yolov8s.pt")
+        self.yolo_lock = threading.Lock()
+
+        # Face Recognition
+        try:
+            from facenet_pytorch import MTCNN, InceptionResnetV1
+            print("Loading Face Recognition Models...")
+            self.mtcnn = MTCNN(keep_all=True, device=self.device)
+            self.resnet = InceptionResnetV1(pretrained='vggface2').eval().to(self.device)
+        except Exception as e:
+            print(f"Face Recognition Init Error: {e}")
+            self.mtcnn = None
+            self.resnet = None
+
+class VideoState:
+    """
+    One camera's capture -> detect -> track -> annotate loop (process_video), with its tracking
+    state, settings, alerts and clips. models (see Models) may be shared between cameras.
+
+    Subclasses change where results go by overriding init_outputs, load_known_faces,
+    process_alerts and publish_frame (see backend/worker.py).
+    """
+    def __init__(self, models=None):
+        self.video_source = "test_video.mp4" # Default
+        self.using_webcam = True
+        self.stream_url = None # RTSP/HTTP camera, see /set_source
+        self.capture = None
+        self.reload_cap = True
+        self.start_frame = 0
+        self.video_index = None
+        self.latest_frame = None
+        self.lock = threading.Lock()
+        self.running = True
+        
+        # Models
+        self.models = models or Models()
+        self.use_cuda = self.models.use_cuda
+        self.device = self.models.device
+        self.mtcnn = self.models.mtcnn
+        self.resnet = self.models.resnet
+        self.tracker_type = 'deepsort'
+        print(f"Loading {self.tracker_type} tracker...")
+        self.tracker = trackers.create_tracker(self.tracker_type, self.use_cuda)
+
+        # State trackers
+        self.track_history = defaultdict(list)
+        self.loitering_saved = defaultdict(lambda: False)
+        self.saved_untrusted_session = set()
+        self.face_state = {}
+        self.frame_count = 0
+        
+        # Statistics
+        self.current_occupancy = 0
+        self.peak_occupancy = 0
+        self.total_alerts = 0
+        
+        # Settings
+        self.settings = {
+            'loitering_threshold': 10,
+            'crowd_threshold': 60,     
+            'confidence_threshold': 0.15, 
+            'trespassing_zone': [200, 300, 300, 350],
+            'trespassing_enabled': True,
+            'loitering_enabled': True,
+            'crowd_enabled': True,
+            'tracker': 'deepsort', # 'deepsort' or 'iou' (motion only, much cheaper)
+            # Face recognition only runs for tracks matching an enabled trigger, at most face_budget per frame
+            'face_trigger_loitering': True,
+            'face_trigger_zone': True,
+            'face_trigger_new': True,
+            'face_budget': 4,
+            'face_recheck_interval': 5,
+            # Capture (see capture_ops): 'auto', 'webcam', 'file', 'rtsp' or 'ffmpeg'; 0 disables the caps
+            'capture_backend': 'auto',
+            'capture_max_fps': 0,
+            'capture_max_width': 0,
+            # Alert clips: seconds of video kept before and recorded after each alert
+            'clips_enabled': True,
+            'clip_pre_seconds': 5,
+            'clip_post_seconds': 5,
+            # Overload governor (see qos_utils): degrades face budget, detection stride, input size
+            # and stream quality step by step to hold this frame rate
+            'qos_enabled': False,
+            'qos_target_fps': 15
+        }
+        
+        # Record mode (see replay_ops)
+        self.recorder = None
+
+        # Frame rate governor
+        self.qos = qos_utils.QoSGovernor()
+        self.last_detections = []
+        self.last_tracks = []
+
+        self.init_outputs()
+        self.known_faces = self.load_known_faces() if self.mtcnn else []
+        print(f"Loaded {len(self.known_faces)} trusted faces.")
+
+    def init_outputs(self):
+        """Face database, alerts, alert clips and analytics of a camera processed in this process."""
+        database.init_db()
+
+        # Alert Manager
+        self.alert_manager = AlertManager()
+
+        # Alert clips from the already encoded stream frames (see clip_utils)
+        self.clip_recorder = clip_utils.ClipRecorder(self.settings, max_bytes=CLIP_BUFFER_BYTES)
+        self.alert_manager.add_listener(self.attach_clip)
+
+        # Heatmap, dwell and per-minute occupancy (see analytics_utils), snapshotted under analytics/
+        self.analytics = analytics_utils.CameraAnalytics(analytics_utils.snapshot_path("local"))
+
+    def get_capture(self):
+        if self.reload_cap or self.capture is None:
+            if self.capture:
+                self.capture.stop()
+
+            if self.using_webcam:
+                source = 0
+            else:
+                source = self.stream_url or self.video_source
+            print(f"[DEBUG] Opening video source: {source}")
+
+            settings = self.settings
+            start_frame = self.start_frame
+            fps_hint = (self.video_index or {}).get('fps') or 30.0
+            self.start_frame = 0
+
+            def open_backend():
+                # Seeks only apply to the first open, loops and reconnects start from the beginning
+                nonlocal start_frame
+                backend = capture_ops.create_backend(
+                    source, kind=settings['capture_backend'], max_width=settings['capture_max_width'],
+                    max_fps=settings['capture_max_fps'], start_frame=start_frame, fps_hint=fps_hint
+                )
+                start_frame = 0
+                return backend
+
+            # The grab thread reconnects by itself, so tracks survive short outages.
+            # Only a new source (or seek) resets the tracking state below.
+            self.capture = capture_ops.ThreadedCapture(open_backend, max_fps=settings['capture_max_fps']).start()
+            self.reload_cap = False
+            self.frame_count = 0
+            self.track_history.clear()
+            self.loitering_saved.clear()
+            self.saved_untrusted_session.clear()
+            self.face_state.clear()
+            # A tracker change in settings takes effect on the next source (re)load
+            if self.settings['tracker'] != self.tracker_type:
+                print(f"[DEBUG] Switching tracker to {self.settings['tracker']}")
+                self.tracker = trackers.create_tracker(self.settings['tracker'], self.use_cuda,
+                                                       self.settings['confidence_threshold'])
+                self.tracker_type = self.settings['tracker']
+            self.tracker.delete_all_tracks()
+            self.last_detections, self.last_tracks = [], []
+            if self.analytics:
+                self.analytics.reset_tracks()
+            
+            if self.mtcnn:
+                self.known_faces = self.load_known_faces()
+            
+        return self.capture
+
+    def load_known_faces(self):
+        return database.get_trusted_faces()
+
+    def process_alerts(self, alerts):
+        self.alert_manager.process_alerts(alerts)
+
+    def publish_frame(self, frame_bytes, current_time, frame_shape, tracks, alerts):
+        """Makes an encoded, annotated frame available to /video_feed, the alert clips and the analytics."""
+        with self.lock:
+            self.latest_frame = frame_bytes
+        self.clip_recorder.add_frame(frame_bytes, current_time, frame_shape)
+        track_ids, boxes = analytics_utils.track_boxes(tracks)
+        self.analytics.update(track_ids, boxes, frame_shape, self.analytics_zone(), current_time)
+
+    def analytics_zone(self):
+        return self.settings['trespassing_zone'] if self.settings['trespassing_enabled'] else None
+
+    def stop(self):
+        self.running = False
+        if self.capture:
+            self.capture.stop()
+        self.stop_recording()
+        if self.clip_recorder:
+            self.clip_recorder.close()
+        if self.analytics:
+            self.analytics.snapshot()
+
+    def attach_clip(self, alert_record):
+        clip = self.clip_recorder.start_clip(alert_record['type'])
+        if clip:
+            alert_record['clip'] = f"/clips/{clip}"
+
+    def start_recording(self, save_frames=False):
+        self.stop_recording()
+        fps = self.capture.fps if self.capture else 30
+        path = os.path.abspath(os.path.join("recordings", f"session_{time.strftime('%Y%m%d_%H%M%S')}.hkr"))
+        self.recorder = replay_ops.Recorder(path, fps=fps, save_frames=save_frames, settings=self.settings)
+        print(f"[DEBUG] Recording to {path}")
+        return path
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+            print(f"[DEBUG] Recording stopped: {recorder.path} ({recorder.frames_written} frames)")
+        return recorder
+
+    def process_video(self):
+        print("[DEBUG] Background video processing loop started.")
+        while self.running:
+            capture = self.get_capture()
+            read_start = time.monotonic()
+            # Timestamps come from the source, so loitering times stay right when frames are skipped
+            frame, current_time = capture.read(timeout=1.0)
+            if frame is None:
+                # Source is (re)connecting: keep the tracks and wait
+                continue
+
+            self.frame_count += 1
+            # QoS latency runs up to the end of the frame from when a live frame was grabbed (waiting
+            # for the pipeline included); file frames are queued ahead on purpose, so they count
+            # from when this loop asked for them
+            frame_start = capture.grabbed_at if capture.live else max(capture.grabbed_at, read_start)
+            limits = self.qos.limits(self.settings)
+            
+            if self.frame_count % limits['detect_stride'] == 0 or self.frame_count == 1:
+                # Run Detection
+                with self.models.yolo_lock:
+                    results = self.models.yolo_model(
+                        frame, stream=True,
+                        conf=trackers.detector_confidence(self.tracker_type, self.settings['confidence_threshold']),
+                        device=self.device if self.device == 'cpu' else 0, imgsz=limits['imgsz'], verbose=False
+                    )
+                    detections_list = detection_ops.extract_person_detections(results)
+                if self.tracker_type == 'iou':
+                    # Follow live threshold changes
+                    self.tracker.set_confidence(self.settings['confidence_threshold'])
+                
+                # Tracker
+                tracks = self.tracker.update_tracks(detections_list, frame=frame)
+                self.last_detections, self.last_tracks = detections_list, tracks
+                reused = False
+            else:
+                # Degraded: skip detection on this frame and keep the previous tracks
+                detections_list, tracks = self.last_detections, self.last_tracks
+                reused = True
+            
+            # Annotate
+            curr_settings = self.settings.copy()
+            curr_settings['trespassing_zone'] = tuple(self.settings['trespassing_zone'])
+            curr_settings['face_budget'] = limits['face_budget']
+            
+            final_frame, alerts, self.saved_untrusted_session = detection_ops.process_frame_annotations(
+                frame, tracks, current_time, 
+                self.track_history, self.loitering_saved, curr_settings,
+                mtcnn=self.mtcnn,
+                resnet=self.resnet,
+                known_faces=self.known_faces,
+                device=self.device,
+                saved_untrusted_session=self.saved_untrusted_session,
+                face_state=self.face_state
+            )
+            
+            # Process Alerts
+            self.process_alerts(alerts)
+            
+            # Update Stats
+            self.current_occupancy = alerts['count']
+            if self.current_occupancy > self.peak_occupancy:
+                self.peak_occupancy = self.current_occupancy
+            
+            # Encoding
+            ret, buffer = cv2.imencode('.jpg', final_frame, [cv2.IMWRITE_JPEG_QUALITY, limits['jpeg_quality']])
+            if ret:
+                self.publish_frame(buffer.tobytes(), current_time, final_frame.shape, tracks, alerts)
+
+            # Record
+            recorder = self.recorder
+            if recorder:
+                try:
+                    recorder.write(self.frame_count, current_time, frame.shape, detections_list, tracks, alerts,
+                                   jpeg=buffer if ret else None, reused=reused)
+                except Exception as e:
+                    print(f"[ERROR] Recording failed, stopping: {e}")
+                    self.stop_recording()
+
+            # Governor
+            if self.settings['qos_enabled']:
+                self.qos.update(time.monotonic() - frame_start, self.settings['qos_target_fps'])
+            elif self.qos.level:
+                self.qos.reset()
+            
+            # Small sleep to yield
+            time.sleep(0.01)
+
+        # stop() may race with a capture (re)opened by this loop
+        if self.capture:
+            self.capture.stop()
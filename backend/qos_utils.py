@@ -0,0 +1,89 @@
+import time
+
+# Degradation ladder, cheapest quality loss first. Each level lists the limits in force
+# (they accumulate): fewer faces per frame, then detection on every Nth frame only (tracks are
+# reused in between), then a smaller YOLO input, then a lower stream JPEG quality.
+FULL_QUALITY = {'face_budget': None, 'detect_stride': 1, 'imgsz': 640, 'jpeg_quality': 95}
+LADDER = [
+    {},
+    {'face_budget': 2},
+    {'face_budget': 1},
+    {'face_budget': 1, 'detect_stride': 2},
+    {'face_budget': 1, 'detect_stride': 3},
+    {'face_budget': 1, 'detect_stride': 3, 'imgsz': 480},
+    {'face_budget': 1, 'detect_stride': 3, 'imgsz': 320},
+    {'face_budget': 1, 'detect_stride': 3, 'imgsz': 320, 'jpeg_quality': 70},
+    {'face_budget': 1, 'detect_stride': 3, 'imgsz': 320, 'jpeg_quality': 50},
+]
+
+class QoSGovernor:
+    """
+    Holds a target frame rate by stepping through LADDER.
+
+    Frame latency, from capture to the end of processing, is smoothed with an EWMA. Above the
+    frame budget the governor degrades one level, below `recover_ratio` of it for `recover_hold`
+    seconds it restores one. The gap between the two thresholds, the longer hold for recovery
+    and the settle time after every change keep it from flapping between levels.
+    """
+    def __init__(self, alpha=0.1, recover_ratio=0.7, degrade_hold=1.0, recover_hold=5.0):
+        self.alpha = alpha
+        self.recover_ratio = recover_ratio
+        self.degrade_hold = degrade_hold
+        self.recover_hold = recover_hold
+        self.reset()
+
+    def reset(self):
+        self.level = 0
+        self.latency = None
+        self.last_change = time.monotonic()
+        self.headroom_since = None
+        self.changes = 0
+
+    def limits(self, settings):
+        """Settings for the current level: face_budget, detect_stride, imgsz and jpeg_quality."""
+        limits = dict(FULL_QUALITY, **LADDER[self.level])
+        budget = settings.get('face_budget', 4)
+        limits['face_budget'] = budget if limits['face_budget'] is None else min(budget, limits['face_budget'])
+        return limits
+
+    def update(self, latency, target_fps):
+        """Feeds one frame's processing time (seconds). Returns the new level."""
+        self.latency = latency if self.latency is None else self.alpha * latency + (1 - self.alpha) * self.latency
+        if not target_fps:
+            return self.level
+
+        now = time.monotonic()
+        budget = 1.0 / target_fps
+        settled = now - self.last_change >= self.degrade_hold
+
+        if self.latency > budget:
+            self.headroom_since = None
+            if settled and self.level < len(LADDER) - 1:
+                self._change(self.level + 1, now)
+        elif self.latency < budget * self.recover_ratio and self.level > 0:
+            if self.headroom_since is None:
+                self.headroom_since = now
+            elif settled and now - self.headroom_since >= self.recover_hold:
+                self._change(self.level - 1, now)
+        else:
+            self.headroom_since = None
+        return self.level
+
+    def _change(self, level, now):
+        print(f"[DEBUG] QoS level {self.level} -> {level} (frame latency {self.latency * 1000:.1f} ms)")
+        self.level = level
+        self.last_change = now
+        self.headroom_since = None
+        self.changes += 1
+
+    def status(self, settings):
+        target_fps = settings.get('qos_target_fps', 0)
+        return {
+            "enabled": settings.get('qos_enabled', False),
+            "level": self.level,
+            "max_level": len(LADDER) - 1,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "target_ms": round(1000 / target_fps, 1) if target_fps else None,
+            "changes": self.changes,
+            "limits": self.limits(settings)
+        }
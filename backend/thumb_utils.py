@@ -0,0 +1,101 @@
+import os
+import queue
+import threading
+from PIL import Image
+
+# Thumbnails live next to their originals: <dir>/thumbs/<size>/<filename>
+THUMB_SIZES = (128, 256)
+THUMB_QUALITY = 85
+# Versioned URLs (?v=...) never change content, so browsers may keep them for a year
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+def thumb_path(path, size):
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, "thumbs", str(size), filename)
+
+def make_thumbnails(path):
+    """Writes every THUMB_SIZES thumbnail of an image (longest side = size)."""
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+        for size in THUMB_SIZES:
+            target = thumb_path(path, size)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            thumb = image.copy()
+            thumb.thumbnail((size, size), Image.LANCZOS)
+            tmp = target + ".tmp"
+            thumb.save(tmp, "JPEG", quality=THUMB_QUALITY)
+            os.replace(tmp, target)
+
+def remove_thumbnails(path):
+    for size in THUMB_SIZES:
+        target = thumb_path(path, size)
+        if os.path.exists(target):
+            os.remove(target)
+
+class ThumbnailWorker:
+    """Generates thumbnails on a background thread so capture and enrollment never wait on resizing."""
+    def __init__(self, max_pending=1024):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.pending = set()
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, path):
+        with self.lock:
+            if path in self.pending:
+                return
+            try:
+                self.queue.put_nowait(path)
+            except queue.Full:
+                # Missing thumbnails are requested again the next time they are listed
+                return
+            self.pending.add(path)
+
+    def _run(self):
+        while True:
+            path = self.queue.get()
+            try:
+                if os.path.exists(path):
+                    make_thumbnails(path)
+            except Exception as e:
+                print(f"[ERROR] Thumbnail generation failed for {path}: {e}")
+            finally:
+                with self.lock:
+                    self.pending.discard(path)
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def submit(path):
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = ThumbnailWorker()
+    _worker.submit(path)
+
+def _versioned(url, path):
+    return f"{url}?v={os.stat(path).st_mtime_ns}"
+
+def image_urls(mount, directory, filename):
+    """
+    URLs for an image served from `mount` (whose files are in `directory`): the original and the
+    THUMB_SIZES thumbnails, versioned by modification time. Falls back to the original while a
+    thumbnail is missing, and queues it.
+    """
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        return {"image_url": f"{mount}/{filename}", "thumb_url": f"{mount}/{filename}", "thumb_url_2x": f"{mount}/{filename}"}
+
+    original = _versioned(f"{mount}/{filename}", path)
+    urls = {"image_url": original}
+    missing = False
+    for key, size in zip(("thumb_url", "thumb_url_2x"), THUMB_SIZES):
+        target = thumb_path(path, size)
+        if os.path.exists(target):
+            urls[key] = _versioned(f"{mount}/thumbs/{size}/{filename}", target)
+        else:
+            urls[key] = original
+            missing = True
+    if missing:
+        submit(path)
+    return urls
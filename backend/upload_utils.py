@@ -0,0 +1,423 @@
+import os
+import re
+import json
+import uuid
+import time
+import struct
+import bisect
+import threading
+import cv2
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+
+UPLOAD_DIR = "uploads"
+
+# --- Container Sniffing ---
+
+def safe_filename(filename):
+    """Strips any directory part and unusual characters from a client supplied filename."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", name).lstrip(".")
+    return name[:100] or f"video_{uuid.uuid4().hex}.mp4"
+
+def sniff_container(head):
+    """Identifies the container from the first bytes of a file. Returns None if unsupported."""
+    if len(head) >= 12 and head[4:8] == b"ftyp":
+        return "mp4"
+    if len(head) >= 12 and head[0:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "avi"
+    if head[0:4] == b"\x1a\x45\xdf\xa3":
+        return "mkv"
+    if len(head) >= 189 and head[0] == 0x47 and head[188] == 0x47:
+        return "ts"
+    return None
+
+class MP4BoxValidator:
+    """
+    Walks top-level MP4 boxes as bytes arrive, so a corrupt or non-video upload is rejected
+    early instead of after the whole file has been written.
+    """
+    def __init__(self):
+        self.position = 0
+        self.next_box = 0
+        self.pending = b""
+        self.boxes = []
+
+    def feed(self, chunk):
+        chunk_start = self.position
+        self.position += len(chunk)
+        while self.next_box < self.position:
+            # Collect the (up to 16 byte) header of the next box, which may straddle chunks
+            start = max(self.next_box - chunk_start, 0)
+            self.pending += chunk[start:start + 16 - len(self.pending)]
+            if len(self.pending) < 8:
+                return
+            size, box_type = struct.unpack(">I4s", self.pending[:8])
+            if size == 1:
+                if len(self.pending) < 16:
+                    return
+                size = struct.unpack(">Q", self.pending[8:16])[0]
+            elif size == 0:
+                # Box runs to the end of the file
+                size = float("inf")
+            if size < 8 or not re.fullmatch(rb"[A-Za-z0-9 _\-\xa9]{4}", box_type):
+                raise ValueError(f"Invalid MP4 box at offset {self.next_box}")
+            self.boxes.append((box_type.decode("latin-1"), self.next_box, size))
+            self.next_box += size
+            self.pending = b""
+
+    def state(self):
+        return {"position": self.position, "next_box": self.next_box, "pending": self.pending.hex(),
+                "boxes": self.boxes}
+
+    @classmethod
+    def from_state(cls, state):
+        validator = cls()
+        validator.position = state["position"]
+        validator.next_box = state["next_box"]
+        validator.pending = bytes.fromhex(state["pending"])
+        validator.boxes = [tuple(box) for box in state["boxes"]]
+        return validator
+
+# --- Upload Sessions ---
+
+class UploadError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class UploadSession:
+    def __init__(self, upload_id, filename, size=None):
+        self.upload_id = upload_id
+        self.filename = safe_filename(filename)
+        self.size = size
+        self.offset = 0
+        self.container = None
+        self.completed = False
+        self.index_status = "pending"
+        self.created = time.time()
+        self.validator = None
+        self.lock = threading.Lock()
+
+    @property
+    def part_path(self):
+        return os.path.abspath(os.path.join(UPLOAD_DIR, f"{self.upload_id}_{self.filename}.part"))
+
+    @property
+    def path(self):
+        return os.path.abspath(os.path.join(UPLOAD_DIR, f"{self.upload_id}_{self.filename}"))
+
+    @property
+    def index_path(self):
+        return self.path + ".index.json"
+
+    @property
+    def meta_path(self):
+        return self.part_path + ".json"
+
+    def save_meta(self):
+        """Persists what a restarted server needs to resume the upload (written after each chunk)."""
+        meta = {
+            "size": self.size,
+            "offset": self.offset,
+            "container": self.container,
+            "validator": self.validator.state() if self.validator else None
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def to_dict(self):
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "size": self.size,
+            "offset": self.offset,
+            "container": self.container,
+            "completed": self.completed,
+            "index_status": self.index_status
+        }
+
+    def write(self, offset, chunk):
+        """Appends a chunk at offset (blocking, call from a worker thread). Returns the new offset."""
+        with self.lock:
+            if self.completed:
+                raise UploadError(409, "Upload already completed")
+            if offset != self.offset:
+                raise UploadError(409, f"Expected offset {self.offset}")
+            if self.size is not None and self.offset + len(chunk) > self.size:
+                raise UploadError(413, "Chunk exceeds declared upload size")
+
+            if self.container is None:
+                self.container = sniff_container(chunk)
+                if self.container is None:
+                    raise UploadError(415, "Unsupported or unrecognised video container")
+                if self.container == "mp4":
+                    self.validator = MP4BoxValidator()
+
+            if self.validator:
+                try:
+                    self.validator.feed(chunk)
+                except ValueError as e:
+                    raise UploadError(422, str(e))
+
+            with open(self.part_path, "ab") as f:
+                f.write(chunk)
+            self.offset += len(chunk)
+            self.save_meta()
+            return self.offset
+
+class UploadManager:
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+        if not os.path.exists(UPLOAD_DIR):
+            os.makedirs(UPLOAD_DIR)
+
+    def create(self, filename, size=None):
+        session = UploadSession(uuid.uuid4().hex, filename, size)
+        session.save_meta()
+        with self.lock:
+            self.sessions[session.upload_id] = session
+        return session
+
+    def get(self, upload_id):
+        session = self.sessions.get(upload_id)
+        if session is None:
+            session = self._recover(upload_id)
+        if session is None:
+            raise UploadError(404, "Unknown upload")
+        return session
+
+    def _recover(self, upload_id):
+        """Picks up a partial upload left on disk by a previous server run so the client can resume it."""
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            return None
+        prefix = f"{upload_id}_"
+        for name in os.listdir(UPLOAD_DIR):
+            if name.startswith(prefix) and name.endswith(".part.json"):
+                session = UploadSession(upload_id, name[len(prefix):-len(".part.json")])
+                try:
+                    with open(session.meta_path) as f:
+                        meta = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"[ERROR] Cannot recover upload {upload_id}: {e}")
+                    return None
+                session.size = meta["size"]
+                session.offset = meta["offset"]
+                session.container = meta["container"]
+                if meta["validator"]:
+                    session.validator = MP4BoxValidator.from_state(meta["validator"])
+                # Bytes written after the last saved state were never validated: drop them, the
+                # client resumes from the saved offset
+                with open(session.part_path, "ab") as f:
+                    f.truncate(session.offset)
+                with self.lock:
+                    return self.sessions.setdefault(upload_id, session)
+        return None
+
+    async def write_stream(self, upload_id, offset, stream):
+        """Writes a request body stream to the upload without blocking the event loop."""
+        session = self.get(upload_id)
+        buffer = bytearray()
+        async for data in stream:
+            buffer += data
+            # Sniffing needs a few hundred bytes, after that flush ~1MB at a time
+            if len(buffer) >= 1024 * 1024:
+                offset = await run_in_threadpool(session.write, offset, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            offset = await run_in_threadpool(session.write, offset, bytes(buffer))
+        return session
+
+    def complete(self, upload_id, on_indexed=None):
+        """Finalizes the file and builds its keyframe index in the background."""
+        session = self.get(upload_id)
+        with session.lock:
+            if session.completed:
+                return session
+            if session.offset == 0:
+                raise UploadError(400, "No data uploaded")
+            if session.size is not None and session.offset != session.size:
+                raise UploadError(409, f"Upload incomplete: {session.offset}/{session.size} bytes")
+            os.replace(session.part_path, session.path)
+            if os.path.exists(session.meta_path):
+                os.remove(session.meta_path)
+            session.completed = True
+            session.index_status = "indexing"
+
+        def run():
+            try:
+                index = build_index(session.path, session.container)
+                with open(session.index_path, "w") as f:
+                    json.dump(index, f)
+                session.index_status = "ready"
+                if on_indexed:
+                    on_indexed(session, index)
+            except Exception as e:
+                print(f"[ERROR] Indexing failed for {session.path}: {e}")
+                session.index_status = "failed"
+
+        threading.Thread(target=run, daemon=True).start()
+        return session
+
+# --- Keyframe Index ---
+
+def _read_box_header(f, end):
+    start = f.tell()
+    if start + 8 > end:
+        return None
+    size, box_type = struct.unpack(">I4s", f.read(8))
+    header = 8
+    if size == 1:
+        size = struct.unpack(">Q", f.read(8))[0]
+        header = 16
+    elif size == 0:
+        size = end - start
+    if size < header:
+        return None
+    return box_type, start, start + header, start + size
+
+def _find_boxes(f, start, end, wanted):
+    """Yields (type, payload_start, box_end) for direct children of [start, end) whose type is in wanted."""
+    f.seek(start)
+    while True:
+        box = _read_box_header(f, end)
+        if box is None:
+            return
+        box_type, _, payload, box_end = box
+        if box_type in wanted:
+            yield box_type, payload, box_end
+        f.seek(box_end)
+
+def _child(f, start, end, box_type):
+    for _, payload, box_end in _find_boxes(f, start, end, {box_type}):
+        return payload, box_end
+    return None
+
+def index_mp4(path):
+    """
+    Reads keyframe sample numbers (stss) and sample durations (stts) of the first video track.
+    Only box headers and the small sample tables are read, never the media data.
+    """
+    with open(path, "rb") as f:
+        file_end = os.fstat(f.fileno()).st_size
+        moov = _child(f, 0, file_end, b"moov")
+        if moov is None:
+            return None
+
+        for _, trak_start, trak_end in list(_find_boxes(f, moov[0], moov[1], {b"trak"})):
+            mdia = _child(f, trak_start, trak_end, b"mdia")
+            if mdia is None:
+                continue
+            hdlr = _child(f, mdia[0], mdia[1], b"hdlr")
+            if hdlr is None:
+                continue
+            f.seek(hdlr[0] + 8)
+            if f.read(4) != b"vide":
+                continue
+
+            mdhd = _child(f, mdia[0], mdia[1], b"mdhd")
+            f.seek(mdhd[0])
+            version = f.read(1)[0]
+            f.seek(mdhd[0] + (20 if version == 1 else 12))
+            timescale = struct.unpack(">I", f.read(4))[0]
+
+            minf = _child(f, mdia[0], mdia[1], b"minf")
+            stbl = _child(f, minf[0], minf[1], b"stbl") if minf else None
+            if stbl is None or not timescale:
+                return None
+            stts = _child(f, stbl[0], stbl[1], b"stts")
+            stss = _child(f, stbl[0], stbl[1], b"stss")
+
+            f.seek(stts[0] + 4)
+            count = struct.unpack(">I", f.read(4))[0]
+            table = np.frombuffer(f.read(count * 8), dtype=">u4").reshape(-1, 2).astype(np.int64)
+            deltas = np.repeat(table[:, 1], table[:, 0])
+            starts = np.concatenate(([0], np.cumsum(deltas)[:-1])) / timescale if len(deltas) else np.zeros(0)
+
+            if stss is not None:
+                f.seek(stss[0] + 4)
+                count = struct.unpack(">I", f.read(4))[0]
+                sync = np.frombuffer(f.read(count * 4), dtype=">u4").astype(np.int64) - 1
+            else:
+                # No sync sample table means every sample is a keyframe
+                sync = np.arange(len(starts))
+            sync = sync[sync < len(starts)]
+
+            duration = float(deltas.sum()) / timescale
+            return {
+                "frame_count": int(len(starts)),
+                "duration": duration,
+                "fps": len(starts) / duration if duration else None,
+                "keyframes": [[int(n), round(float(starts[n]), 4)] for n in sync],
+                "exact": True
+            }
+    return None
+
+def index_by_decoding(path, every=30):
+    """Fallback for containers without a parsable sample table: seek points every N frames."""
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    keyframes = []
+    frame_idx = 0
+    while cap.grab():
+        if frame_idx % every == 0:
+            pos_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            keyframes.append([frame_idx, round((pos_ms / 1000.0) if pos_ms else frame_idx / fps, 4)])
+        frame_idx += 1
+    cap.release()
+    return {
+        "frame_count": frame_idx,
+        "duration": frame_idx / fps,
+        "fps": fps,
+        "keyframes": keyframes,
+        "exact": False
+    }
+
+def build_index(path, container=None):
+    index = None
+    if container in (None, "mp4"):
+        try:
+            index = index_mp4(path)
+        except (struct.error, TypeError, IndexError, ValueError) as e:
+            print(f"[DEBUG] MP4 index failed for {path}, decoding instead: {e}")
+    if index is None:
+        index = index_by_decoding(path)
+    index["container"] = container
+    return index
+
+def load_index(path):
+    index_path = path + ".index.json"
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        return json.load(f)
+
+def nearest_keyframe(index, seconds):
+    """Returns [frame_idx, time] of the last keyframe at or before the given time."""
+    keyframes = index["keyframes"]
+    if not keyframes:
+        return [0, 0.0]
+    times = [k[1] for k in keyframes]
+    pos = max(bisect.bisect_right(times, seconds) - 1, 0)
+    return keyframes[pos]
+
+def split_segments(index, parts):
+    """Splits a video into up to `parts` keyframe-aligned [start_frame, end_frame) ranges of similar duration."""
+    keyframes = index["keyframes"] or [[0, 0.0]]
+    frame_count = index["frame_count"]
+    duration = index["duration"] or 0
+    bounds = [0]
+    for i in range(1, parts):
+        frame_idx = nearest_keyframe(index, duration * i / parts)[0]
+        if frame_idx > bounds[-1]:
+            bounds.append(frame_idx)
+    bounds.append(frame_count)
+    times = {k[0]: k[1] for k in keyframes}
+    return [
+        {"start_frame": start, "end_frame": end, "start_time": times.get(start, 0.0)}
+        for start, end in zip(bounds[:-1], bounds[1:])
+    ]
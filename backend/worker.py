@@ -0,0 +1,318 @@
+"""
+Camera worker for the distributed deployment.
+
+Runs the capture -> detect -> track -> annotate pipeline (backend/pipeline.py) for the cameras a
+coordinator assigns to it, and pushes annotated frames, tracks and alert flags back. Workers keep
+no state of their own: cameras, settings and trusted faces all come from the coordinator (see
+backend/coordinator.py for the protocol), so any number can run, on one host or several.
+
+    python -m backend.worker --coordinator http://localhost:8000 --name node1 --capacity 2
+"""
+import io
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import socket
+import cv2
+import numpy as np
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import face_store
+from backend import pipeline
+from backend.analytics_utils import track_boxes
+
+REQUEST_TIMEOUT = 5
+# Settings whose change needs the capture (and tracking state) to be recreated
+RELOAD_KEYS = ('tracker', 'capture_backend', 'capture_max_fps', 'capture_max_width')
+
+class UnknownWorker(Exception):
+    """The coordinator does not know this worker (anymore) and it has to register again."""
+
+class CoordinatorClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+
+    def register(self, name, capacity):
+        r = self.session.post(f"{self.base_url}/workers/register", json={"name": name, "capacity": capacity},
+                              timeout=REQUEST_TIMEOUT)
+        r.raise_for_status()
+        body = r.json()
+        return body["worker_id"], body["heartbeat_interval"]
+
+    def heartbeat(self, worker_id, cameras, overloaded):
+        r = self.session.post(f"{self.base_url}/workers/{worker_id}/heartbeat",
+                              json={"cameras": cameras, "overloaded": overloaded}, timeout=REQUEST_TIMEOUT)
+        if r.status_code == 404:
+            raise UnknownWorker()
+        r.raise_for_status()
+        return r.json()
+
+    def send_frame(self, worker_id, camera_id, jpeg, meta):
+        """Returns False if the camera is no longer assigned to this worker."""
+        r = self.session.put(f"{self.base_url}/workers/{worker_id}/frames/{camera_id}", data=jpeg,
+                             headers={"Content-Type": "image/jpeg", "X-Frame-Meta": json.dumps(meta)},
+                             timeout=REQUEST_TIMEOUT)
+        if r.status_code == 409:
+            return False
+        r.raise_for_status()
+        return True
+
+    def trusted_faces(self):
+        r = self.session.get(f"{self.base_url}/workers/faces", timeout=REQUEST_TIMEOUT)
+        r.raise_for_status()
+        return r.json()
+
+    def send_untrusted_face(self, jpeg, embedding, quality):
+        r = self.session.post(f"{self.base_url}/workers/faces/untrusted",
+                              files={"file": ("face.jpg", jpeg, "image/jpeg")},
+                              data={"embedding": json.dumps(embedding), "quality": quality},
+                              timeout=REQUEST_TIMEOUT)
+        r.raise_for_status()
+
+class RemoteFaceStore:
+    """face_store sink that forwards unknown faces to the coordinator from a background thread."""
+    def __init__(self, client, max_pending=32):
+        self.client = client
+        self.queue = queue.Queue(maxsize=max_pending)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def add(self, embedding, face_img, quality):
+        buffer = io.BytesIO()
+        face_img.save(buffer, format="JPEG")
+        try:
+            self.queue.put_nowait((buffer.getvalue(), np.asarray(embedding).tolist(), quality))
+        except queue.Full:
+            print("[ERROR] Unknown face upload queue is full, dropping capture")
+        return None, False
+
+    def _run(self):
+        while True:
+            jpeg, embedding, quality = self.queue.get()
+            try:
+                self.client.send_untrusted_face(jpeg, embedding, quality)
+            except Exception as e:
+                print(f"[ERROR] Failed to send unknown face: {e}")
+
+class FrameSender:
+    """Sends the newest frame of one camera on its own thread; frames that pile up are skipped."""
+    def __init__(self, client, camera_id, max_fps):
+        self.client = client
+        self.camera_id = camera_id
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.worker_id = None
+        self.revoked = False
+        self.frames_sent = 0
+        self.condition = threading.Condition()
+        self.latest = None
+        self.pending_alerts = {}
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, jpeg, meta):
+        with self.condition:
+            # Alert flags of skipped frames are kept, so no alert is lost to the frame rate cap
+            for name, value in meta["alerts"].items():
+                if isinstance(value, bool):
+                    self.pending_alerts[name] = self.pending_alerts.get(name, False) or value
+            self.latest = (jpeg, meta)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def _run(self):
+        last_sent = 0.0
+        while True:
+            with self.condition:
+                while self.running and self.latest is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                (jpeg, meta), self.latest = self.latest, None
+                meta["alerts"].update(self.pending_alerts)
+                self.pending_alerts = {}
+
+            try:
+                if not self.client.send_frame(self.worker_id, self.camera_id, jpeg, meta):
+                    self.revoked = True
+                    return
+                self.frames_sent += 1
+            except Exception as e:
+                print(f"[ERROR] Failed to send frame for {self.camera_id}: {e}")
+                time.sleep(1)
+
+            wait = self.min_interval - (time.monotonic() - last_sent)
+            if wait > 0:
+                time.sleep(wait)
+            last_sent = time.monotonic()
+
+class FaceCache:
+    """Trusted faces pulled from the coordinator, refreshed when its faces_version changes."""
+    def __init__(self, client):
+        self.client = client
+        self.version = None
+        self.faces = []
+
+    def refresh(self, version):
+        if version == self.version:
+            return False
+        body = self.client.trusted_faces()
+        self.version, self.faces = body["version"], body["faces"]
+        print(f"[DEBUG] Loaded {len(self.faces)} trusted faces from the coordinator")
+        return True
+
+class WorkerVideoState(pipeline.VideoState):
+    """The pipeline for one assigned camera; results go to the coordinator instead of local state."""
+    def __init__(self, camera_id, source, settings, sender, faces, models):
+        self.faces = faces
+        super().__init__(models)
+        self.camera_id = camera_id
+        self.sender = sender
+        self.apply(source, settings)
+
+    def init_outputs(self):
+        # Faces, alerts, clips and analytics all live on the coordinator, which gets them from
+        # the frame metadata; the worker keeps no database and no files
+        self.alert_manager = None
+        self.clip_recorder = None
+        self.analytics = None
+
+    def apply(self, source, settings):
+        """Takes over the coordinator's source and settings. Returns True if the capture reloads."""
+        settings = dict(settings)
+        # Clips are cut by the coordinator from the frames it receives
+        settings['clips_enabled'] = False
+        reload = any(key in settings and settings[key] != self.settings[key] for key in RELOAD_KEYS)
+        self.settings.update(settings)
+
+        source = str(source)
+        if source != getattr(self, 'source', None):
+            self.source = source
+            self.using_webcam = source == "0"
+            self.video_source = self.stream_url = None if self.using_webcam else source
+            reload = True
+        if reload:
+            self.reload_cap = True
+        return reload
+
+    def load_known_faces(self):
+        return self.faces.faces
+
+    def process_alerts(self, alerts):
+        # Alert flags travel with the frames, the coordinator runs the alerts
+        pass
+
+    def publish_frame(self, frame_bytes, current_time, frame_shape, tracks, alerts):
+        with self.lock:
+            self.latest_frame = frame_bytes
+        meta = {
+            "ts": current_time,
+            "width": frame_shape[1],
+            "height": frame_shape[0],
+            "occupancy": alerts['count'],
+            "zone": self.analytics_zone(),
+            "alerts": {name: bool(value) for name, value in alerts.items() if name != 'count'},
+            # Same selection as local cameras, so dwell and occupancy analytics agree
+            "tracks": [[str(track_id)] + [round(float(v), 1) for v in box] for track_id, box in zip(*track_boxes(tracks))]
+        }
+        self.sender.submit(frame_bytes, meta)
+
+    def stats(self):
+        qos = self.qos.status(self.settings)
+        return {
+            "frames_sent": self.sender.frames_sent,
+            "latency_ms": qos["latency_ms"],
+            "qos_level": qos["level"],
+            "capture": self.capture.status() if self.capture else None
+        }
+
+class CameraWorker:
+    def __init__(self, coordinator_url, name, capacity, stream_fps):
+        self.client = CoordinatorClient(coordinator_url)
+        self.name = name
+        self.capacity = capacity
+        self.stream_fps = stream_fps
+        self.faces = FaceCache(self.client)
+        # YOLO and the face models are loaded with the first camera and shared by all of them
+        self.models = None
+        self.cameras = {}
+        self.worker_id = None
+        face_store.set_store(RemoteFaceStore(self.client))
+
+    def start_camera(self, camera_id, config):
+        print(f"[DEBUG] Starting camera {camera_id}: {config['source']}")
+        sender = FrameSender(self.client, camera_id, self.stream_fps)
+        sender.worker_id = self.worker_id
+        if self.models is None:
+            self.models = pipeline.Models()
+        state = WorkerVideoState(camera_id, config['source'], config.get('settings') or {}, sender, self.faces,
+                                 self.models)
+        threading.Thread(target=state.process_video, daemon=True).start()
+        self.cameras[camera_id] = state
+
+    def stop_camera(self, camera_id):
+        print(f"[DEBUG] Stopping camera {camera_id}")
+        state = self.cameras.pop(camera_id)
+        state.sender.stop()
+        state.stop()
+
+    def sync(self, assigned):
+        for camera_id in list(self.cameras):
+            if camera_id not in assigned or self.cameras[camera_id].sender.revoked:
+                self.stop_camera(camera_id)
+        for camera_id, config in assigned.items():
+            if camera_id in self.cameras:
+                self.cameras[camera_id].apply(config['source'], config.get('settings') or {})
+            else:
+                self.start_camera(camera_id, config)
+
+    def overloaded(self):
+        return any(state.qos.level > 0 for state in self.cameras.values())
+
+    def run(self):
+        interval = 2.0
+        while True:
+            try:
+                if self.worker_id is None:
+                    for camera_id in list(self.cameras):
+                        self.stop_camera(camera_id)
+                    self.worker_id, interval = self.client.register(self.name, self.capacity)
+                    print(f"[DEBUG] Registered with coordinator as {self.worker_id}")
+
+                reply = self.client.heartbeat(
+                    self.worker_id, {cid: state.stats() for cid, state in self.cameras.items()}, self.overloaded()
+                )
+                if self.faces.refresh(reply["faces_version"]):
+                    for state in self.cameras.values():
+                        state.known_faces = self.faces.faces
+                self.sync(reply["cameras"])
+            except UnknownWorker:
+                print("[DEBUG] Coordinator does not know this worker, registering again")
+                self.worker_id = None
+                continue
+            except requests.RequestException as e:
+                # Keep processing; frames are retried and assignments are refreshed once it is back
+                print(f"[ERROR] Coordinator unreachable: {e}")
+            time.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Hawkeye camera worker")
+    parser.add_argument("--coordinator", default=os.getenv("HAWKEYE_COORDINATOR", "http://localhost:8000"))
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--capacity", type=int, default=1, help="Cameras this worker can run")
+    parser.add_argument("--stream-fps", type=float, default=15, help="Max frames per second sent per camera")
+    args = parser.parse_args()
+
+    cv2.setNumThreads(0)
+    CameraWorker(args.coordinator, args.name, args.capacity, args.stream_fps).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Reference benchmark for the Hawkeye processing pipeline.
+
+Runs every stage of VideoState.process_video (and the whole pipeline) over a synthetic
+scene or a recorded clip, without a camera or network, and writes the timings as JSON.
+
+    python -m bench.run --frames 300 --output bench_results.json
+    python -m bench.run --clip test_video.mp4 --models real
+    python -m bench.run --baseline bench_results.json --threshold 0.10
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+# Ensure we can import detection_ops / backend from the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import detection_ops
+import trackers
+from backend import database
+from bench import synthetic
+
+# Same defaults as VideoState.settings
+BENCH_SETTINGS = {
+    'loitering_threshold': 10,
+    'crowd_threshold': 60,
+    'confidence_threshold': 0.15,
+    'trespassing_zone': (200, 300, 300, 350),
+    'trespassing_enabled': True,
+    'loitering_enabled': True,
+    'crowd_enabled': True,
+    'face_trigger_loitering': True,
+    'face_trigger_zone': True,
+    'face_trigger_new': True,
+    'face_budget': 4,
+    'face_recheck_interval': 5
+}
+
+FPS = 30
+
+
+def load_models(kind, device, tracker=None):
+    """
+    Returns (detector, tracker_factory, mtcnn, resnet) for 'stub' or 'real' models.
+    tracker overrides the tracker type ('stub', 'deepsort' or 'iou').
+    """
+    tracker = tracker or ('stub' if kind == 'stub' else 'deepsort')
+    if tracker == 'stub':
+        tracker_factory = synthetic.StubTracker
+    else:
+        def tracker_factory():
+            return trackers.create_tracker(tracker, device != 'cpu', BENCH_SETTINGS['confidence_threshold'])
+
+    if kind == 'stub':
+        return synthetic.StubDetector(), tracker_factory, synthetic.StubMTCNN(), synthetic.StubResnet()
+
+    from ultralytics import YOLO
+    from facenet_pytorch import MTCNN, InceptionResnetV1
+
+    detector = YOLO("yolov8s.pt")
+    mtcnn = MTCNN(keep_all=True, device=device)
+    resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+    return detector, tracker_factory, mtcnn, resnet
+
+
+def load_frames(args):
+    """Returns a list of (frame, ground_truth_boxes)."""
+    if args.clip:
+        frames = synthetic.load_clip(args.clip, args.frames)
+        if not frames:
+            raise RuntimeError(f"No frames read from clip: {args.clip}")
+        h, w = frames[0].shape[:2]
+        # Stub detections don't look at pixels, so drive them from a scene of the same size
+        scene = synthetic.SyntheticScene(w, h, args.people, seed=args.seed)
+        return [(frame, scene.step()[1]) for frame in frames]
+
+    scene = synthetic.SyntheticScene(args.width, args.height, args.people, seed=args.seed)
+    return scene.frames(args.frames)
+
+
+def detect(detector, frame, boxes, device):
+    if isinstance(detector, synthetic.StubDetector):
+        detector.set_boxes(boxes)
+    return detector(
+        frame, stream=True, conf=BENCH_SETTINGS['confidence_threshold'],
+        device=device if device == 'cpu' else 0, imgsz=640, verbose=False
+    )
+
+
+def summarize(timings, warmup):
+    samples = np.array(timings[warmup:] or timings) * 1000.0
+    total_s = samples.sum() / 1000.0
+    return {
+        "frames": int(len(samples)),
+        "total_s": round(float(total_s), 4),
+        "mean_ms": round(float(samples.mean()), 4),
+        "p50_ms": round(float(np.percentile(samples, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples, 95)), 4),
+        "fps": round(float(len(samples) / total_s), 2) if total_s > 0 else None
+    }
+
+
+# --- Stages ---
+# Each stage gets fresh state and returns a list of per-frame durations in seconds.
+
+def precompute_tracks(frames, detector, tracker_factory, device):
+    tracker = tracker_factory()
+    all_tracks = []
+    for frame, boxes in frames:
+        detections = detection_ops.extract_person_detections(detect(detector, frame, boxes, device))
+        all_tracks.append(list(tracker.update_tracks(detections, frame=frame)))
+    return all_tracks
+
+
+def bench_tracking(frames, detector, tracker_factory, device, **_):
+    """Detection results -> DeepSort detections -> tracker update (detector itself excluded)."""
+    tracker = tracker_factory()
+    timings = []
+    for frame, boxes in frames:
+        results = list(detect(detector, frame, boxes, device))
+        start = time.perf_counter()
+        detections = detection_ops.extract_person_detections(results)
+        tracker.update_tracks(detections, frame=frame)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_annotation(frames, all_tracks, **_):
+    track_history = defaultdict(list)
+    loitering_saved = defaultdict(lambda: False)
+    timings = []
+    for idx, ((frame, _), tracks) in enumerate(zip(frames, all_tracks)):
+        start = time.perf_counter()
+        detection_ops.process_frame_annotations(
+            frame, tracks, (idx + 1) / FPS, track_history, loitering_saved, BENCH_SETTINGS
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_zones(frames, all_tracks, **_):
+    zone = BENCH_SETTINGS['trespassing_zone']
+    timings = []
+    for tracks in all_tracks:
+        start = time.perf_counter()
+        for track in tracks:
+            ltrb = track.to_ltrb()
+            detection_ops.check_trespassing((int(ltrb[0]), int(ltrb[1]), int(ltrb[2]), int(ltrb[3])), zone)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_faces(frames, all_tracks, mtcnn, resnet, known_faces, device, **_):
+    saved_untrusted = set()
+    timings = []
+    for (frame, _), tracks in zip(frames, all_tracks):
+        start = time.perf_counter()
+        _, saved_untrusted = detection_ops.recognize_frame_faces(
+            frame, tracks, mtcnn, resnet, known_faces, device, saved_untrusted
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_encode(frames, all_tracks, **_):
+    timings = []
+    for frame, _ in frames:
+        start = time.perf_counter()
+        cv2.imencode('.jpg', frame)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_database(frames, all_tracks, **_):
+    timings = []
+    for idx in range(len(frames)):
+        start = time.perf_counter()
+        database.log_untrusted_face(f"bench_{idx}.jpg")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_pipeline(frames, detector, tracker_factory, mtcnn, resnet, known_faces, device, **_):
+    """Mirrors the body of VideoState.process_video (minus capture, alerts and the yield sleep)."""
+    tracker = tracker_factory()
+    track_history = defaultdict(list)
+    loitering_saved = defaultdict(lambda: False)
+    saved_untrusted = set()
+    face_state = {}
+    timings = []
+    for idx, (frame, boxes) in enumerate(frames):
+        start = time.perf_counter()
+        detections = detection_ops.extract_person_detections(detect(detector, frame, boxes, device))
+        tracks = tracker.update_tracks(detections, frame=frame)
+        final_frame, alerts, saved_untrusted = detection_ops.process_frame_annotations(
+            frame, tracks, (idx + 1) / FPS, track_history, loitering_saved, BENCH_SETTINGS,
+            mtcnn=mtcnn, resnet=resnet, known_faces=known_faces, device=device,
+            saved_untrusted_session=saved_untrusted, face_state=face_state
+        )
+        cv2.imencode('.jpg', final_frame)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+STAGES = {
+    'tracking': bench_tracking,
+    'annotation': bench_annotation,
+    'zones': bench_zones,
+    'faces': bench_faces,
+    'encode': bench_encode,
+    'database': bench_database,
+    'pipeline': bench_pipeline
+}
+
+
+def enroll_first_face(frames, all_tracks, mtcnn, resnet, device):
+    """With stub models, register the first face seen as trusted so matching runs without disk writes."""
+    from PIL import Image
+
+    for (frame, _), tracks in zip(frames, all_tracks):
+        if not tracks:
+            continue
+        x1, y1, x2, y2 = [int(v) for v in tracks[0].to_ltrb()]
+        crop = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).crop((x1, y1, x2, y2))
+        face = detection_ops.detect_largest_face(mtcnn, crop)
+        embedding = detection_ops.embed_faces(resnet, [detection_ops.preprocess_face(face)], device)[0]
+        return [{"id": 0, "name": "Bench", "embedding": embedding.tolist(), "image_path": None}]
+    return []
+
+
+def compare(results, baseline, threshold, min_delta_ms=0.0):
+    """
+    Returns a list of (stage, old_ms, new_ms) for stages slower than baseline by more than threshold.
+    Slowdowns smaller than min_delta_ms are treated as timer noise.
+    """
+    regressions = []
+    for stage, stats in results.items():
+        old = baseline.get("results", {}).get(stage)
+        if not old or not old.get("mean_ms"):
+            continue
+        if stats["mean_ms"] > old["mean_ms"] * (1 + threshold) and stats["mean_ms"] - old["mean_ms"] > min_delta_ms:
+            regressions.append((stage, old["mean_ms"], stats["mean_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hawkeye pipeline benchmark")
+    parser.add_argument("--clip", help="Recorded clip to replay instead of a synthetic scene")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--people", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--models", choices=["stub", "real"], default="stub")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--tracker", choices=("stub",) + trackers.TRACKER_TYPES,
+                        help="Tracker to use (default: stub with stub models, deepsort with real models)")
+    parser.add_argument("--stages", default=",".join(STAGES), help="Comma separated subset of: " + ", ".join(STAGES))
+    parser.add_argument("--output", help="Write results JSON here")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown vs baseline (0.10 = 10%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Ignore slowdowns smaller than this")
+    args = parser.parse_args()
+
+    # Resolve paths before moving into the scratch directory
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    if args.clip:
+        args.clip = os.path.abspath(args.clip)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(unknown)}")
+
+    print(f"Loading {args.models} models...")
+    detector, tracker_factory, mtcnn, resnet = load_models(args.models, args.device, args.tracker)
+    frames = load_frames(args)
+    print(f"Benchmarking {len(frames)} frames ({frames[0][0].shape[1]}x{frames[0][0].shape[0]})...")
+
+    # Face captures and the database are written relative to the working directory
+    workdir = tempfile.mkdtemp(prefix="hawkeye_bench_")
+    os.chdir(workdir)
+    os.makedirs(os.path.join("backend", "captured_faces"), exist_ok=True)
+    database.init_db()
+
+    all_tracks = precompute_tracks(frames, detector, tracker_factory, args.device)
+    known_faces = []
+    if args.models == 'stub':
+        known_faces = enroll_first_face(frames, all_tracks, mtcnn, resnet, args.device)
+    else:
+        known_faces = database.get_trusted_faces()
+
+    context = {
+        'frames': frames, 'all_tracks': all_tracks, 'detector': detector,
+        'tracker_factory': tracker_factory, 'mtcnn': mtcnn, 'resnet': resnet,
+        'known_faces': known_faces, 'device': args.device
+    }
+
+    results = {}
+    for stage in stages:
+        results[stage] = summarize(STAGES[stage](**context), args.warmup)
+        print(f"  {stage:<12} {results[stage]['mean_ms']:>9.3f} ms/frame  p95 {results[stage]['p95_ms']:>9.3f} ms")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": args.clip or "synthetic",
+            "models": args.models,
+            "device": args.device,
+            "tracker": args.tracker or ('stub' if args.models == 'stub' else 'deepsort'),
+            "frames": len(frames),
+            "people": args.people,
+            "resolution": [int(frames[0][0].shape[1]), int(frames[0][0].shape[0])],
+            "python": platform.python_version(),
+            "platform": platform.platform()
+        },
+        "results": results
+    }
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        for stage, old_ms, new_ms in regressions:
+            print(f"[REGRESSION] {stage}: {old_ms:.3f} ms -> {new_ms:.3f} ms (+{(new_ms / old_ms - 1) * 100:.1f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold * 100:.0f}% of baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import cv2
+import numpy as np
+import torch
+
+# --- Colors ---
+BACKGROUND = (60, 60, 60)
+PERSON_COLOR = (180, 130, 70)
+FACE_COLOR = (150, 180, 220)
+
+
+class SyntheticScene:
+    """
+    Generates frames with people (boxes) walking across a static background.
+    Ground truth boxes are kept so stub models can "detect" them without any pixels being analysed.
+    """
+    def __init__(self, width=1280, height=720, num_people=8, seed=0):
+        self.width = width
+        self.height = height
+        self.rng = np.random.default_rng(seed)
+
+        self.sizes = self.rng.uniform([40, 100], [80, 200], size=(num_people, 2))
+        self.positions = self.rng.uniform([0, 0], [width, height], size=(num_people, 2))
+        self.velocities = self.rng.uniform(-6, 6, size=(num_people, 2))
+
+        self.background = np.full((height, width, 3), BACKGROUND, dtype=np.uint8)
+        # Some texture so JPEG encoding is not trivially cheap
+        noise = self.rng.integers(0, 40, size=(height, width, 1), dtype=np.uint8)
+        self.background = cv2.add(self.background, np.repeat(noise, 3, axis=2))
+
+    def step(self):
+        """Moves everyone one frame forward and returns (frame, boxes) with boxes as [[x1, y1, x2, y2, id], ...]."""
+        self.positions += self.velocities
+        limits = np.array([self.width, self.height]) - self.sizes
+        bounce = (self.positions < 0) | (self.positions > limits)
+        self.velocities[bounce] *= -1
+        self.positions = np.clip(self.positions, 0, limits)
+
+        frame = self.background.copy()
+        boxes = []
+        for person_id, ((x, y), (w, h)) in enumerate(zip(self.positions, self.sizes)):
+            x1, y1, x2, y2 = int(x), int(y), int(x + w), int(y + h)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), PERSON_COLOR, -1)
+            # Head in the top part of the box, where the stub face detector looks
+            cv2.circle(frame, (int(x + w / 2), int(y + h * 0.15)), int(w * 0.25), FACE_COLOR, -1)
+            boxes.append([x1, y1, x2, y2, person_id])
+        return frame, boxes
+
+    def frames(self, count):
+        return [self.step() for _ in range(count)]
+
+
+def load_clip(path, max_frames):
+    """Reads up to max_frames from a recorded clip into memory."""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open clip: {path}")
+
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+# --- Stub Models ---
+# These mimic just enough of the ultralytics / deep_sort_realtime / facenet_pytorch
+# surfaces used by detection_ops and VideoState to isolate non-model overhead.
+
+class _StubBox:
+    def __init__(self, x1, y1, x2, y2, conf, cls_id):
+        self.xyxy = np.array([[x1, y1, x2, y2]], dtype=np.float32)
+        self.conf = np.array([conf], dtype=np.float32)
+        self.cls = np.array([cls_id], dtype=np.float32)
+
+
+class _StubBoxes(list):
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self
+
+
+class _StubResult:
+    def __init__(self, boxes):
+        self.boxes = _StubBoxes(boxes)
+
+
+class StubDetector:
+    """Returns the ground truth boxes queued with set_boxes() as YOLO-style results."""
+    def __init__(self):
+        self.boxes = []
+
+    def set_boxes(self, boxes):
+        self.boxes = boxes
+
+    def __call__(self, frame, **kwargs):
+        return [_StubResult([_StubBox(x1, y1, x2, y2, 0.9, 0) for x1, y1, x2, y2, _ in self.boxes])]
+
+
+class StubTrack:
+    def __init__(self, track_id, ltrb):
+        self.track_id = track_id
+        self.ltrb = ltrb
+        self.time_since_update = 0
+
+    def is_confirmed(self):
+        return True
+
+    def to_ltrb(self):
+        return self.ltrb
+
+
+class StubTracker:
+    """Assigns track ids by detection order, which matches person ids for a SyntheticScene."""
+    def update_tracks(self, raw_detections, frame=None, **kwargs):
+        tracks = []
+        for track_id, ([x, y, w, h], conf, cls_id) in enumerate(raw_detections):
+            tracks.append(StubTrack(str(track_id + 1), np.array([x, y, x + w, y + h])))
+        return tracks
+
+    def delete_all_tracks(self):
+        pass
+
+
+class StubMTCNN:
+    """Reports one face in the upper middle of each person crop."""
+    def detect(self, img):
+        w, h = img.size
+        return np.array([[w * 0.25, h * 0.02, w * 0.75, h * 0.3]]), np.array([0.99])
+
+
+class StubResnet:
+    """Cheap deterministic 512-d embedding (mean colour tiled), L2 normalized like FaceNet."""
+    def __call__(self, face_tensor):
+        means = face_tensor.mean(dim=(2, 3))
+        embedding = means.repeat(1, 171)[:, :512]
+        return torch.nn.functional.normalize(embedding, dim=1)
@@ -0,0 +1,211 @@
+"""
+Tracker comparison: throughput and identity stability of DeepSort vs the motion-only IoU tracker.
+
+    python -m bench.trackers --frames 600 --people 15
+    python -m bench.trackers --recording recordings/session_<time>.hkr --output trackers.json
+    python -m bench.trackers --video clip.mp4 --frames 900
+
+On a synthetic scene identities are scored against ground truth (with detection jitter and
+dropouts). On a recording they are scored against the recorded tracks, i.e. agreement with
+the tracker that ran live, which favours that tracker. A plain video is run through YOLO
+first and has no reference at all, so only cost, unique ids and track lengths are reported.
+The limits that apply are printed and written to the results as "notes".
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import replay_ops
+import trackers
+from bench import synthetic
+
+
+def synthetic_sequence(args):
+    """Returns a list of (frame, raw_detections, reference [(id, ltrb)])."""
+    scene = synthetic.SyntheticScene(args.width, args.height, args.people, seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+    sequence = []
+    for _ in range(args.frames):
+        frame, boxes = scene.step()
+        detections = []
+        for x1, y1, x2, y2, _ in boxes:
+            if rng.random() < args.dropout:
+                continue
+            jx, jy = rng.normal(0, args.jitter, 2)
+            detections.append([[x1 + jx, y1 + jy, x2 - x1, y2 - y1], float(rng.uniform(0.3, 0.95)), 0])
+        reference = [(person_id, np.array([x1, y1, x2, y2], dtype=float)) for x1, y1, x2, y2, person_id in boxes]
+        sequence.append((frame, detections, reference))
+    return sequence
+
+
+def video_sequence(path, max_frames, confidence):
+    """Runs YOLO over a video file. Returns a list of (frame, raw_detections, None): there is no reference."""
+    from ultralytics import YOLO
+    import detection_ops
+    model = YOLO("yolov8s.pt")
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video {path}")
+    sequence = []
+    while len(sequence) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        # Low enough for 'iou''s second association, run_tracker filters them out for the others
+        results = model(frame, stream=True, conf=trackers.detector_confidence('iou', confidence), verbose=False)
+        sequence.append((frame, detection_ops.extract_person_detections(results), None))
+    cap.release()
+    return sequence
+
+
+def recording_sequence(path, max_frames):
+    recording = replay_ops.Recording(path)
+    blank = np.zeros((recording.height, recording.width, 3), dtype=np.uint8)
+    sequence = []
+    for record in recording:
+        if len(sequence) >= max_frames:
+            break
+        if record.reused:
+            # Detection was skipped live (QoS), these are the previous frame's detections again
+            continue
+        frame = blank
+        if record.jpeg is not None:
+            frame = cv2.imdecode(np.frombuffer(record.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        reference = [(int(t['id']), t['ltrb'].astype(float)) for t in record.tracks]
+        sequence.append((frame, replay_ops.to_raw_detections(record.detections), reference))
+    return sequence, recording.has_frames()
+
+
+def make_tracker(kind, has_frames, confidence):
+    if kind == 'deepsort' and not has_frames:
+        from deep_sort_realtime.deepsort_tracker import DeepSort
+        return DeepSort(max_age=30, n_init=1, nms_max_overlap=1.0, embedder=None)
+    return trackers.create_tracker(kind, confidence_threshold=confidence)
+
+
+def run_tracker(kind, sequence, has_frames, confidence):
+    """Returns (per-frame update durations, per-frame [(track_id, ltrb)] of confirmed tracks)."""
+    tracker = make_tracker(kind, has_frames, confidence)
+    needs_embeds = getattr(tracker, 'embedder', True) is None
+    timings, outputs = [], []
+    for frame, detections, _ in sequence:
+        if kind != 'iou':
+            detections = [d for d in detections if d[1] >= confidence]
+        start = time.perf_counter()
+        if needs_embeds:
+            tracks = tracker.update_tracks(detections, embeds=[np.ones(1, dtype=np.float32)] * len(detections))
+        else:
+            tracks = tracker.update_tracks(detections, frame=frame)
+        timings.append(time.perf_counter() - start)
+        outputs.append([(t.track_id, np.asarray(t.to_ltrb(), dtype=float)) for t in tracks
+                        if t.is_confirmed() and t.time_since_update <= 1])
+    return timings, outputs
+
+
+def id_switches(sequence, outputs, iou_threshold=0.5):
+    """
+    Matches tracks to reference objects per frame by IoU and counts how often a reference
+    object's matched track id changes (a CLEAR-MOT style ID switch).
+    """
+    last_match = {}
+    switches = 0
+    matched_frames = 0
+    total = 0
+    for (_, _, reference), tracks in zip(sequence, outputs):
+        total += len(reference)
+        if not reference or not tracks:
+            continue
+        ious = trackers.iou_matrix(np.array([b for _, b in reference]), np.array([b for _, b in tracks]))
+        matches, _, _ = trackers.assign(1 - ious, 1 - iou_threshold)
+        for r, t in matches:
+            ref_id, track_id = reference[r][0], tracks[t][0]
+            matched_frames += 1
+            if ref_id in last_match and last_match[ref_id] != track_id:
+                switches += 1
+            last_match[ref_id] = track_id
+    return switches, (matched_frames / total if total else 0.0)
+
+
+def track_lengths(outputs):
+    """Mean number of frames each track id was seen: fragmented identities show up as short tracks."""
+    lengths = {}
+    for frame in outputs:
+        for track_id, _ in frame:
+            lengths[track_id] = lengths.get(track_id, 0) + 1
+    return float(np.mean(list(lengths.values()))) if lengths else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Hawkeye trackers")
+    parser.add_argument("--recording", help="Recording made with POST /record/start (default: synthetic scene)")
+    parser.add_argument("--video", help="Plain video file, run through YOLO (needs ultralytics)")
+    parser.add_argument("--confidence", type=float, default=0.15, help="Detection confidence threshold")
+    parser.add_argument("--trackers", default=",".join(trackers.TRACKER_TYPES))
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--people", type=int, default=15)
+    parser.add_argument("--jitter", type=float, default=2.0, help="Detection box noise in pixels (synthetic)")
+    parser.add_argument("--dropout", type=float, default=0.05, help="Fraction of missed detections (synthetic)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results JSON here")
+    args = parser.parse_args()
+
+    notes = []
+    if args.video:
+        sequence = video_sequence(args.video, args.frames, args.confidence)
+        has_frames = True
+        notes.append("no ground truth for a plain video: id switches and coverage are not scored")
+    elif args.recording:
+        sequence, has_frames = recording_sequence(args.recording, args.frames)
+        live = "the live tracker"
+        sidecar = replay_ops.settings_path(args.recording)
+        if os.path.exists(sidecar):
+            with open(sidecar) as f:
+                live = f"the live tracker ({json.load(f).get('tracker', 'unknown')})"
+        notes.append(f"reference is {live}: id switches measure agreement with it and favour that tracker")
+        if not has_frames:
+            notes.append("recording has no frames: deepsort runs on constant embeddings (motion only), "
+                         "so its cost and id switches do not represent the live tracker")
+    else:
+        sequence = synthetic_sequence(args)
+        has_frames = True
+    for note in notes:
+        print(f"  note: {note}")
+
+    detections = sum(len(d) for _, d, _ in sequence)
+    results = {}
+    for kind in [k.strip() for k in args.trackers.split(",") if k.strip()]:
+        timings, outputs = run_tracker(kind, sequence, has_frames, args.confidence)
+        switches, coverage = id_switches(sequence, outputs) if not args.video else (None, None)
+        total_s = float(np.sum(timings))
+        results[kind] = {
+            "frames": len(sequence),
+            "mean_ms": round(total_s / len(sequence) * 1000, 4),
+            "fps": round(len(sequence) / total_s, 1) if total_s else None,
+            "tracks_per_s": round(detections / total_s, 1) if total_s else None,
+            "id_switches": switches,
+            "coverage": round(coverage, 4) if coverage is not None else None,
+            "unique_ids": len({track_id for frame in outputs for track_id, _ in frame}),
+            "mean_track_frames": round(track_lengths(outputs), 1)
+        }
+        r = results[kind]
+        scores = f"id switches {r['id_switches']:>4}  coverage {r['coverage']:.3f}  " if switches is not None else ""
+        print(f"  {kind:<10} {r['mean_ms']:>8.3f} ms/frame  {r['tracks_per_s']:>10} tracks/s  "
+              f"{scores}ids {r['unique_ids']}  mean track {r['mean_track_frames']} frames")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"source": args.video or args.recording or "synthetic", "notes": notes, "results": results},
+                      f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
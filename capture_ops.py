@@ -0,0 +1,370 @@
+"""
+Video capture backends and a threaded capture with reconnect.
+
+Backends:
+- 'webcam': local camera through the platform API (V4L2 on Linux, DirectShow on Windows)
+- 'file':   video file through OpenCV, frames are never dropped
+- 'rtsp':   network stream through OpenCV's FFmpeg backend
+- 'ffmpeg': any source decoded by an ffmpeg subprocess piping raw BGR frames, with scaling and
+            frame rate reduction done inside ffmpeg
+
+ThreadedCapture grabs frames on its own thread, stamps them with source timestamps and
+reconnects with exponential backoff, so the processing loop never blocks on I/O.
+"""
+import os
+import sys
+import time
+import queue
+import shutil
+import threading
+import subprocess
+import cv2
+import numpy as np
+
+BACKENDS = ('auto', 'webcam', 'file', 'rtsp', 'ffmpeg')
+
+
+def _webcam_api():
+    if sys.platform.startswith('linux'):
+        return cv2.CAP_V4L2
+    if sys.platform == 'win32':
+        return cv2.CAP_DSHOW
+    if sys.platform == 'darwin':
+        return cv2.CAP_AVFOUNDATION
+    return cv2.CAP_ANY
+
+
+def resize_to_width(frame, max_width):
+    h, w = frame.shape[:2]
+    if not max_width or w <= max_width:
+        return frame
+    return cv2.resize(frame, (max_width, int(h * max_width / w)), interpolation=cv2.INTER_AREA)
+
+
+class OpenCVBackend:
+    """cv2.VideoCapture for webcams, files and RTSP/HTTP streams."""
+    def __init__(self, source, kind, max_width=0, start_frame=0):
+        self.source = source
+        self.kind = kind
+        self.max_width = max_width
+        self.start_frame = start_frame
+        self.cap = None
+        self.fps = 30.0
+        self.live = kind != 'file'
+        self.start_time = None
+
+    def open(self):
+        if self.kind == 'webcam':
+            self.cap = cv2.VideoCapture(int(self.source), _webcam_api())
+            if self.max_width:
+                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.max_width)
+        elif self.kind == 'rtsp':
+            self.cap = cv2.VideoCapture(self.source, cv2.CAP_FFMPEG)
+            # Keep the decoder from queueing stale frames
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        else:
+            self.cap = cv2.VideoCapture(self.source)
+
+        if not self.cap.isOpened():
+            return False
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        if self.start_frame and not self.live:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+        self.start_time = time.monotonic()
+        return True
+
+    def grab(self):
+        """Advances one frame without decoding it fully. Returns the frame timestamp or None on failure."""
+        if not self.cap.grab():
+            return None
+        pos_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        if not self.live or pos_ms > 0:
+            return pos_ms / 1000.0
+        return time.monotonic() - self.start_time
+
+    def retrieve(self):
+        ret, frame = self.cap.retrieve()
+        if not ret:
+            return None
+        return resize_to_width(frame, self.max_width)
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class FFmpegBackend:
+    """Decodes with an ffmpeg subprocess writing raw bgr24 frames to a pipe."""
+    def __init__(self, source, max_width=0, max_fps=0, live=True, start_time=0.0):
+        self.source = source
+        self.max_width = max_width
+        self.max_fps = max_fps
+        self.live = live
+        self.start_time = start_time
+        self.proc = None
+        self.fps = max_fps or 30.0
+        self.frame_idx = 0
+        self.width = self.height = None
+        self.clock_start = None
+        self.frame = None
+
+    def _probe(self):
+        """Reads the source size (and frame rate) without ffprobe by opening it once with OpenCV."""
+        cap = cv2.VideoCapture(self.source)
+        try:
+            if not cap.isOpened():
+                return False
+            w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.fps = self.max_fps or cap.get(cv2.CAP_PROP_FPS) or 30.0
+        finally:
+            cap.release()
+        if not w or not h:
+            return False
+        if self.max_width and w > self.max_width:
+            h = int(h * self.max_width / w) // 2 * 2
+            w = self.max_width
+        self.width, self.height = w, h
+        return True
+
+    def open(self):
+        if shutil.which("ffmpeg") is None:
+            print("[ERROR] ffmpeg backend selected but ffmpeg is not on PATH")
+            return False
+        if not self._probe():
+            return False
+
+        cmd = ["ffmpeg", "-loglevel", "error", "-nostdin"]
+        if str(self.source).startswith("rtsp://"):
+            cmd += ["-rtsp_transport", "tcp"]
+        if self.start_time:
+            cmd += ["-ss", str(self.start_time)]
+        cmd += ["-i", str(self.source)]
+        filters = [f"scale={self.width}:{self.height}"]
+        if self.max_fps:
+            filters.append(f"fps={self.max_fps}")
+        cmd += ["-vf", ",".join(filters), "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"]
+
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     bufsize=self.width * self.height * 3)
+        self.frame_idx = 0
+        self.clock_start = time.monotonic()
+        return True
+
+    def grab(self):
+        size = self.width * self.height * 3
+        data = self.proc.stdout.read(size)
+        if data is None or len(data) < size:
+            return None
+        self.frame = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+        self.frame_idx += 1
+        if self.live:
+            return time.monotonic() - self.clock_start
+        return self.start_time + (self.frame_idx - 1) / self.fps
+
+    def retrieve(self):
+        return self.frame
+
+    def release(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+
+def create_backend(source, kind='auto', max_width=0, max_fps=0, start_frame=0, fps_hint=30.0):
+    """Picks a backend for a source: a camera index, an rtsp/http URL or a file path."""
+    source_str = str(source)
+    if kind == 'auto':
+        if source_str.isdigit():
+            kind = 'webcam'
+        elif source_str.startswith(("rtsp://", "rtmp://", "http://", "https://")):
+            kind = 'rtsp'
+        else:
+            kind = 'file'
+
+    if kind == 'ffmpeg':
+        live = not os.path.exists(source_str)
+        start_time = start_frame / fps_hint if start_frame else 0.0
+        return FFmpegBackend(source_str, max_width=max_width, max_fps=max_fps, live=live, start_time=start_time)
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown capture backend '{kind}', expected one of {BACKENDS}")
+    return OpenCVBackend(source, kind, max_width=max_width, start_frame=start_frame)
+
+
+class ThreadedCapture:
+    """
+    Runs a backend on a dedicated grab thread.
+
+    Live sources keep only the newest frame so processing never falls behind real time.
+    Files are read through a small queue so no frame is dropped, and loop at the end with
+    timestamps that keep increasing. When a live source fails the thread reconnects with
+    exponential backoff; consumers just see no frames meanwhile (and keep their tracks).
+    A file that cannot be opened is not retried (state "failed").
+
+    Only the grab thread touches the backend, including releasing it once stopped.
+    """
+    def __init__(self, backend_factory, loop=True, max_fps=0, reconnect_initial=0.5, reconnect_max=30.0,
+                 queue_size=4):
+        self.backend_factory = backend_factory
+        self.loop = loop
+        self.max_fps = max_fps
+        self.reconnect_initial = reconnect_initial
+        self.reconnect_max = reconnect_max
+
+        self.backend = None
+        self.live = True
+        self.fps = 30.0
+        self.state = "starting"
+        self.reconnects = 0
+        self.frames_grabbed = 0
+        self.frames_dropped = 0
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.latest = None
+        # time.monotonic() at which the frame returned by the last read() was grabbed
+        self.grabbed_at = None
+        self.condition = threading.Condition()
+        self.opened = threading.Event()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            # The grab thread releases the backend on its way out (it may still be inside grab())
+            self.thread.join(timeout=2)
+
+    def status(self):
+        return {
+            "state": self.state,
+            "live": self.live,
+            "fps": round(self.fps, 2),
+            "reconnects": self.reconnects,
+            "frames_grabbed": self.frames_grabbed,
+            "frames_dropped": self.frames_dropped
+        }
+
+    def _open(self):
+        """Opens a fresh backend, backing off exponentially until it works or we are stopped."""
+        delay = self.reconnect_initial
+        while self.running:
+            backend = self.backend_factory()
+            if backend.open():
+                self.backend = backend
+                self.live = backend.live
+                self.fps = backend.fps
+                self.state = "running"
+                self.opened.set()
+                print(f"[DEBUG] Capture opened: {getattr(backend, 'source', '')}")
+                return True
+            backend.release()
+            if not backend.live:
+                # A missing or unreadable file will not appear by retrying
+                self.state = "failed"
+                print(f"[ERROR] Failed to open video file: {getattr(backend, 'source', '')}")
+                return False
+            self.state = "reconnecting"
+            print(f"[ERROR] Failed to open capture, retrying in {delay:.1f}s")
+            self._sleep(delay)
+            delay = min(delay * 2, self.reconnect_max)
+        return False
+
+    def _sleep(self, seconds):
+        with self.condition:
+            self.condition.wait_for(lambda: not self.running, timeout=seconds)
+
+    def _publish(self, frame, timestamp, grabbed_at):
+        if self.live:
+            with self.condition:
+                if self.latest is not None:
+                    self.frames_dropped += 1
+                self.latest = (frame, timestamp, grabbed_at)
+                self.condition.notify_all()
+        else:
+            while self.running:
+                try:
+                    self.frames.put((frame, timestamp, grabbed_at), timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+    def _run(self):
+        try:
+            self._grab_loop()
+        finally:
+            if self.backend is not None:
+                self.backend.release()
+                self.backend = None
+
+    def _grab_loop(self):
+        offset = 0.0
+        last_ts = None
+        last_emitted = None
+        if not self._open():
+            return
+
+        while self.running:
+            timestamp = self.backend.grab()
+            grabbed_at = time.monotonic()
+            if timestamp is None:
+                self.backend.release()
+                if not self.live and not self.loop:
+                    self.state = "ended"
+                    return
+                if self.live:
+                    self.reconnects += 1
+                    self.state = "reconnecting"
+                    print("[DEBUG] Capture read failed, reconnecting...")
+                # Files start over at the end, live sources reconnect
+                last_emitted = None
+                if not self._open():
+                    return
+                continue
+
+            # Keep timestamps increasing when the source clock restarts (file loop, reconnect)
+            timestamp += offset
+            if last_ts is not None and timestamp <= last_ts:
+                offset += last_ts - timestamp + 1.0 / self.fps
+                timestamp = last_ts + 1.0 / self.fps
+            last_ts = timestamp
+            self.frames_grabbed += 1
+
+            # Frame rate cap: skipped frames are grabbed but never decoded into an image
+            if self.max_fps and last_emitted is not None and timestamp - last_emitted < 1.0 / self.max_fps - 1e-6:
+                continue
+            frame = self.backend.retrieve()
+            if frame is None:
+                continue
+            last_emitted = timestamp
+            self._publish(frame, timestamp, grabbed_at)
+
+        self.state = "stopped"
+
+    def read(self, timeout=1.0):
+        """Returns (frame, source_timestamp_seconds), or (None, None) if nothing arrived in time."""
+        # Live/file mode is only known once the first backend opened
+        if not self.opened.wait(timeout):
+            return None, None
+        if self.live:
+            with self.condition:
+                if self.latest is None:
+                    self.condition.wait(timeout=timeout)
+                item, self.latest = self.latest, None
+        else:
+            try:
+                item = self.frames.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+        if item is None:
+            return None, None
+        frame, timestamp, self.grabbed_at = item
+        return frame, timestamp
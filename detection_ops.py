@@ -2,9 +2,7 @@ import cv2
 import numpy as np
 import torch
 from PIL import Image
-import os
-import uuid
-from backend import database
+from backend import face_store
 
 # --- Colors ---
 MAROON = (0, 0, 128)      
@@ -12,6 +10,21 @@ RED_ALERT = (0, 0, 255)
 ZONE_COLOR = (0, 0, 255)  
 GREEN_SAFE = (0, 255, 0)
 
+def extract_person_detections(results):
+    """Converts YOLO results into DeepSort raw detections ([[x, y, w, h], conf, cls])."""
+    detections_list = []
+    for result in results:
+        boxes = result.boxes.cpu().numpy()
+        for box in boxes:
+            x1, y1, x2, y2 = box.xyxy[0]
+            conf = box.conf[0]
+            cls_id = int(box.cls[0])
+            if cls_id == 0: # Person
+                w = x2 - x1
+                h = y2 - y1
+                detections_list.append([[x1, y1, w, h], conf, 0])
+    return detections_list
+
 def check_trespassing(bbox, zone_coords):
     x1, y1, x2, y2 = bbox
     # Check if the "feet" are in the zone
@@ -25,18 +38,56 @@ def check_trespassing(bbox, zone_coords):
     return min_x < foot_x < max_x and min_y < foot_y < max_y
 
 def check_loitering(track_id, center_point, track_history, current_time, threshold):
-    if track_id not in track_history:
-        track_history[track_id].append((current_time, center_point))
+    # Only the first and the latest sighting are kept, so the history stays two entries per track
+    history = track_history[track_id]
+    if not history:
+        history.append((current_time, center_point))
         return False
-    
-    first_time = track_history[track_id][0][0]
-    duration = current_time - first_time
-    track_history[track_id].append((current_time, center_point))
+
+    if len(history) < 2:
+        history.append((current_time, center_point))
+    else:
+        history[1] = (current_time, center_point)
+    duration = current_time - history[0][0]
 
     if duration > threshold:
         return True
     return False
 
+# --- Face Preprocessing ---
+# Shared by live recognition, single enrollment and bulk import so embeddings are comparable.
+FACE_SIZE = 160
+MIN_FACE_SIZE = 20
+
+def preprocess_face(face_img):
+    """Face crop (PIL image or RGB array) -> (3, 160, 160) float tensor with FaceNet's (x - 127.5) / 128 normalization."""
+    if not isinstance(face_img, Image.Image):
+        face_img = Image.fromarray(face_img)
+    face = np.array(face_img.convert('RGB').resize((FACE_SIZE, FACE_SIZE)))
+    face_tensor = torch.from_numpy(face).permute(2, 0, 1).float()
+    return (face_tensor - 127.5) / 128.0
+
+def detect_largest_face(mtcnn, image):
+    """Returns the crop of the largest face MTCNN finds in a PIL image, or None."""
+    boxes, _ = mtcnn.detect(image)
+    if boxes is None:
+        return None
+    areas = [(fx2 - fx1) * (fy2 - fy1) for fx1, fy1, fx2, fy2 in boxes]
+    fx1, fy1, fx2, fy2 = boxes[int(np.argmax(areas))]
+    if (fx2 - fx1) < MIN_FACE_SIZE or (fy2 - fy1) < MIN_FACE_SIZE:
+        return None
+    return image.crop((fx1, fy1, fx2, fy2))
+
+def embed_faces(resnet, face_tensors, device):
+    """Embeds a list of preprocessed face tensors in one batch. Returns an (n, 512) array."""
+    with torch.no_grad():
+        return resnet(torch.stack(face_tensors).to(device)).detach().cpu().numpy()
+
+def average_embedding(embeddings):
+    """Averages several embeddings of one person into a template, re-normalized like a single FaceNet embedding."""
+    embedding = np.mean(embeddings, axis=0)
+    return embedding / (np.linalg.norm(embedding) or 1.0)
+
 def recognize_frame_faces(frame, tracks, mtcnn, resnet, known_faces, device, saved_untrusted=None):
     """
     frame: cv2 image (BGR)
@@ -73,7 +124,7 @@ def recognize_frame_faces(frame, tracks, mtcnn, resnet, known_faces, device, sav
         
         # Detect face in person crop
         try:
-            boxes, _ = mtcnn.detect(person_crop)
+            boxes, probs = mtcnn.detect(person_crop)
         except (ValueError, RuntimeError, IndexError):
             continue
         except Exception as e:
@@ -81,23 +132,18 @@ def recognize_frame_faces(frame, tracks, mtcnn, resnet, known_faces, device, sav
             continue
         
         if boxes is not None:
-            for box in boxes:
+            for box, prob in zip(boxes, probs if probs is not None else [None] * len(boxes)):
                 fx1, fy1, fx2, fy2 = box
                 
                 # Check face resolution
-                if (fx2-fx1) < 20 or (fy2-fy1) < 20: 
+                if (fx2-fx1) < MIN_FACE_SIZE or (fy2-fy1) < MIN_FACE_SIZE: 
                     continue
                 
                 # Manual crop for embedding
                 face_crop_pil = person_crop.crop((fx1, fy1, fx2, fy2))
                 
                 try:
-                    face_tensor = torch.from_numpy(np.array(face_crop_pil.resize((160, 160)))).permute(2, 0, 1).float()
-                    face_tensor = (face_tensor - 127.5) / 128.0 # Standard normalization for facenet
-                    face_tensor = face_tensor.unsqueeze(0).to(device)
-                    
-                    with torch.no_grad():
-                        embedding = resnet(face_tensor).detach().cpu().numpy()[0]
+                    embedding = embed_faces(resnet, [preprocess_face(face_crop_pil)], device)[0]
                     
                     # Compare with known faces
                     name = "Unknown"
@@ -119,19 +165,18 @@ def recognize_frame_faces(frame, tracks, mtcnn, resnet, known_faces, device, sav
                     abs_fy2 = int(y1 + fy2)
                     
                     results.append({
+                        "track_id": track.track_id,
                         "box": (abs_fx1, abs_fy1, abs_fx2, abs_fy2),
                         "name": name,
                         "trusted": is_trusted
                     })
 
-                    # Handle Untrusted Capture
+                    # Handle Untrusted Capture: one sighting per track, merged into a cluster when seen before
                     if not is_trusted:
                         if track.track_id not in saved_untrusted:
-                            filename = f"capture_{uuid.uuid4().hex}.jpg"
-                            fpath = os.path.join("backend/captured_faces", filename)
-                            save_img = cv2.cvtColor(np.array(face_crop_pil), cv2.COLOR_RGB2BGR)
-                            cv2.imwrite(fpath, save_img)
-                            database.log_untrusted_face(filename)
+                            face_store.get_store().add(
+                                embedding, face_crop_pil, face_store.face_quality(face_crop_pil, prob)
+                            )
                             saved_untrusted.add(track.track_id)
 
                 except Exception as e:
@@ -140,31 +185,62 @@ def recognize_frame_faces(frame, tracks, mtcnn, resnet, known_faces, device, sav
 
     return results, saved_untrusted
 
+# --- Face Recognition Triggers ---
+# Lower runs first. Tracks that match no enabled trigger are never sent to the face pipeline.
+PRIORITY_TRESPASSING = 0
+PRIORITY_LOITERING = 1
+PRIORITY_NEW = 2
+
+def select_face_tracks(candidates, face_state, current_time, settings):
+    """
+    candidates: list of (track, area, trespassing, loitering) for this frame
+    face_state: track_id -> {'checked': time, 'name': str or None, 'trusted': bool or None,
+                             'offset': face box relative to the track box's top-left, or None}
+    Returns the tracks to run face recognition on, by priority and capped at settings['face_budget'].
+    Person box area stands in for face size, which isn't known before detection.
+    """
+    recheck_interval = settings.get('face_recheck_interval', 5)
+    chosen = []
+    for track, area, trespassing, loitering in candidates:
+        # Same rule as recognize_frame_faces, so tracks it would skip don't use up the budget
+        if not track.is_confirmed() or track.time_since_update > 1:
+            continue
+        state = face_state.get(track.track_id)
+        identified = state is not None and state['name'] is not None
+
+        if identified and current_time - state['checked'] < recheck_interval:
+            continue
+
+        if trespassing and settings.get('face_trigger_zone', True):
+            priority = PRIORITY_TRESPASSING
+        elif loitering and settings.get('face_trigger_loitering', True):
+            priority = PRIORITY_LOITERING
+        elif not identified and settings.get('face_trigger_new', True):
+            priority = PRIORITY_NEW
+        else:
+            continue
+
+        # Within a priority, least recently tried first so no track starves, then largest first
+        last_checked = state['checked'] if state else float('-inf')
+        chosen.append((priority, last_checked, -area, track))
+
+    chosen.sort(key=lambda c: c[:3])
+    return [track for _, _, _, track in chosen[:settings.get('face_budget', 4)]]
+
 def process_frame_annotations(frame, tracks, current_time, track_history, loitering_saved, settings, 
-                              mtcnn=None, resnet=None, known_faces=None, device='cpu', saved_untrusted_session=None):
-    
-    annotated_frame = frame.copy()
+                              mtcnn=None, resnet=None, known_faces=None, device='cpu', saved_untrusted_session=None,
+                              draw=True, face_state=None):
+    """
+    Runs the anomaly checks for one frame and draws them.
+    With draw=False only the alerts are computed and the input frame is returned untouched (used by replay).
+    face_state persists per-track face results between frames (see select_face_tracks).
+    """
     
     # Initialize saved_untrusted_session if None
     if saved_untrusted_session is None:
         saved_untrusted_session = set()
-
-    # 1. Draw Restricted Zone
-    if settings['trespassing_enabled']:
-        tz = settings['trespassing_zone']
-        # Normalize for drawing
-        x_min, x_max = min(tz[0], tz[2]), max(tz[0], tz[2])
-        y_min, y_max = min(tz[1], tz[3]), max(tz[1], tz[3])
-        
-        overlay = annotated_frame.copy()
-        cv2.rectangle(overlay, (x_min, y_min), (x_max, y_max), ZONE_COLOR, -1)
-        
-        alpha = 0.3
-        cv2.addWeighted(overlay, alpha, annotated_frame, 1 - alpha, 0, annotated_frame)
-        
-        cv2.rectangle(annotated_frame, (x_min, y_min), (x_max, y_max), MAROON, 2)
-        cv2.putText(annotated_frame, "Restricted Zone", (x_min, y_min-10), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, MAROON, 2)
+    if face_state is None:
+        face_state = {}
 
     frame_alerts = {
         'count': 0,
@@ -174,17 +250,7 @@ def process_frame_annotations(frame, tracks, current_time, track_history, loiter
         'untrusted_face': False 
     }
 
-    # Run Face Recognition if models provided
-    face_results = []
-    if mtcnn and resnet:
-        face_results, saved_untrusted_session = recognize_frame_faces(
-            frame, tracks, mtcnn, resnet, known_faces, device, saved_untrusted_session
-        )
-        # Check if any face is untrusted
-        for res in face_results:
-            if not res['trusted']:
-                frame_alerts['untrusted_face'] = True
-
+    face_candidates = []
     for track in tracks:
         if not track.is_confirmed() and track.time_since_update > 1:
             continue
@@ -196,21 +262,84 @@ def process_frame_annotations(frame, tracks, current_time, track_history, loiter
         x1, y1, x2, y2 = int(ltrb[0]), int(ltrb[1]), int(ltrb[2]), int(ltrb[3])
         bbox = (x1, y1, x2, y2)
         center = (int((x1+x2)/2), int((y1+y2)/2))
+        trespassing = loitering = False
 
         # Check Trespassing
         if settings['trespassing_enabled'] and check_trespassing(bbox, settings['trespassing_zone']):
             frame_alerts['trespassing'] = True
+            trespassing = True
 
         # Check Loitering
         if settings['loitering_enabled']:
             if check_loitering(track_id, center, track_history, current_time, settings['loitering_threshold']):
                 frame_alerts['loitering'] = True
                 loitering_saved[track_id] = True
+                loitering = True
+
+        face_candidates.append((track, (x2 - x1) * (y2 - y1), trespassing, loitering))
+
+    # Forget the loitering history of tracks the tracker has dropped
+    if len(track_history) > len(tracks):
+        live_ids = {track.track_id for track in tracks}
+        for track_id in [tid for tid in track_history if tid not in live_ids]:
+            del track_history[track_id]
+
+    # Run Face Recognition if models provided, only on triggered tracks within the frame budget
+    face_results = []
+    if mtcnn and resnet:
+        face_tracks = select_face_tracks(face_candidates, face_state, current_time, settings)
+        if face_tracks:
+            face_results, saved_untrusted_session = recognize_frame_faces(
+                frame, face_tracks, mtcnn, resnet, known_faces, device, saved_untrusted_session
+            )
+        for track in face_tracks:
+            previous = face_state.get(track.track_id)
+            face_state[track.track_id] = {
+                'checked': current_time,
+                'name': previous['name'] if previous else None,
+                'trusted': previous['trusted'] if previous else None,
+                'offset': previous['offset'] if previous else None
+            }
+        track_tops = {track.track_id: track.to_ltrb()[:2] for track in face_tracks}
+        for res in face_results:
+            tx, ty = track_tops[res['track_id']]
+            fx1, fy1, fx2, fy2 = res['box']
+            face_state[res['track_id']].update(name=res['name'], trusted=res['trusted'],
+                                               offset=(fx1 - tx, fy1 - ty, fx2 - tx, fy2 - ty))
+            # Check if any face is untrusted
+            if not res['trusted']:
+                frame_alerts['untrusted_face'] = True
+
+        # Forget tracks the tracker has dropped
+        live_ids = {track.track_id for track in tracks}
+        for track_id in [tid for tid in face_state if tid not in live_ids]:
+            del face_state[track_id]
     
     # Check crowd
     if settings['crowd_enabled'] and frame_alerts['count'] > settings['crowd_threshold']:
         frame_alerts['crowd'] = True
 
+    if not draw:
+        return frame, frame_alerts, saved_untrusted_session
+
+    annotated_frame = frame.copy()
+
+    # 1. Draw Restricted Zone
+    if settings['trespassing_enabled']:
+        tz = settings['trespassing_zone']
+        # Normalize for drawing
+        x_min, x_max = min(tz[0], tz[2]), max(tz[0], tz[2])
+        y_min, y_max = min(tz[1], tz[3]), max(tz[1], tz[3])
+        
+        overlay = annotated_frame.copy()
+        cv2.rectangle(overlay, (x_min, y_min), (x_max, y_max), ZONE_COLOR, -1)
+        
+        alpha = 0.3
+        cv2.addWeighted(overlay, alpha, annotated_frame, 1 - alpha, 0, annotated_frame)
+        
+        cv2.rectangle(annotated_frame, (x_min, y_min), (x_max, y_max), MAROON, 2)
+        cv2.putText(annotated_frame, "Restricted Zone", (x_min, y_min-10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, MAROON, 2)
 
     # Draw Stats
     y_pos = 20
@@ -232,11 +361,18 @@ def process_frame_annotations(frame, tracks, current_time, track_history, loiter
         cv2.putText(annotated_frame, "Trespassing Alert!", (10, y_pos), 
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, RED_ALERT, 2)
     
-    # Draw Faces
-    for res in face_results:
-        fx1, fy1, fx2, fy2 = res['box']
-        color = GREEN_SAFE if res['trusted'] else RED_ALERT
-        label = res['name']
+    # Draw Faces: this frame's results, and between checks the last result moved along with its track
+    face_boxes = [(res['box'], res['name'], res['trusted']) for res in face_results]
+    recognized = {res['track_id'] for res in face_results}
+    for track, _, _, _ in face_candidates:
+        state = face_state.get(track.track_id)
+        if track.track_id in recognized or state is None or state['name'] is None:
+            continue
+        tx, ty = track.to_ltrb()[:2]
+        ox1, oy1, ox2, oy2 = state['offset']
+        face_boxes.append(((int(tx + ox1), int(ty + oy1), int(tx + ox2), int(ty + oy2)), state['name'], state['trusted']))
+    for (fx1, fy1, fx2, fy2), label, trusted in face_boxes:
+        color = GREEN_SAFE if trusted else RED_ALERT
         cv2.rectangle(annotated_frame, (fx1, fy1), (fx2, fy2), color, 2)
         cv2.putText(annotated_frame, label, (fx1, fy1-10), 
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
@@ -1,11 +1,10 @@
 import os
 import cv2
 import torch
-import numpy as np
-from PIL import Image
 from mtcnn import MTCNN
 from facenet_pytorch import InceptionResnetV1
 import streamlit as st
+import detection_ops
 
 TRUSTED_FACES_DIR = "trusted_faces"
 OUTPUT_DIR = "detected_faces_facenet"
@@ -19,8 +18,8 @@ def init_face_models():
     return detector, facenet
 
 def get_face_embedding(face_image, facenet_model):
-    face_image = Image.fromarray(face_image).resize((160, 160))
-    face_tensor = torch.tensor(np.array(face_image)).permute(2, 0, 1).float().unsqueeze(0) / 255.0
+    # Same preprocessing as the live pipeline so embeddings are comparable
+    face_tensor = detection_ops.preprocess_face(face_image).unsqueeze(0)
     with torch.no_grad():
         embedding = facenet_model(face_tensor)
     return embedding
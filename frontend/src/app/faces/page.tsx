@@ -4,13 +4,15 @@ import { useEffect, useState } from "react";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Trash2, UserPlus, ShieldAlert, ShieldCheck } from "lucide-react";
-import { TrustedFace, UntrustedFace } from "@/types";
+import { TrustedFace, UntrustedFace, Page } from "@/types";
 
 const API_URL = "http://localhost:8000";
 
 export default function TrustedFacesPage() {
     const [trustedFaces, setTrustedFaces] = useState<TrustedFace[]>([]);
     const [untrustedFaces, setUntrustedFaces] = useState<UntrustedFace[]>([]);
+    const [trustedCursor, setTrustedCursor] = useState<Page<TrustedFace>["next_cursor"]>(null);
+    const [untrustedCursor, setUntrustedCursor] = useState<Page<UntrustedFace>["next_cursor"]>(null);
     const [uploading, setUploading] = useState(false);
     const [newName, setNewName] = useState("");
 
@@ -19,8 +21,37 @@ export default function TrustedFacesPage() {
             const trustedRes = await fetch(`${API_URL}/trusted`);
             const untrustedRes = await fetch(`${API_URL}/untrusted`);
 
-            if (trustedRes.ok) setTrustedFaces(await trustedRes.json());
-            if (untrustedRes.ok) setUntrustedFaces(await untrustedRes.json());
+            if (trustedRes.ok) {
+                const page: Page<TrustedFace> = await trustedRes.json();
+                setTrustedFaces(page.items);
+                setTrustedCursor(page.next_cursor);
+            }
+            if (untrustedRes.ok) {
+                const page: Page<UntrustedFace> = await untrustedRes.json();
+                setUntrustedFaces(page.items);
+                setUntrustedCursor(page.next_cursor);
+            }
+        } catch (e) {
+            console.error("Failed to fetch faces", e);
+        }
+    };
+
+    // Next page of a listing (keyset cursor from the previous page)
+    const loadMore = async (kind: "trusted" | "untrusted") => {
+        const cursor = kind === "trusted" ? trustedCursor : untrustedCursor;
+        if (cursor === null) return;
+        try {
+            const res = await fetch(`${API_URL}/${kind}?before=${encodeURIComponent(String(cursor))}`);
+            if (!res.ok) return;
+            if (kind === "trusted") {
+                const page: Page<TrustedFace> = await res.json();
+                setTrustedFaces(prev => [...prev, ...page.items]);
+                setTrustedCursor(page.next_cursor);
+            } else {
+                const page: Page<UntrustedFace> = await res.json();
+                setUntrustedFaces(prev => [...prev, ...page.items]);
+                setUntrustedCursor(page.next_cursor);
+            }
         } catch (e) {
             console.error("Failed to fetch faces", e);
         }
@@ -45,6 +76,8 @@ export default function TrustedFacesPage() {
                 // Reset form
                 (e.target as HTMLFormElement).reset();
                 fetchFaces();
+            } else if (res.status === 429) {
+                alert("Face enrollment is busy, please retry in a few seconds.");
             }
         } catch (error) {
             console.error("Upload error", error);
@@ -92,11 +125,12 @@ export default function TrustedFacesPage() {
                                 />
                             </div>
                             <div className="flex-1">
-                                <label className="block text-xs font-mono text-primary mb-1">PHOTO</label>
+                                <label className="block text-xs font-mono text-primary mb-1">PHOTOS</label>
                                 <input
-                                    name="file"
+                                    name="files"
                                     type="file"
                                     required
+                                    multiple
                                     accept="image/*"
                                     className="block w-full text-sm text-slate-500
                                   file:mr-4 file:py-2 file:px-4
@@ -120,7 +154,9 @@ export default function TrustedFacesPage() {
                                 <div key={face.id} className="relative group overflow-hidden rounded-lg border border-zinc-800 bg-zinc-900">
                                     {/* eslint-disable-next-line @next/next/no-img-element */}
                                     <img
-                                        src={`${API_URL}/trusted_faces/${face.image_path.split(/[/\\]/).pop()}`}
+                                        src={`${API_URL}${face.thumb_url}`}
+                                        srcSet={`${API_URL}${face.thumb_url} 1x, ${API_URL}${face.thumb_url_2x} 2x`}
+                                        loading="lazy"
                                         alt={face.name}
                                         className="w-full h-32 object-cover opacity-80 group-hover:opacity-100 transition-opacity"
                                     />
@@ -138,6 +174,11 @@ export default function TrustedFacesPage() {
                                 </div>
                             )}
                         </div>
+                        {trustedCursor !== null && (
+                            <Button variant="ghost" size="sm" className="w-full mt-4" onClick={() => loadMore("trusted")}>
+                                Load more
+                            </Button>
+                        )}
                     </CardContent>
                 </Card>
 
@@ -154,16 +195,23 @@ export default function TrustedFacesPage() {
                                 <div key={face.id} className="relative group overflow-hidden rounded-lg border border-destructive/30 bg-black">
                                     {/* eslint-disable-next-line @next/next/no-img-element */}
                                     <img
-                                        src={`${API_URL}/captured_faces/${face.image_path}`}
+                                        src={`${API_URL}${face.thumb_url}`}
+                                        srcSet={`${API_URL}${face.thumb_url} 1x, ${API_URL}${face.thumb_url_2x} 2x`}
+                                        loading="lazy"
                                         alt="Intruder"
                                         className="w-full h-32 object-cover grayscale group-hover:grayscale-0 transition-all"
                                     />
                                     <div className="absolute top-2 right-2 bg-destructive text-white text-[10px] px-2 py-0.5 rounded-full font-mono">
                                         UNKNOWN
                                     </div>
+                                    {face.sightings > 1 && (
+                                        <div className="absolute top-2 left-2 bg-black/80 text-white text-[10px] px-2 py-0.5 rounded-full font-mono">
+                                            SEEN {face.sightings}x
+                                        </div>
+                                    )}
                                     <div className="absolute bottom-0 left-0 right-0 bg-black/80 p-2">
-                                        <span className="text-[10px] font-mono text-zinc-400 block">{new Date(face.timestamp).toLocaleDateString()}</span>
-                                        <span className="text-[10px] font-mono text-zinc-300 block">{new Date(face.timestamp).toLocaleTimeString()}</span>
+                                        <span className="text-[10px] font-mono text-zinc-400 block">{new Date(face.last_seen).toLocaleDateString()}</span>
+                                        <span className="text-[10px] font-mono text-zinc-300 block">{new Date(face.last_seen).toLocaleTimeString()}</span>
                                     </div>
                                 </div>
                             ))}
@@ -173,6 +221,11 @@ export default function TrustedFacesPage() {
                                 </div>
                             )}
                         </div>
+                        {untrustedCursor !== null && (
+                            <Button variant="ghost" size="sm" className="w-full mt-4" onClick={() => loadMore("untrusted")}>
+                                Load more
+                            </Button>
+                        )}
                     </CardContent>
                 </Card>
             </div>
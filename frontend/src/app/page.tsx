@@ -8,16 +8,18 @@ import { useInterval } from "@/hooks/use-interval";
 import { AlertTriangle, Users, Activity, Upload, Video } from "lucide-react";
 import { Button } from "@/components/ui/button";
 import { Card, CardContent, CardHeader, CardTitle, CardDescription } from "@/components/ui/card";
-import { Settings, APIResponse } from "@/types";
+import { Settings, APIResponse, OccupancyMinute } from "@/types";
 
 const POLLING_RATE = 1000; // 1s
 const API_URL = "http://localhost:8000";
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024; // 8MB
+const ANALYTICS_POLLING_RATE = 30000; // 30s, the series is per minute
 
 interface DashboardState {
   occupancy: number;
   peakOccupancy: number;
   totalAlerts: number;
-  alerts: { type: string; message: string; time: string }[];
+  alerts: { type: string; message: string; time: string; clip?: string }[];
 }
 
 export default function Dashboard() {
@@ -32,6 +34,20 @@ export default function Dashboard() {
 
   const [occupancyHistory, setOccupancyHistory] = useState<{ time: string; count: number }[]>([]);
   const [showAllAlerts, setShowAllAlerts] = useState(false);
+  const [minuteHistory, setMinuteHistory] = useState<OccupancyMinute[]>([]);
+
+  const fetchMinuteHistory = () => {
+    fetch(`${API_URL}/analytics/occupancy?minutes=60`, { cache: 'no-store' })
+      .then(res => {
+        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
+        return res.json();
+      })
+      .then(data => setMinuteHistory(data))
+      .catch(err => console.error("[ERROR] Failed to fetch occupancy analytics:", err));
+  };
+
+  useEffect(fetchMinuteHistory, []);
+  useInterval(fetchMinuteHistory, ANALYTICS_POLLING_RATE);
 
   useInterval(() => {
     fetch(`${API_URL}/stats?t=${Date.now()}`, { cache: 'no-store' })
@@ -79,22 +95,52 @@ export default function Dashboard() {
   const handleFileUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
     if (!e.target.files?.[0]) return;
     const file = e.target.files[0];
-    const formData = new FormData();
-    formData.append("file", file);
 
     // Switch to upload mode and optimistic update
     setSourceType("upload");
 
     try {
-      const res = await fetch(`${API_URL}/upload_video`, {
-        method: "POST",
-        body: formData
-      });
+      // Resumable chunked upload: create a session, PUT chunks at the server's offset, then complete
+      const initData = new FormData();
+      initData.append("filename", file.name);
+      initData.append("size", String(file.size));
+      const initRes = await fetch(`${API_URL}/uploads`, { method: "POST", body: initData });
+      if (!initRes.ok) throw new Error(`Upload init failed: ${initRes.statusText}`);
+      const { upload_id } = await initRes.json();
+
+      let offset = 0;
+      let retries = 0;
+      while (offset < file.size) {
+        const chunk = file.slice(offset, offset + UPLOAD_CHUNK_SIZE);
+        let res: Response;
+        try {
+          res = await fetch(`${API_URL}/uploads/${upload_id}?offset=${offset}`, { method: "PUT", body: chunk });
+        } catch (err) {
+          // Network error: ask the server how much it kept and resume from there
+          if (++retries > 5) throw err;
+          await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+          const status = await (await fetch(`${API_URL}/uploads/${upload_id}`)).json();
+          offset = status.offset;
+          continue;
+        }
+        const data = await res.json();
+        if (res.ok) {
+          offset = data.offset;
+          retries = 0;
+        } else if (res.status === 409) {
+          const status = await (await fetch(`${API_URL}/uploads/${upload_id}`)).json();
+          offset = status.offset;
+        } else {
+          throw new Error(data.detail || res.statusText);
+        }
+      }
+
+      const res = await fetch(`${API_URL}/uploads/${upload_id}/complete`, { method: "POST", body: new FormData() });
       if (res.ok) {
         console.log("[DEBUG] Video uploaded successfully");
       } else {
         const errorData = await res.json();
-        console.error("[ERROR] Upload failed:", errorData.message || res.statusText);
+        console.error("[ERROR] Upload failed:", errorData.detail || res.statusText);
       }
     } catch (e) {
       console.error("Upload failed", e);
@@ -172,6 +218,19 @@ export default function Dashboard() {
             </CardContent>
           </Card>
 
+          {/* Per-minute average from the server-side analytics */}
+          <Card className="col-span-3">
+            <CardHeader>
+              <CardTitle>Occupancy per Minute</CardTitle>
+              <CardDescription>Average people count over the last hour.</CardDescription>
+            </CardHeader>
+            <CardContent>
+              <div className="h-[200px] w-full">
+                <AnalyticsChart data={minuteHistory} title="Last 60 minutes" />
+              </div>
+            </CardContent>
+          </Card>
+
           {/* Recent Alerts Card */}
           <Card className="col-span-1 md:col-span-2 lg:col-span-1 border-zinc-800 bg-zinc-950/50 backdrop-blur">
             <CardHeader>
@@ -191,6 +250,11 @@ export default function Dashboard() {
                     <div className="flex-1 space-y-1">
                       <p className="text-sm font-medium leading-none text-zinc-200">{alert.message}</p>
                       <p className="text-xs text-zinc-500 font-mono">{alert.time}</p>
+                      {alert.clip && (
+                        <a href={`${API_URL}${alert.clip}`} target="_blank" rel="noreferrer" className="text-xs text-blue-400 hover:underline">
+                          Download clip
+                        </a>
+                      )}
                     </div>
                   </div>
                 ))}
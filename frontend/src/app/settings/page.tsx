@@ -129,6 +129,56 @@ export default function SettingsPage() {
                             checked={settings.trespassing_enabled}
                             onCheckedChange={(c) => setSettings({ ...settings, trespassing_enabled: c })}
                         />
+                        <Toggle
+                            label="Motion-Only Tracker (Faster)"
+                            checked={settings.tracker === "iou"}
+                            onCheckedChange={(c) => setSettings({ ...settings, tracker: c ? "iou" : "deepsort" })}
+                        />
+                        <Toggle
+                            label="Adaptive Quality (Hold Target FPS)"
+                            checked={settings.qos_enabled}
+                            onCheckedChange={(c) => setSettings({ ...settings, qos_enabled: c })}
+                        />
+                        {settings.qos_enabled && (
+                            <Slider
+                                label="Target FPS"
+                                value={settings.qos_target_fps}
+                                min={1} max={30} step={1}
+                                onChange={(v) => setSettings({ ...settings, qos_target_fps: v })}
+                            />
+                        )}
+                    </CardContent>
+                </Card>
+
+                <Card>
+                    <CardHeader>
+                        <CardTitle>Face Recognition Triggers</CardTitle>
+                        <CardDescription>Only people matching a trigger are checked, up to the per-frame budget.</CardDescription>
+                    </CardHeader>
+                    <CardContent className="space-y-6">
+                        <div className="grid gap-4 md:grid-cols-3">
+                            <Toggle
+                                label="Trespassers"
+                                checked={settings.face_trigger_zone}
+                                onCheckedChange={(c) => setSettings({ ...settings, face_trigger_zone: c })}
+                            />
+                            <Toggle
+                                label="Loiterers"
+                                checked={settings.face_trigger_loitering}
+                                onCheckedChange={(c) => setSettings({ ...settings, face_trigger_loitering: c })}
+                            />
+                            <Toggle
+                                label="New / Unidentified"
+                                checked={settings.face_trigger_new}
+                                onCheckedChange={(c) => setSettings({ ...settings, face_trigger_new: c })}
+                            />
+                        </div>
+                        <Slider
+                            label="Faces Checked Per Frame"
+                            value={settings.face_budget}
+                            min={1} max={16} step={1}
+                            onChange={(v) => setSettings({ ...settings, face_budget: v })}
+                        />
                     </CardContent>
                 </Card>
 
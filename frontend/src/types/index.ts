@@ -6,19 +6,51 @@ export interface Settings {
     trespassing_enabled: boolean;
     loitering_enabled: boolean;
     crowd_enabled: boolean;
+    tracker: "deepsort" | "iou";
+    face_trigger_loitering: boolean;
+    face_trigger_zone: boolean;
+    face_trigger_new: boolean;
+    face_budget: number;
+    face_recheck_interval: number;
+    capture_backend: "auto" | "webcam" | "file" | "rtsp" | "ffmpeg";
+    capture_max_fps: number;
+    capture_max_width: number;
+    clips_enabled: boolean;
+    clip_pre_seconds: number;
+    clip_post_seconds: number;
+    qos_enabled: boolean;
+    qos_target_fps: number;
 }
 
-export interface TrustedFace {
+export interface FaceImageUrls {
+    image_url: string;
+    thumb_url: string;
+    thumb_url_2x: string;
+}
+
+export interface TrustedFace extends FaceImageUrls {
     id: number;
     name: string;
-    embedding: number[];
     image_path: string;
 }
 
-export interface UntrustedFace {
+export interface UntrustedFace extends FaceImageUrls {
     id: number;
     image_path: string;
     timestamp: string;
+    sightings: number;
+    last_seen: string;
+}
+
+export interface Page<T> {
+    items: T[];
+    next_cursor: string | number | null;
+}
+
+export interface OccupancyMinute {
+    time: string;
+    count: number;
+    max: number;
 }
 
 export interface APIResponse {
@@ -0,0 +1,303 @@
+"""
+Record / replay of the detection pipeline.
+
+A recording is an append-only binary file: a fixed file header followed by one record per frame
+holding the person detections, confirmed tracks, alert flags and (optionally) the JPEG frame.
+Records are read back through mmap without copying, so detections can be fed straight into a
+tracker and process_frame_annotations without running YOLO.
+
+    python replay_ops.py info recordings/session.hkr
+    python replay_ops.py replay recordings/session.hkr --tracker iou --compare
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict, namedtuple
+
+import cv2
+import numpy as np
+
+import detection_ops
+import trackers
+
+MAGIC = b'HKREC\x00'
+VERSION = 1
+
+# magic, version, width, height, fps (padded to 32 bytes)
+FILE_HEADER = struct.Struct('<6sHIIf12x')
+# tag, frame_idx, timestamp, n_dets, n_tracks, alert_flags, count, frame_len
+RECORD_HEADER = struct.Struct('<4sIdHHHHI')
+RECORD_TAG = b'HKFR'
+
+DETECTION_DTYPE = np.dtype([('ltrb', '<f4', 4), ('conf', '<f4')])
+TRACK_DTYPE = np.dtype([('id', '<i4'), ('ltrb', '<f4', 4)])
+
+ALERT_FLAGS = {
+    'trespassing': 1,
+    'loitering': 2,
+    'crowd': 4,
+    'untrusted_face': 8
+}
+# Set on frames where detection was skipped (QoS detect_stride) and the previous detections and
+# tracks were reused; replay must not feed them to the tracker again
+REUSED_FLAG = 0x100
+
+RecordedFrame = namedtuple('RecordedFrame', ['frame_idx', 'timestamp', 'detections', 'tracks', 'alerts', 'jpeg', 'reused'])
+
+
+def encode_alerts(alerts):
+    flags = 0
+    for name, bit in ALERT_FLAGS.items():
+        if alerts.get(name):
+            flags |= bit
+    return flags
+
+
+def decode_alerts(flags, count):
+    alerts = {name: bool(flags & bit) for name, bit in ALERT_FLAGS.items()}
+    alerts['count'] = count
+    return alerts
+
+
+def settings_path(path):
+    return os.path.splitext(path)[0] + '.settings.json'
+
+
+def _track_id_to_int(track_id):
+    try:
+        return int(track_id)
+    except (TypeError, ValueError):
+        # hash() of a str is salted per process; crc32 gives the same id on every run
+        return zlib.crc32(str(track_id).encode()) & 0x7FFFFFFF
+
+
+class Recorder:
+    """Appends per-frame pipeline state to a recording file. Safe to call from the video thread."""
+    def __init__(self, path, fps=30.0, save_frames=False, flush_every=30, settings=None):
+        self.path = path
+        self.fps = fps
+        self.save_frames = save_frames
+        self.flush_every = flush_every
+        self.frames_written = 0
+        self.lock = threading.Lock()
+        self.file = None
+        self.closed = False
+
+        # Pipeline settings go in a sidecar so a replay can use the same thresholds and zone
+        if settings is not None:
+            with open(settings_path(path), 'w') as f:
+                json.dump(settings, f, indent=2, default=list)
+
+    def _open(self, width, height):
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) >= FILE_HEADER.size
+        self.file = open(self.path, 'ab')
+        if exists:
+            with open(self.path, 'rb') as f:
+                magic, version, w, h, _ = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != MAGIC or (w, h) != (width, height):
+                self.file.close()
+                self.file = None
+                raise ValueError(f"Cannot append to {self.path}: not a recording of a {width}x{height} source")
+        else:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION, width, height, self.fps))
+
+    def write(self, frame_idx, timestamp, frame_shape, detections, tracks, alerts, jpeg=None, reused=False):
+        """
+        detections: DeepSort raw detections ([[x, y, w, h], conf, cls])
+        tracks: tracker tracks (only confirmed, updated tracks are stored)
+        jpeg: encoded frame bytes, stored only if save_frames is set
+        reused: detection was skipped on this frame and detections/tracks are the previous frame's
+        """
+        dets = np.zeros(len(detections), dtype=DETECTION_DTYPE)
+        for i, ([x, y, w, h], conf, _) in enumerate(detections):
+            dets[i] = ((x, y, x + w, y + h), conf)
+
+        rows = []
+        for track in tracks:
+            if not track.is_confirmed() or track.time_since_update > 1:
+                continue
+            rows.append((_track_id_to_int(track.track_id), tuple(track.to_ltrb())))
+        trks = np.array(rows, dtype=TRACK_DTYPE)
+
+        payload = bytes(jpeg) if (self.save_frames and jpeg is not None) else b''
+        header = RECORD_HEADER.pack(
+            RECORD_TAG, frame_idx, timestamp, len(dets), len(trks),
+            encode_alerts(alerts) | (REUSED_FLAG if reused else 0), alerts.get('count', 0), len(payload)
+        )
+
+        with self.lock:
+            if self.closed:
+                return
+            if self.file is None:
+                self._open(frame_shape[1], frame_shape[0])
+            self.file.write(header)
+            self.file.write(dets.tobytes())
+            self.file.write(trks.tobytes())
+            self.file.write(payload)
+            self.frames_written += 1
+            if self.frames_written % self.flush_every == 0:
+                self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+class Recording:
+    """Read-only, memory-mapped view of a recording. A truncated final record (e.g. after a crash) is ignored."""
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.version, self.width, self.height, self.fps = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a Hawkeye recording")
+
+        # Index record offsets by hopping over headers, without touching payloads
+        self.offsets = []
+        offset, size = FILE_HEADER.size, len(self._map)
+        while offset + RECORD_HEADER.size <= size:
+            tag, _, _, n_dets, n_tracks, _, _, frame_len = RECORD_HEADER.unpack_from(self._map, offset)
+            end = (offset + RECORD_HEADER.size + n_dets * DETECTION_DTYPE.itemsize
+                   + n_tracks * TRACK_DTYPE.itemsize + frame_len)
+            if tag != RECORD_TAG or end > size:
+                break
+            self.offsets.append(offset)
+            offset = end
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        offset = self.offsets[index]
+        _, frame_idx, timestamp, n_dets, n_tracks, flags, count, frame_len = RECORD_HEADER.unpack_from(self._map, offset)
+        offset += RECORD_HEADER.size
+        dets = np.frombuffer(self._map, dtype=DETECTION_DTYPE, count=n_dets, offset=offset)
+        offset += n_dets * DETECTION_DTYPE.itemsize
+        trks = np.frombuffer(self._map, dtype=TRACK_DTYPE, count=n_tracks, offset=offset)
+        offset += n_tracks * TRACK_DTYPE.itemsize
+        jpeg = memoryview(self._map)[offset:offset + frame_len] if frame_len else None
+        return RecordedFrame(frame_idx, timestamp, dets, trks, decode_alerts(flags, count), jpeg, bool(flags & REUSED_FLAG))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def has_frames(self):
+        return len(self) > 0 and self[0].jpeg is not None
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def to_raw_detections(dets):
+    """Recorded detections -> DeepSort raw detections ([[x, y, w, h], conf, cls])."""
+    return [[[x1, y1, x2 - x1, y2 - y1], conf, 0] for (x1, y1, x2, y2), conf in dets.tolist()]
+
+
+def replay(recording, tracker, settings, draw=False, use_frames=True, **face_kwargs):
+    """
+    Feeds recorded detections into tracker + process_frame_annotations, skipping capture and YOLO.
+    Yields (record, tracks, annotated_frame, alerts) per frame. face_kwargs are passed through to
+    process_frame_annotations (mtcnn, resnet, known_faces, device) and need recorded frames.
+
+    Without recorded frames a DeepSort tracker should be created with embedder=None; it then gets a
+    constant appearance embedding so association is driven by motion alone.
+    """
+    track_history = defaultdict(list)
+    loitering_saved = defaultdict(lambda: False)
+    saved_untrusted_session = set()
+    face_state = {}
+    blank = np.zeros((recording.height, recording.width, 3), dtype=np.uint8)
+    needs_embeds = getattr(tracker, 'embedder', True) is None
+    tracks = None
+
+    for record in recording:
+        frame = blank
+        if use_frames and record.jpeg is not None:
+            frame = cv2.imdecode(np.frombuffer(record.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+        detections = to_raw_detections(record.detections)
+        if record.reused and tracks is not None:
+            # Live skipped detection here and kept the previous tracks, so the tracker is not updated
+            pass
+        elif needs_embeds:
+            tracks = tracker.update_tracks(detections, embeds=[np.ones(1, dtype=np.float32)] * len(detections))
+        else:
+            tracks = tracker.update_tracks(detections, frame=frame)
+
+        annotated_frame, alerts, saved_untrusted_session = detection_ops.process_frame_annotations(
+            frame, tracks, record.timestamp, track_history, loitering_saved, settings,
+            saved_untrusted_session=saved_untrusted_session, draw=draw, face_state=face_state, **face_kwargs
+        )
+        yield record, tracks, annotated_frame, alerts
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or replay Hawkeye recordings")
+    parser.add_argument("command", choices=["info", "replay"])
+    parser.add_argument("path")
+    parser.add_argument("--tracker", choices=list(trackers.TRACKER_TYPES), default="deepsort")
+    parser.add_argument("--settings", help="JSON file with pipeline settings (defaults to the recording's sidecar)")
+    parser.add_argument("--compare", action="store_true", help="Report frames whose alerts differ from the recording")
+    parser.add_argument("--draw", action="store_true", help="Draw annotations (slower, for visual checks)")
+    args = parser.parse_args()
+
+    recording = Recording(args.path)
+    if args.command == "info":
+        duration = recording[len(recording) - 1].timestamp - recording[0].timestamp if len(recording) else 0
+        print(f"{args.path}: {len(recording)} frames, {recording.width}x{recording.height} @ {recording.fps:.1f} fps, "
+              f"{duration:.1f}s, frames stored: {recording.has_frames()}")
+        return
+
+    settings = {
+        'loitering_threshold': 10,
+        'crowd_threshold': 60,
+        'trespassing_zone': (200, 300, 300, 350),
+        'trespassing_enabled': True,
+        'loitering_enabled': True,
+        'crowd_enabled': True
+    }
+    sidecar = args.settings or settings_path(args.path)
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            settings.update(json.load(f))
+    settings['trespassing_zone'] = tuple(settings['trespassing_zone'])
+
+    if args.tracker == 'deepsort' and not recording.has_frames():
+        from deep_sort_realtime.deepsort_tracker import DeepSort
+        tracker = DeepSort(max_age=30, n_init=1, nms_max_overlap=1.0, embedder=None)
+    else:
+        tracker = trackers.create_tracker(args.tracker, confidence_threshold=settings.get('confidence_threshold'))
+
+    mismatches = 0
+    counts = defaultdict(int)
+    start = time.perf_counter()
+    for record, _, _, alerts in replay(recording, tracker, settings, draw=args.draw):
+        for name in ALERT_FLAGS:
+            counts[name] += int(bool(alerts[name]))
+            if args.compare and name != 'untrusted_face' and bool(alerts[name]) != record.alerts[name]:
+                mismatches += 1
+                print(f"[MISMATCH] frame {record.frame_idx} t={record.timestamp:.2f}s {name}: "
+                      f"recorded={record.alerts[name]} replayed={bool(alerts[name])}")
+    elapsed = time.perf_counter() - start
+
+    print(f"Replayed {len(recording)} frames in {elapsed:.2f}s ({len(recording) / max(elapsed, 1e-9):.0f} fps)")
+    print("Alert frames: " + ", ".join(f"{name}={count}" for name, count in counts.items()))
+    if args.compare:
+        print(f"{mismatches} alert mismatches against the recording")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import threading
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import capture_ops
+
+
+class FakeBackend:
+    """
+    Stands in for an RTSP stream (live=True) or a video file (live=False): serves `frames`
+    numbered frames at `fps`, then fails the grab like a dropped connection or end of file.
+    """
+    def __init__(self, frames=10, live=True, fps=100.0, fail_open=False):
+        self.frames = frames
+        self.live = live
+        self.fps = fps
+        self.fail_open = fail_open
+        self.source = "fake"
+        self.index = 0
+        self.opened = False
+        self.released = 0
+        self.release_threads = []
+
+    def open(self):
+        self.opened = not self.fail_open
+        return self.opened
+
+    def grab(self):
+        assert self.released == 0, "grab() on a released backend"
+        if self.index >= self.frames:
+            return None
+        if self.live:
+            time.sleep(1.0 / self.fps)
+        self.index += 1
+        return self.index / self.fps
+
+    def retrieve(self):
+        return np.full((4, 4, 3), self.index, dtype=np.uint8)
+
+    def release(self):
+        self.released += 1
+        self.release_threads.append(threading.current_thread())
+
+
+class Factory:
+    """backend_factory returning the given backends in order, then copies of the last one."""
+    def __init__(self, *backends):
+        self.backends = list(backends)
+        self.created = []
+
+    def __call__(self):
+        backend = self.backends.pop(0) if len(self.backends) > 1 else self.backends[0]
+        if backend in self.created:
+            backend = FakeBackend(backend.frames, backend.live, backend.fps, backend.fail_open)
+        self.created.append(backend)
+        return backend
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_file_end_delivers_every_frame_in_order():
+    capture = capture_ops.ThreadedCapture(Factory(FakeBackend(frames=20, live=False)), loop=False,
+                                          queue_size=2).start()
+    values, timestamps = [], []
+    while True:
+        frame, timestamp = capture.read(timeout=1.0)
+        if frame is None:
+            break
+        values.append(int(frame[0, 0, 0]))
+        timestamps.append(timestamp)
+    assert values == list(range(1, 21))
+    assert timestamps == sorted(timestamps)
+    assert capture.state == "ended"
+    assert capture.frames_dropped == 0
+    capture.stop()
+
+
+def test_missing_file_fails_without_retrying():
+    factory = Factory(FakeBackend(live=False, fail_open=True))
+    capture = capture_ops.ThreadedCapture(factory, loop=True, reconnect_initial=0.01).start()
+    assert wait_for(lambda: capture.state == "failed")
+    time.sleep(0.1)
+    assert len(factory.created) == 1
+    assert capture.read(timeout=0.1) == (None, None)
+    capture.stop()
+
+
+def test_live_source_reconnects_with_increasing_timestamps():
+    factory = Factory(FakeBackend(frames=5), FakeBackend(fail_open=True), FakeBackend(frames=1000))
+    capture = capture_ops.ThreadedCapture(factory, reconnect_initial=0.01).start()
+    assert wait_for(lambda: capture.reconnects == 1 and capture.state == "running" and len(factory.created) == 3)
+    timestamps = []
+    while len(timestamps) < 5:
+        frame, timestamp = capture.read(timeout=1.0)
+        if frame is not None:
+            timestamps.append(timestamp)
+    assert timestamps == sorted(timestamps)
+    # The dropped connection was released before reconnecting
+    assert factory.created[0].released == 1
+    capture.stop()
+
+
+def test_live_source_drops_oldest_frames():
+    capture = capture_ops.ThreadedCapture(Factory(FakeBackend(frames=1000, fps=200.0))).start()
+    assert wait_for(lambda: capture.frames_grabbed > 0)
+    time.sleep(0.2)
+    frame, _ = capture.read(timeout=1.0)
+    # The slow consumer gets the newest frame, the ones in between were dropped
+    assert int(frame[0, 0, 0]) > 1
+    # ...and is stamped with when it was grabbed, for end-to-end latency
+    assert 0 <= time.monotonic() - capture.grabbed_at < 0.1
+    assert capture.frames_dropped > 0
+    capture.stop()
+
+
+def test_stop_releases_backend_once_from_grab_thread():
+    backend = FakeBackend(frames=1000)
+    capture = capture_ops.ThreadedCapture(Factory(backend)).start()
+    assert wait_for(lambda: capture.frames_grabbed > 3)
+    capture.stop()
+    assert not capture.thread.is_alive()
+    assert backend.released == 1
+    assert backend.release_threads == [capture.thread]
+    assert capture.backend is None
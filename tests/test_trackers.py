@@ -0,0 +1,99 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import trackers
+
+
+def detection(x, y, conf=0.9, w=40, h=100):
+    return [[x, y, w, h], conf, 0]
+
+
+# --- iou_matrix / assign ---
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [100, 100, 110, 110]], dtype=float)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [50, 50, 60, 60]], dtype=float)
+    ious = trackers.iou_matrix(a, b)
+    assert ious.shape == (2, 3)
+    assert ious[0, 0] == pytest.approx(1.0)
+    assert ious[0, 1] == pytest.approx(50 / 150)
+    assert np.all(ious[1] == 0)
+    assert trackers.iou_matrix(a, np.zeros((0, 4))).shape == (2, 0)
+
+
+@pytest.mark.parametrize("solver", ["scipy", "greedy"])
+def test_assign(monkeypatch, solver):
+    if solver == "greedy":
+        monkeypatch.setattr(trackers, "linear_sum_assignment", None)
+    elif trackers.linear_sum_assignment is None:
+        pytest.skip("scipy is not installed")
+    cost = np.array([[0.1, 0.9, 0.9],
+                     [0.9, 0.2, 0.9],
+                     [0.9, 0.9, 0.95]])
+    matches, unmatched_rows, unmatched_cols = trackers.assign(cost, max_cost=0.5)
+    assert sorted(matches) == [(0, 0), (1, 1)]
+    assert unmatched_rows == [2]
+    assert unmatched_cols == [2]
+    assert trackers.assign(np.zeros((0, 2)), 0.5) == ([], [], [0, 1])
+
+
+# --- KalmanBoxFilter ---
+def test_kalman_predict_follows_velocity():
+    kf = trackers.KalmanBoxFilter()
+    means, covs = kf.initiate(np.array([[50.0, 50.0, 40.0, 100.0]]))
+    means[0, 4] = 5.0
+    predicted, predicted_covs = kf.predict(means, covs)
+    assert predicted[0, :4] == pytest.approx([55.0, 50.0, 40.0, 100.0])
+    # Uncertainty grows without a measurement
+    assert np.all(np.diag(predicted_covs[0]) > np.diag(covs[0]))
+
+
+def test_kalman_update_moves_towards_measurement():
+    kf = trackers.KalmanBoxFilter()
+    means, covs = kf.initiate(np.array([[50.0, 50.0, 40.0, 100.0], [200.0, 80.0, 30.0, 90.0]]))
+    measurements = np.array([[60.0, 50.0, 40.0, 100.0], [200.0, 80.0, 30.0, 90.0]])
+    updated, updated_covs = kf.update(means, covs, measurements)
+    assert 50.0 < updated[0, 0] < 60.0
+    assert updated[1, :4] == pytest.approx(measurements[1])
+    assert np.all(np.diag(updated_covs[0])[:4] < np.diag(covs[0])[:4])
+
+
+# --- IoUTracker ---
+def test_tracker_keeps_ids_of_moving_people():
+    tracker = trackers.create_tracker('iou', confidence_threshold=0.4)
+    ids = None
+    for step in range(20):
+        tracks = tracker.update_tracks([detection(10 + 3 * step, 20), detection(300 - 3 * step, 20)])
+        current = sorted(t.track_id for t in tracks if t.time_since_update == 0)
+        assert len(current) == 2
+        ids = ids or current
+        assert current == ids
+    assert tracker.tracks[0].to_ltrb()[0] == pytest.approx(10 + 3 * 19, abs=1.0)
+
+
+def test_low_confidence_detections_only_extend_tracks():
+    tracker = trackers.create_tracker('iou', confidence_threshold=0.4)
+    assert tracker.low_conf == trackers.IoUTracker.LOW_CONF
+    tracker.update_tracks([detection(10, 20)])
+    # A confirmed track is kept updated by a low confidence detection...
+    tracks = tracker.update_tracks([detection(12, 20, conf=0.2), detection(300, 20, conf=0.2)])
+    assert [t.time_since_update for t in tracks] == [0]
+    # ...which never starts a track of its own, and below low_conf is ignored
+    tracks = tracker.update_tracks([detection(14, 20, conf=0.05)])
+    assert [t.time_since_update for t in tracks] == [1]
+
+
+def test_lost_tracks_are_dropped_after_max_age():
+    tracker = trackers.IoUTracker(max_age=3, n_init=1)
+    tracker.update_tracks([detection(10, 20)])
+    for _ in range(3):
+        assert len(tracker.update_tracks([])) == 1
+    assert tracker.update_tracks([]) == []
+
+
+def test_detector_confidence():
+    assert trackers.detector_confidence('iou', 0.4) == trackers.IoUTracker.LOW_CONF
+    assert trackers.detector_confidence('iou', 0.05) == 0.05
+    assert trackers.detector_confidence('deepsort', 0.4) == 0.4
@@ -0,0 +1,256 @@
+"""
+Pluggable person trackers.
+
+Every tracker exposes the DeepSort surface the rest of the code relies on:
+update_tracks(raw_detections, frame=...) returning tracks with track_id, to_ltrb(),
+is_confirmed() and time_since_update, plus delete_all_tracks().
+
+'deepsort' is deep_sort_realtime with its CNN appearance embedder. 'iou' is a motion-only
+ByteTrack-style tracker (constant velocity Kalman filter + IoU matching) in vectorized NumPy,
+which is much cheaper and enough for fixed overhead cameras.
+"""
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+TRACKER_TYPES = ('deepsort', 'iou')
+
+
+def create_tracker(kind='deepsort', use_cuda=False, confidence_threshold=None):
+    """confidence_threshold: the configured detection threshold; with 'iou' detections above it can start tracks."""
+    if kind == 'iou':
+        tracker = IoUTracker(max_age=30, n_init=1)
+        if confidence_threshold is not None:
+            tracker.set_confidence(confidence_threshold)
+        return tracker
+    if kind != 'deepsort':
+        raise ValueError(f"Unknown tracker '{kind}', expected one of {TRACKER_TYPES}")
+    from deep_sort_realtime.deepsort_tracker import DeepSort
+    return DeepSort(max_age=30, n_init=1, nms_max_overlap=1.0, embedder_gpu=use_cuda)
+
+
+def detector_confidence(kind, confidence_threshold):
+    """
+    The threshold to run the detector at. 'iou' needs the detections below confidence_threshold
+    too: they only keep existing tracks alive (second association) and never start or count one.
+    """
+    if kind == 'iou':
+        return min(IoUTracker.LOW_CONF, confidence_threshold)
+    return confidence_threshold
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU between every box in (N, 4) and every box in (M, 4), ltrb format. Returns (N, M)."""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)))
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+
+def assign(cost, max_cost):
+    """Minimum cost matching. Returns (matches as (row, col) pairs, unmatched rows, unmatched cols)."""
+    rows, cols = cost.shape
+    if rows == 0 or cols == 0:
+        return [], list(range(rows)), list(range(cols))
+
+    if linear_sum_assignment is not None:
+        pairs = zip(*linear_sum_assignment(cost))
+    else:
+        # Greedy fallback: cheapest pairs first
+        pairs, used_r, used_c = [], set(), set()
+        for flat in np.argsort(cost, axis=None):
+            r, c = divmod(int(flat), cols)
+            if r not in used_r and c not in used_c:
+                pairs.append((r, c))
+                used_r.add(r)
+                used_c.add(c)
+
+    matches = [(r, c) for r, c in pairs if cost[r, c] <= max_cost]
+    matched_r = {r for r, _ in matches}
+    matched_c = {c for _, c in matches}
+    return (matches, [r for r in range(rows) if r not in matched_r],
+            [c for c in range(cols) if c not in matched_c])
+
+
+class KalmanBoxFilter:
+    """
+    Batched constant velocity Kalman filter over (cx, cy, w, h, vcx, vcy, vw, vh).
+    Noise is scaled by box height as in SORT/DeepSort.
+    """
+    STD_POSITION = 1.0 / 20
+    STD_VELOCITY = 1.0 / 160
+
+    def __init__(self):
+        self.F = np.eye(8)
+        self.F[:4, 4:] = np.eye(4)
+        self.H = np.eye(4, 8)
+
+    def _std(self, heights, weights):
+        return heights[:, None] * np.asarray(weights)[None, :]
+
+    def initiate(self, measurements):
+        n = len(measurements)
+        means = np.zeros((n, 8))
+        means[:, :4] = measurements
+        h = measurements[:, 3]
+        p, v = self.STD_POSITION, self.STD_VELOCITY
+        std = self._std(h, [2 * p, 2 * p, 2 * p, 2 * p, 10 * v, 10 * v, 10 * v, 10 * v])
+        covs = np.zeros((n, 8, 8))
+        idx = np.arange(8)
+        covs[:, idx, idx] = std ** 2
+        return means, covs
+
+    def predict(self, means, covs):
+        h = means[:, 3]
+        p, v = self.STD_POSITION, self.STD_VELOCITY
+        std = self._std(h, [p, p, p, p, v, v, v, v])
+        means = means @ self.F.T
+        covs = self.F @ covs @ self.F.T
+        idx = np.arange(8)
+        covs[:, idx, idx] += std ** 2
+        return means, covs
+
+    def update(self, means, covs, measurements):
+        h = means[:, 3]
+        std = self._std(h, [self.STD_POSITION] * 4)
+        S = self.H @ covs @ self.H.T
+        idx = np.arange(4)
+        S[:, idx, idx] += std ** 2
+        PHt = covs @ self.H.T
+        # K = P H^T S^-1, solved as S K^T = H P^T for every track at once
+        K = np.linalg.solve(S, np.transpose(PHt, (0, 2, 1))).transpose(0, 2, 1)
+        innovation = measurements - means @ self.H.T
+        means = means + np.einsum('nij,nj->ni', K, innovation)
+        covs = covs - K @ S @ np.transpose(K, (0, 2, 1))
+        return means, covs
+
+
+class IoUTrack:
+    def __init__(self, track_id, n_init, det_conf):
+        self.track_id = str(track_id)
+        self.hits = 1
+        self.age = 1
+        self.time_since_update = 0
+        self.det_conf = det_conf
+        self.n_init = n_init
+        self.ltrb = np.zeros(4)
+
+    def is_confirmed(self):
+        return self.hits >= self.n_init
+
+    def is_tentative(self):
+        return not self.is_confirmed()
+
+    def to_ltrb(self):
+        return self.ltrb
+
+
+class IoUTracker:
+    """
+    Motion-only, ByteTrack-style tracker. High confidence detections are matched to all tracks
+    by IoU, then leftover confirmed tracks get a second chance against low confidence detections.
+    """
+    LOW_CONF = 0.1
+
+    def __init__(self, max_age=30, n_init=1, iou_threshold=0.3, low_iou_threshold=0.5,
+                 high_conf=0.4, low_conf=LOW_CONF):
+        self.max_age = max_age
+        self.n_init = n_init
+        self.iou_threshold = iou_threshold
+        self.low_iou_threshold = low_iou_threshold
+        self.high_conf = high_conf
+        self.low_conf = low_conf
+        self.kf = KalmanBoxFilter()
+        self.delete_all_tracks()
+
+    def set_confidence(self, confidence_threshold):
+        """Detections above confidence_threshold start tracks, those down to LOW_CONF only extend them."""
+        self.high_conf = confidence_threshold
+        self.low_conf = min(self.LOW_CONF, confidence_threshold)
+
+    def delete_all_tracks(self):
+        self.tracks = []
+        self.means = np.zeros((0, 8))
+        self.covs = np.zeros((0, 8, 8))
+        self.next_id = 1
+
+    def _ltrb(self, means):
+        cx, cy, w, h = means[:, 0], means[:, 1], means[:, 2], means[:, 3]
+        return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    def update_tracks(self, raw_detections, frame=None, **kwargs):
+        """raw_detections: DeepSort format [[x, y, w, h], conf, cls]. frame is unused."""
+        if raw_detections:
+            xywh = np.array([d[0] for d in raw_detections], dtype=np.float64).reshape(-1, 4)
+            confs = np.array([d[1] for d in raw_detections], dtype=np.float64)
+        else:
+            xywh, confs = np.zeros((0, 4)), np.zeros(0)
+        det_ltrb = np.concatenate([xywh[:, :2], xywh[:, :2] + xywh[:, 2:]], axis=1)
+        det_cxcywh = np.concatenate([xywh[:, :2] + xywh[:, 2:] / 2, xywh[:, 2:]], axis=1)
+
+        # Predict
+        if self.tracks:
+            self.means, self.covs = self.kf.predict(self.means, self.covs)
+        for track in self.tracks:
+            track.age += 1
+            track.time_since_update += 1
+        track_ltrb = self._ltrb(self.means)
+
+        high = np.flatnonzero(confs >= self.high_conf)
+        low = np.flatnonzero((confs >= self.low_conf) & (confs < self.high_conf))
+
+        # First association: high confidence detections against every track
+        matches, unmatched_tracks, unmatched_high = assign(
+            1 - iou_matrix(track_ltrb, det_ltrb[high]), 1 - self.iou_threshold
+        )
+        matched = [(t, high[d]) for t, d in matches]
+
+        # Second association: remaining confirmed tracks against low confidence detections
+        remaining = [t for t in unmatched_tracks if self.tracks[t].is_confirmed()]
+        matches, _, _ = assign(
+            1 - iou_matrix(track_ltrb[remaining], det_ltrb[low]), 1 - self.low_iou_threshold
+        )
+        matched += [(remaining[t], low[d]) for t, d in matches]
+
+        # Kalman update for every matched track in one batch
+        if matched:
+            t_idx = np.array([t for t, _ in matched])
+            d_idx = np.array([d for _, d in matched])
+            self.means[t_idx], self.covs[t_idx] = self.kf.update(
+                self.means[t_idx], self.covs[t_idx], det_cxcywh[d_idx]
+            )
+            for t, d in matched:
+                track = self.tracks[t]
+                track.hits += 1
+                track.time_since_update = 0
+                track.det_conf = confs[d]
+
+        # Drop lost tracks (tentative ones as soon as they miss, like DeepSort)
+        keep = [i for i, track in enumerate(self.tracks)
+                if track.time_since_update == 0
+                or (track.is_confirmed() and track.time_since_update <= self.max_age)]
+        self.tracks = [self.tracks[i] for i in keep]
+        self.means, self.covs = self.means[keep], self.covs[keep]
+
+        # New tracks from unmatched high confidence detections
+        new = high[unmatched_high]
+        if len(new):
+            means, covs = self.kf.initiate(det_cxcywh[new])
+            self.means = np.concatenate([self.means, means])
+            self.covs = np.concatenate([self.covs, covs])
+            for d in new:
+                self.tracks.append(IoUTrack(self.next_id, self.n_init, confs[d]))
+                self.next_id += 1
+
+        for track, ltrb in zip(self.tracks, self._ltrb(self.means)):
+            track.ltrb = ltrb
+        return self.tracks